@@ -4,6 +4,7 @@ import click
 import logging
 from logging.handlers import RotatingFileHandler
 
+from desist.isct.utilities import backup_count
 from .container import container
 from .patient import patient
 from .trial import trial
@@ -18,7 +19,8 @@ from .time import time
               help="Increase verbosity: shows all `DEBUG` logs.")
 @click.option('--log',
               type=click.Path(writable=True),
-              help="Path where log files are written to.")
+              help="Path where log files are written to. Worker processes, "
+              "e.g. with `--jobs`, write to `LOG.<pid>`.")
 def cli(verbose, log):
     """des-ist.
 
@@ -44,7 +46,8 @@ def cli(verbose, log):
 
     # if a logfile is provided, write _all_ messages to the files
     if log:
-        rfh = RotatingFileHandler(log, maxBytes=100000, backupCount=5)
+        rfh = RotatingFileHandler(log, maxBytes=100000,
+                                  backupCount=backup_count)
         rfh.setLevel(logging.DEBUG)
         fmt_str = '%(asctime)s | %(name)s | %(levelname)s | %(message)s'
         rfh.setFormatter(logging.Formatter(fmt_str))
@@ -1,11 +1,11 @@
 """The subcommand for the command-line interface regarding patients."""
 import click
 import os
-import pathlib
 
-from .trial import assert_container_path
-from desist.isct.patient import Patient, LowStoragePatient, patient_config
-from desist.isct.trial import Trial, trial_config
+from .trial import assert_container_path, cache_options, new_cache
+from desist.isct.patient import Patient, LowStoragePatient
+from desist.isct.patient import find_patient_config
+from desist.isct.trial import Trial, find_trial_config
 from desist.isct.utilities import CleanFiles
 import desist.isct.runner as runners
 
@@ -33,28 +33,55 @@ def patient():
     any file except YAML files (either \'.yml\' or \'.yaml\' suffix),
     regardless of its size."""))
 @click.option('-c', '--container-path', type=click.Path(exists=True))
-def run(patients, dry, clean_files, container_path):
+@click.option('-m',
+              '--model',
+              type=click.IntRange(min=0),
+              multiple=True,
+              help="""Only evaluate the model at this simulation index. The
+              option can be repeated to evaluate multiple models in order. The
+              patient is marked as completed (and its files are cleaned) only
+              after the pipeline's last model.""")
+@click.option('--skip-completed',
+              is_flag=True,
+              default=False,
+              help="""Skip completed patients and resume the pipeline at the
+              first incomplete model.""")
+@cache_options
+def run(patients, dry, clean_files, container_path, model, skip_completed,
+        cache, cache_size, cache_link, incremental):
     """Run a patient's simulation pipeline.
 
     The complete simulation pipeline is evaluated for the patient located
     at the provided PATIENTS path. The simulation is evaluated regardless of
     the completed flag, i.e. the simulation is _always_ invoked when
-    specifically called with this command.
+    specifically called with this command. With `--model` only the selected
+    models of the pipeline are evaluated. With `--skip-completed` completed
+    patients are skipped, while the pipeline of incomplete patients resumes
+    at the first model that did not complete. With `--cache` the output of
+    the models is restored from the cache when evaluated before. With
+    `--incremental` the pipeline resumes at the first model whose inputs
+    changed since its last evaluation, skipping up to date patients. Combined
+    with `--model`, the selected models are evaluated regardless, while their
+    inputs are recorded for subsequent incremental evaluations.
     """
     clean_files = CleanFiles.from_string(clean_files)
+    result_cache = new_cache(cache, cache_size, cache_link, incremental)
 
     for p in patients:
         # read patient configuration
-        path = pathlib.Path(p).joinpath(patient_config)
+        path = find_patient_config(p)
 
         # define the patient type
         patient = Patient.read(path, runner=runners.new_runner(dry))
+        patient.runner.cache = result_cache
+        if skip_completed and patient.completed and not incremental:
+            continue
 
         if (clean_files != CleanFiles.NONE) and not dry:
             patient = LowStoragePatient.from_patient(patient, clean_files)
 
         # extract trial configuration
-        trial = Trial.read(patient.dir.parent.joinpath(trial_config))
+        trial = Trial.read(find_trial_config(patient.dir.parent))
 
         # overwrite the container path if manually provided
         if container_path:
@@ -66,8 +93,23 @@ def run(patients, dry, clean_files, container_path):
         # only set container path if present
         patient['container-path'] = trial.container_path
 
+        # skip the patients without outdated models, while selected models
+        # are evaluated regardless, e.g. when submitted per model after the
+        # trial invalidated its patients
+        if incremental and not model and patient.invalidate(result_cache) == \
+                patient['pipeline_length']:
+            continue
+
+        # ensure the selected models are present in the pipeline
+        if any(idx >= patient['pipeline_length'] for idx in model):
+            raise click.BadParameter(
+                f'Patient `{patient.dir}` has only '
+                f'{patient["pipeline_length"]} models.',
+                param_hint='--model')
+
         # run patient
-        patient.run()
+        patient.run(models=model or None,
+                    resume=skip_completed or incremental)
 
 
 @patient.command()
@@ -85,7 +127,7 @@ def reset(patients, remove):
     evaluations.
     """
     for p in patients:
-        path = pathlib.Path(p).joinpath(patient_config)
+        path = find_patient_config(p)
         patient = Patient.read(path)
         patient.reset()
 
@@ -1,6 +1,9 @@
 """The subcommand for to extract start and elapsed simulation times."""
 import click
+import pathlib
 
+from desist.isct.timing import format_timings, read_timings, timing_file
+from desist.isct.timing import timing_path
 from desist.isct.utilities import extract_simulation_times
 
 
@@ -10,8 +13,22 @@ from desist.isct.utilities import extract_simulation_times
 def time(logfile):
     """Extract the start and elapsed time for each model in the log file.
 
-    For each logfile the starting times are reported together with the elapsed
-    time between consecutive model invocations.
+    For patient directories and their `timings.jsonl` files, the timing
+    records of the container invocations are reported, i.e. the start time,
+    runtime, and exit code of each model. For other log files, the starting
+    times are reported together with the elapsed time between consecutive
+    model invocations. Compressed log files, i.e. `.gz` and `.zst`, are
+    decompressed while reading.
     """
     for log in logfile:
-        click.echo(extract_simulation_times(log))
+        path = pathlib.Path(log)
+        if path.is_dir() or path.name == timing_file:
+            if not timing_path(path).exists():
+                raise click.ClickException(f'No timing records in `{path}`.')
+            click.echo(format_timings(read_timings(path)))
+        else:
+            try:
+                for line in extract_simulation_times(log):
+                    click.echo(line)
+            except ImportError as err:
+                raise click.ClickException(str(err))
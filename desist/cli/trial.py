@@ -2,15 +2,27 @@
 
 import click
 import collections
+import itertools
+import json
 import logging
 import os
 import pathlib
 import shutil
 
 from desist.isct.config import Config
-from desist.isct.trial import Trial, QCGTrial, ParallelTrial, trial_config
+from desist.isct.trial import Trial, QCGTrial, ParallelTrial, PoolTrial
+from desist.isct.trial import ModelTrial
+from desist.isct.trial import find_trial_config, orders
+from desist.isct.cache import Fingerprinter, ResultCache
+from desist.isct.events import parse_memory
+from desist.isct.pool import ContainerPool
 from desist.isct.runner import new_runner
-from desist.isct.utilities import FileCleaner, CleanFiles
+from desist.isct.stats import format_csv, format_text, trial_stats
+from desist.isct.stats import trial_timings
+from desist.isct.trace import write_trace
+from desist.isct.timing import read_timings, resource_distributions
+from desist.isct.timing import resource_metrics, timing_path
+from desist.isct.utilities import FileCleaner, CleanFiles, config_formats
 
 
 @click.group()
@@ -44,6 +56,68 @@ def assert_container_path(trial):
         raise click.UsageError(click.style(msg, fg='red'))
 
 
+def new_cache(cache, cache_size, cache_link, incremental=False):
+    """Returns a `ResultCache` in the directory `cache`, if provided.
+
+    When no cache is provided for `incremental` evaluation, a `Fingerprinter`
+    is returned to record the inputs of the models. Raises `BadParameter` for
+    invalid sizes, e.g. other than `10GB`.
+    """
+    if cache is None:
+        return Fingerprinter() if incremental else None
+
+    try:
+        max_size = parse_memory(cache_size)
+    except ValueError as err:
+        raise click.BadParameter(str(err), param_hint='--cache-size')
+
+    return ResultCache(cache, max_size=max_size, link=cache_link)
+
+
+def cache_options(func):
+    """Decorates a command with the options of `new_cache`."""
+    options = [
+        click.option('--cache',
+                     type=click.Path(file_okay=False, resolve_path=True),
+                     help="""Cache the output of the models in this directory.
+                     Models evaluated with inputs that were evaluated before
+                     are restored from the cache instead."""),
+        click.option('--cache-size',
+                     help="""The maximum size of the cache, e.g. `50GB`. The
+                     least recently used outputs are evicted first."""),
+        click.option('--cache-link',
+                     is_flag=True,
+                     default=False,
+                     help="""Hard link the cached outputs instead of copying
+                     them. Only use this when the models never modify their
+                     input files in place."""),
+        click.option('--incremental',
+                     is_flag=True,
+                     default=False,
+                     help="""Only evaluate the models whose inputs changed
+                     since their last evaluation, and the models following
+                     them. The output of the other models is kept."""),
+    ]
+    for option in reversed(options):
+        func = option(func)
+    return func
+
+
+def assert_patients_succeeded(results):
+    """Raises `ClickException` when any of the patient simulations failed.
+
+    The `results` map the patient directories to the success of their
+    simulations, as returned by concurrent trial evaluations. All failed
+    patients are reported to the user.
+    """
+    failed = sorted(str(path) for path, success in results.items()
+                    if not success)
+    if failed:
+        msg = f'{len(failed)} of {len(results)} patients failed:\n'
+        msg += '\n'.join(failed)
+        raise click.ClickException(click.style(msg, fg='red'))
+
+
 @trial.command()
 @click.argument('trial',
                 type=click.Path(dir_okay=True,
@@ -70,7 +144,15 @@ def assert_container_path(trial):
         "Use Singularity-based container images. "
         "The Sigularity container images are obtained from the provided path.")
 )
-def create(trial, criteria, num_patients, dry, singularity):
+@click.option(
+    '-f',
+    '--config-format',
+    type=click.Choice(list(config_formats), case_sensitive=False),
+    help="""File format of the patient configurations. Defaults to `yaml`.
+    Machine-generated cohorts can use `json` or `msgpack` for faster reading
+    and writing of the patient configurations. The latter requires the
+    `msgpack` package.""")
+def create(trial, criteria, num_patients, dry, singularity, config_format):
     """Create trials and their virtual cohorts.
 
     This creates a new in silico trial on the filesystem located at TRIAL. This
@@ -111,6 +193,10 @@ def create(trial, criteria, num_patients, dry, singularity):
         container_path = pathlib.Path(singularity).absolute()
         config['container-path'] = str(container_path)
 
+    # store the format for the patient configurations in the trial
+    if config_format:
+        config['config-format'] = config_format.lower()
+
     trial = Trial(trial,
                   sample_size=num_patients,
                   runner=runner,
@@ -136,7 +222,7 @@ def append(trial, num, dry):
     user-provided virtual patient model. In case the underlying model does uses
     consistently set random seeds, this behaviour _could_ be achieved.
     """
-    path = pathlib.Path(trial).joinpath(trial_config)
+    path = find_trial_config(trial)
     trial = Trial.read(path, runner=new_runner(dry))
 
     # enforce container directory from configuration is valid
@@ -188,14 +274,69 @@ https://qcg-pilotjob.readthedocs.io/en/latest/index.html
 @click.option('--skip-completed',
               is_flag=True,
               default=False,
-              help="Skip previously completed patient simulations.")
+              help="""Skip previously completed patient simulations. The
+              incomplete patients resume at their first incomplete model.""")
+@click.option(
+    '--chunk-size',
+    type=click.IntRange(min=1),
+    help="""Number of patients submitted as a single iterative job when
+    running with `--qcg`, which defaults to 1000. With `--chunk-size 1` a job
+    is submitted for each patient.""")
 @click.option(
     '-c',
     '--container-path',
     type=click.Path(exists=True, resolve_path=True),
     help="Override the container path as defined in the trial configuration")
-def run(trial, dry, qcg, parallel, clean_files, skip_completed,
-        container_path):
+@click.option(
+    '--prefetch',
+    type=click.IntRange(min=0),
+    help="""Number of patient configurations to read ahead concurrently. This
+    hides file system latency on network file systems. Overrides the
+    `prefetch` key of the trial configuration.""")
+@click.option(
+    '--order',
+    type=click.Choice(orders),
+    help="""The order in which the patients are evaluated. With `longest-first`
+    the patients with the longest expected runtime, given the runtimes of
+    earlier evaluations, are started first. Overrides the `order` key of the
+    trial configuration.""")
+@click.option(
+    '--runtime-key',
+    'runtime_keys',
+    multiple=True,
+    help="""A patient parameter the expected runtime of the models is regressed
+    on for `--order longest-first`. The option can be repeated. Overrides the
+    `runtime_keys` key of the trial configuration.""")
+@click.option('-j',
+              '--jobs',
+              type=click.IntRange(min=1),
+              default=1,
+              help="""Number of patients to simulate concurrently. The patients
+              are distributed over a pool of worker processes, without the
+              need of external tools such as `GNU Parallel` or `QCG`.""")
+@click.option('--asyncio',
+              'asynchronous',
+              is_flag=True,
+              default=False,
+              help="""Evaluate the `--jobs` concurrent simulations through
+              `asyncio` in a single process, instead of in worker processes.
+              The simulation output is streamed to the logs.""")
+@click.option('--per-model',
+              is_flag=True,
+              default=False,
+              help="""Schedule the `--jobs` concurrent simulations per model
+              rather than per patient. The models of different patients are
+              interleaved, while the models of each patient are evaluated in
+              order.""")
+@click.option('--warm',
+              type=click.IntRange(min=1),
+              help="""Reuse long-lived container instances for up to `WARM`
+              evaluations, instead of starting a container for each model of
+              each patient. Instances are recycled when a model fails.""")
+@cache_options
+def run(trial, dry, qcg, parallel, clean_files, skip_completed, chunk_size,
+        container_path, prefetch, order, runtime_keys, jobs, asynchronous,
+        per_model, warm, cache, cache_size, cache_link, incremental):
     """Run all simulations for the patients in the in silico trial at TRIAL.
 
     The compute simulation pipeline is evaluated for each patient considered
@@ -204,14 +345,24 @@ def run(trial, dry, qcg, parallel, clean_files, skip_completed,
     progress bar in the terminal, indicating a rough estimate for the remaining
     simulation time till completion. For parallel evaluation this is disabled
     and the parallel evaluation of running the simulations is handled
-    explicitly through `GNU Parallel` or `QCG-PilotJob`.
+    explicitly through `GNU Parallel` or `QCG-PilotJob`. With `--jobs N` the
+    patients are evaluated concurrently by `N` worker processes, where the
+    progress bar is updated as patients complete. With `--asyncio` the `N`
+    concurrent simulations are managed by a single process instead. With
+    `--per-model` the `N` concurrent simulations are the individual models of
+    the patients, such that the models of different patients can overlap.
+    Combined with `--qcg`, a job is submitted for each model instead. With
+    `--warm` the containers are started once and reused across patients. With
+    `--cache` the output of the models is cached and restored when the models
+    are evaluated with the same inputs again. With `--incremental` only the
+    models whose inputs changed since their last evaluation are evaluated
+    again, together with the models following them. With `--order
+    longest-first` the patients with the longest expected runtime are
+    evaluated first.
 
     FIXME: link documentation to example files
 
     """
-    runner = new_runner(dry, parallel=parallel, qcg=qcg)
-    config = pathlib.Path(trial).joinpath(trial_config)
-
     if qcg and parallel:
         msg = """Ambiguous parallel flags: `--parallel` and `--gcq`.
 
@@ -219,10 +370,46 @@ Both commands run in parallel, the first using `GNU Parallel`. The second
 using `QCG-PilotJob`. Please specify only one."""
         raise click.UsageError(click.style(msg, fg='red'))
 
+    if (jobs > 1 or asynchronous) and (qcg or parallel):
+        msg = """Ambiguous parallel flags: `--jobs` or `--asyncio` combined
+with `--parallel` or `--qcg`.
+
+The number of concurrent jobs is managed by `GNU Parallel` or `QCG-PilotJob`
+when either is used. Please specify only one."""
+        raise click.UsageError(click.style(msg, fg='red'))
+
+    if per_model and parallel:
+        msg = """Ambiguous parallel flags: `--per-model` and `--parallel`.
+
+`GNU Parallel` cannot evaluate the models of a patient in order. Please use
+`--per-model` with `--jobs` or `--qcg` instead."""
+        raise click.UsageError(click.style(msg, fg='red'))
+
+    if warm and (qcg or parallel):
+        msg = """Ambiguous flags: `--warm` combined with `--parallel` or
+`--qcg`.
+
+The patients are evaluated by independent `desist` processes when using
+`GNU Parallel` or `QCG-PilotJob`, which cannot share container instances.
+Please use `--warm` with `--jobs` instead."""
+        raise click.UsageError(click.style(msg, fg='red'))
+
+    result_cache = new_cache(cache, cache_size, cache_link, incremental)
+    runner = new_runner(dry,
+                        parallel=parallel,
+                        qcg=qcg,
+                        jobs=jobs,
+                        asynchronous=asynchronous)
+    config = find_trial_config(trial)
+
     if qcg:
         cls = QCGTrial
     elif parallel:
         cls = ParallelTrial
+    elif per_model:
+        cls = ModelTrial
+    elif jobs > 1 or asynchronous:
+        cls = PoolTrial
     else:
         cls = Trial
 
@@ -254,9 +441,53 @@ using `QCG-PilotJob`. Please specify only one."""
     if container_path:
         trial.container_path = container_path
 
+    # the number of concurrent models when scheduling per model, or a
+    # dependent job per model when running through QCG
+    if per_model and qcg:
+        trial.per_model = True
+    elif per_model:
+        trial.jobs = jobs
+
+    # the number of patients submitted per QCG job
+    if qcg and chunk_size is not None:
+        trial.chunk_size = chunk_size
+
+    # overwrite the prefetch depth when provided as argument
+    if prefetch is not None:
+        trial.prefetch = prefetch
+
+    # overwrite the order of the patients when provided as argument
+    if order is not None:
+        trial.order = order
+    if runtime_keys:
+        trial.runtime_keys = runtime_keys
+
     # enforce container directory from configuration is valid
     assert_container_path(trial)
 
+    # share warm container instances across the patients, these are stopped
+    # once the command completes
+    if warm:
+        runner.pool = ContainerPool(trial.dir, uses=warm)
+        click.get_current_context().call_on_close(runner.pool.close)
+
+    # the cache is forwarded to `patient run` for parallel evaluation
+    runner.cache = result_cache
+
+    # the outdated models of all patients are marked incomplete, after which
+    # the patients resume at their first outdated model. Parallel workers
+    # invalidate their own patient instead, such that the inputs are only
+    # hashed once, except for QCG jobs per model: these are only submitted
+    # from the first outdated model on.
+    if incremental:
+        if isinstance(trial, ParallelTrial):
+            trial.incremental = True
+        if not isinstance(trial, ParallelTrial) or \
+                getattr(trial, 'per_model', False):
+            for patient in trial:
+                patient.invalidate(result_cache)
+            skip_completed = True
+
     # Return early: QCG will take over operation.
     if qcg:
         return trial.run(skip_completed=skip_completed)
@@ -266,7 +497,10 @@ using `QCG-PilotJob`. Please specify only one."""
     # that print statements written to the console interrupt the printing of
     # Click's progress bar.
     if parallel or logging.DEBUG >= logging.root.level:
-        return trial.run(skip_completed=skip_completed)
+        results = trial.run(skip_completed=skip_completed)
+        if issubclass(cls, PoolTrial):
+            assert_patients_succeeded(results)
+        return
 
     # Exhaust all patients in the trial's iterator within Click's progress bar.
     # This displays a basic progress bar in the terminal with ETA estimate and
@@ -274,13 +508,33 @@ using `QCG-PilotJob`. Please specify only one."""
     # `skip_completed` and their `patient.completed` status to improve the ETA
     # estimate by dropping all skippable patients (this results in a more
     # accurate length of the progress bar's iterator count).
+    patients = list(trial.pending(skip_completed=skip_completed))
+
+    if issubclass(cls, PoolTrial) or trial.batch_size > 1:
+        # The patients complete out of order, or in batches: the progress bar
+        # is advanced for each completed patient, showing the last completed
+        # patient.
+        results = {}
+        with click.progressbar(
+                length=len(patients),
+                show_eta=True,
+                item_show_func=lambda x: f'{x}' if x else None,
+        ) as bar:
+            for path, success in trial.run_patients(patients,
+                                                    resume=skip_completed):
+                results[path] = success
+                bar.current_item = path
+                bar.update(1)
+
+        return assert_patients_succeeded(results)
+
     with click.progressbar(
-        [p for p in trial if not (skip_completed and p.completed)],
+            patients,
             show_eta=True,
             item_show_func=lambda x: f'{x.dir}' if x else None,
     ) as bar:
         for patient in bar:
-            patient.run()
+            patient.run(resume=skip_completed)
 
 
 @trial.command()
@@ -303,7 +557,7 @@ def list_key(trial, key, n):
     in the list of unique elements.
     """
     # extract patients from trial
-    config = pathlib.Path(trial).joinpath(trial_config)
+    config = find_trial_config(trial)
     trial = Trial.read(config)
 
     # count occurrences of all values of `key` in patient configurations
@@ -326,6 +580,123 @@ def list_key(trial, key, n):
         click.echo(f"'{value}' ({count})")
 
 
+@trial.command()
+@click.argument('trial', type=click.Path(exists=True))
+def resources(trial):
+    """Reports the resources used by the models of the patients in TRIAL.
+
+    The resources are read from the timing records in each patient's
+    directory, i.e. `timings.jsonl`, which hold the runtime, CPU time, peak
+    memory, and storage I/O of each model evaluation. For each model, the
+    distribution of these resources across the successful evaluations is
+    reported as the mean, median, 95th percentile, and maximum.
+    """
+    trial = Trial.read(find_trial_config(trial))
+    paths = (path for path in trial.patients if timing_path(path).exists())
+    report = resource_distributions(
+        itertools.chain.from_iterable(map(read_timings, paths)))
+
+    if not report:
+        raise click.ClickException(f'No timing records in `{trial.dir}`.')
+
+    columns = ['count', 'mean', 'median', 'p95', 'max']
+    header = ''.join(f'{column.capitalize():>12}' for column in columns)
+    click.echo(f'{"Model":<32}{"Resource":<14}{header}')
+    for label, metrics in sorted(report.items(), key=lambda x: str(x[0])):
+        for metric, (name, _) in resource_metrics.items():
+            if metric not in metrics:
+                continue
+            stats = metrics[metric]
+            values = [f'{stats["count"]:>12}']
+            values += [f'{stats[column]:>12.1f}' for column in columns[1:]]
+            click.echo(f'{str(label):<32}{name:<14}' + ''.join(values))
+
+
+@trial.command()
+@click.argument('trial', type=click.Path(exists=True))
+@click.option('-f',
+              '--format',
+              'output_format',
+              type=click.Choice(['text', 'csv', 'json']),
+              default='text',
+              show_default=True,
+              help="""The output format. The CSV output holds the statistics
+              of the models only.""")
+@click.option('-j',
+              '--jobs',
+              type=click.IntRange(min=1),
+              default=os.cpu_count() or 1,
+              help="""Number of worker processes parsing the patients.""")
+@click.option('-n',
+              '--top',
+              type=click.IntRange(min=0),
+              default=10,
+              show_default=True,
+              help="""Number of slowest patients to report.""")
+def stats(trial, output_format, jobs, top):
+    """Reports the runtime statistics of the models of the patients in TRIAL.
+
+    The runtime of each model evaluation is read from the patient's timing
+    records, i.e. `timings.jsonl`, or reconstructed from the patient's log
+    files, i.e. `isct.log` and its rotated backups, for patients without
+    timing records. For each model, the mean, median, 95th percentile, and
+    maximum runtime of its successful evaluations are reported, together with
+    its number of failures and the core-hours spent. The totals of the trial
+    and the `--top` slowest patients follow.
+    """
+    trial = Trial.read(find_trial_config(trial))
+    report = trial_stats(trial_timings(list(trial.patients), jobs), top=top)
+
+    if not report['models']:
+        raise click.ClickException(f'No timing records in `{trial.dir}`.')
+
+    if output_format == 'json':
+        click.echo(json.dumps(report, indent=2))
+    elif output_format == 'csv':
+        click.echo(format_csv(report), nl=False)
+    else:
+        click.echo(format_text(report))
+
+
+@trial.command()
+@click.argument('trial', type=click.Path(exists=True))
+@click.option('-o',
+              '--output',
+              type=click.File('w'),
+              default='trace.json',
+              show_default=True,
+              help="""The file the trace is written to, or `-` to write to
+              `stdout`.""")
+@click.option('-j',
+              '--jobs',
+              type=click.IntRange(min=1),
+              default=os.cpu_count() or 1,
+              help="""Number of worker processes parsing the patients.""")
+def trace(trial, output, jobs):
+    """Writes a timeline of the model evaluations of the patients in TRIAL.
+
+    The timeline is written in the trace event format, which is shown by
+    Perfetto (https://ui.perfetto.dev) or `chrome://tracing`. Each worker
+    evaluating the models is shown as a track, holding a slice for each
+    model evaluation, together with the number of running and queued
+    evaluations over time. The evaluations are read from the patients' timing
+    records, i.e. `timings.jsonl`, or their log files otherwise.
+
+    For trials evaluated by `GNU Parallel` or `QCG`, the tracks are the
+    scheduler's job slots, i.e. `PARALLEL_JOBSLOT` or `QCG_PM_CPU_SET`. When
+    these are not recorded, the tracks are inferred from the timings of the
+    `desist patient run` processes, and do not necessarily match the
+    scheduler's workers.
+    """
+    trial = Trial.read(find_trial_config(trial))
+    records = list(trial_timings(list(trial.patients), jobs))
+
+    if not records:
+        raise click.ClickException(f'No timing records in `{trial.dir}`.')
+
+    write_trace(output, records)
+
+
 @trial.command()
 @click.argument('trial', type=click.Path(exists=True))
 @click.option('-c',
@@ -355,7 +726,7 @@ def outcome(trial, compare, dry):
     """
     # extract the runner and configuration
     runner = new_runner(dry)
-    config = pathlib.Path(trial).joinpath(trial_config)
+    config = find_trial_config(trial)
 
     # read the trial's configuration
     trial = Trial.read(config, runner=runner)
@@ -381,7 +752,7 @@ def archive(trial, archive, add):
             click.style(f'Archive `{archive}` already exists', fg="red"))
 
     # ensure the trial can be read
-    config = pathlib.Path(trial).joinpath(trial_config)
+    config = find_trial_config(trial)
     trial = Trial.read(config)
 
     # prepare the archive
@@ -402,7 +773,7 @@ def archive(trial, archive, add):
             pass
 
     # the files to be extracted from each patient directory: `trial/patient_*/`
-    outfiles = ['patient.yml', 'patient_outcome.yml']
+    outfiles = ['patient_outcome.yml']
     if add:
         outfiles.extend(add)
 
@@ -412,7 +783,7 @@ def archive(trial, archive, add):
         folder.mkdir()
 
         # transfer the configuration and outcome YAML files
-        for filename in outfiles:
+        for filename in [patient.path.name, *outfiles]:
             src = patient.dir.joinpath(filename)
             dst = folder.joinpath(filename)
 
@@ -447,7 +818,7 @@ def reset(trial, remove):
     # deletes $trial/patient_*/Clots.txt
     """
     # ensure the trial can be read
-    config = pathlib.Path(trial).joinpath(trial_config)
+    config = find_trial_config(trial)
     trial = Trial.read(config)
 
     for patient in trial:
@@ -475,7 +846,7 @@ def clean(trial, clean_files):
     regardless of the required disk space.
     """
     # ensure the trial can be read
-    config = pathlib.Path(trial).joinpath(trial_config)
+    config = find_trial_config(trial)
     trial = Trial.read(config)
     file_cleaner = FileCleaner(CleanFiles.from_string(clean_files))
 
@@ -31,6 +31,9 @@ class API(abc.ABC):
     def __init__(self, patient, model_id):
         self.patient = Patient.read(patient)
         self.model_id = model_id
+
+        # the events are only parsed once from the patient configuration
+        self._events = self.patient.events
         self.event_id = self.events.event_id(self.current_event)
 
         # ensure output directory is present on the system
@@ -40,7 +43,7 @@ class API(abc.ABC):
     @property
     def events(self):
         """Returns all events of the simulation as ``Events`` instance."""
-        return self.patient.events
+        return self._events
 
     # TODO: consider adding a `labels` property as well
 
@@ -3,31 +3,80 @@
 This provides a basic ``click``-based command-line utility that uses a
 concrete API of the abstract ``desist.eventhander.api.API`` implementation.
 The utility attaches the ``event``, ``example``, and ``test`` commands.
+
+The utility evaluates a single patient by default. Additional patients can
+be provided through ``--patient``, in which case the command is evaluated for
+all patients in order within a single process. This avoids the overhead of
+starting a container for each patient for models that are evaluated in
+batches, see :meth:`~isct.events.Events.batch`. The exit code of each patient
+of a batch is written to its directory, see
+:data:`~isct.utilities.status_file`.
 """
 import click
+import logging
+import pathlib
+
+from desist.isct.utilities import status_file
 
 from .api import API
 
 
+def write_status(patient, exit_code: int):
+    """Writes the ``exit_code`` to the directory of ``patient``."""
+    path = pathlib.Path(patient).parent.joinpath(status_file)
+    path.write_text(f'{exit_code}\n')
+
+
+def dispatch(ctx, method):
+    """Invokes ``method`` of the API of each patient in the context.
+
+    A single patient is evaluated through the API instance in ``ctx.obj``.
+    The patients of a batch, in ``ctx.meta['patients']``, are evaluated in
+    order, where a failure of a patient does not prevent the evaluation of
+    the remaining patients. The command fails after all patients are
+    evaluated when any of the patients failed. The exit code of each patient
+    of a batch is written to its directory, such that the failures are
+    attributed to the patients that actually failed.
+    """
+    patients = ctx.meta['patients']
+    if len(patients) == 1:
+        return getattr(ctx.obj, method)()
+
+    failed = []
+    for patient, api in patients:
+        try:
+            getattr(api(), method)()
+        except Exception as err:
+            logging.critical(f'Patient `{patient}` failed: {err}')
+            failed.append(patient)
+            write_status(patient, 1)
+        else:
+            write_status(patient, 0)
+
+    if failed:
+        raise click.ClickException(
+            f'Failed patients: {", ".join(map(str, failed))}')
+
+
 @click.command()
 @click.pass_context
 def event(ctx):
     """Invokes the ``API.event`` call to dispatch the event evaluation."""
-    ctx.obj.event()
+    dispatch(ctx, 'event')
 
 
 @click.command()
 @click.pass_context
 def example(ctx):
     """Invokes the ``API.example`` call to dispatch the example evaluation."""
-    ctx.obj.example()
+    dispatch(ctx, 'example')
 
 
 @click.command()
 @click.pass_context
 def test(ctx):
     """Invokes the ``API.test`` call to dispatch the test evaluation."""
-    ctx.obj.test()
+    dispatch(ctx, 'test')
 
 
 def event_handler(api_class=API, **kwargs):
@@ -44,14 +93,38 @@ def event_handler(api_class=API, **kwargs):
     and ``$cmd`` either ``event``, ``example``, or ``test``.
 
     >>> python3 API.py /patient/patient.yml $id $cmd
+
+    Multiple patients are evaluated by passing the additional patients using
+    ``--patient`` ahead of the positional arguments, where the API instances
+    are initialised one at a time. The additional patients are evaluated after
+    the first patient.
+
+    >>> python3 API.py -p /trial/b/patient.yml /trial/a/patient.yml $id $cmd
+
+    For a single patient, the API instance is available to the commands as
+    ``ctx.obj``. The patients of a batch are available as ``(path, api)``
+    pairs in ``ctx.meta['patients']``, where ``api()`` initialises the API
+    of the patient.
     """
 
     @click.group()
     @click.argument('patient', type=click.Path(exists=True))
     @click.argument('event', type=int)
+    @click.option('-p',
+                  '--patient',
+                  'patients',
+                  type=click.Path(exists=True),
+                  multiple=True,
+                  help='Additional patients to evaluate in order.')
     @click.pass_context
-    def cli(ctx, patient, event):
-        ctx.obj = api_class(patient, event, **kwargs)
+    def cli(ctx, patient, event, patients):
+        def api(path):
+            return lambda: api_class(path, event, **kwargs)
+
+        if not patients:
+            ctx.obj = api_class(patient, event, **kwargs)
+        ctx.meta['patients'] = [(path, api(path))
+                                for path in (patient, *patients)]
 
     # attach the default commands
     for command in [event, example, test]:
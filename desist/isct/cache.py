@@ -0,0 +1,381 @@
+"""A content-addressed cache of the output of model evaluations.
+
+Sweeps and repeated evaluations of a trial often evaluate a model with the
+exact same inputs as before. The :class:`ResultCache` stores the files written
+by each model evaluation under a key derived from all inputs of the model:
+
+- the patient's configuration, except for its bookkeeping keys, see
+  :data:`ignored_keys`;
+- the model's entry in the patient's events, its event, and its simulation
+  index;
+- the digest of the container's image, see
+  :meth:`~isct.container.Container.digest`;
+- the contents of the files in the patient's directory before the model is
+  evaluated, i.e. the output of the preceding models. The files written by
+  the model itself, or by its subsequent models, in earlier evaluations are
+  not considered, see :meth:`~isct.patient.Patient.model_outputs`.
+
+When a model is evaluated with inputs that were evaluated before, the cached
+output is restored into the patient's directory instead of evaluating the
+container. The cache is bounded in size, where the least recently used
+entries are evicted first.
+
+>>> desist trial run /path/to/trial --cache /path/to/cache --cache-size 50GB
+
+The same key is recorded in the status of each model by the
+:class:`Fingerprinter`, such that incremental evaluations only evaluate the
+models whose inputs changed since their last evaluation, and the models
+downstream of them, see :meth:`~isct.patient.Patient.invalidate`.
+"""
+import hashlib
+import json
+import logging
+import os
+import pathlib
+import shutil
+import tempfile
+import time
+
+from .patient import patient_configs
+from .timing import timing_file
+from .utilities import log_file
+
+ignored_keys = ('id', 'prefix', 'completed', 'model_status',
+                'pipeline_length', 'container-path', 'events', 'labels')
+"""tuple: Patient configuration keys that do not influence the models."""
+
+ignored_files = (timing_file, *patient_configs)
+"""tuple: Files in the patient's directory that are not model inputs."""
+
+manifest = 'manifest.json'
+chunk_size = 2**20
+
+
+def is_ignored(relative):
+    """Returns true if the file at ``relative`` is not a model input.
+
+    Besides the :data:`ignored_files`, the patient's log and its rotated
+    backups, e.g. ``isct.log.1``, are ignored, as these change whenever the
+    log rotates.
+    """
+    return relative in ignored_files or relative == log_file or \
+        relative.startswith(f'{log_file}.')
+
+
+def file_digest(path):
+    """Returns the hexadecimal ``blake2b`` digest of the file at ``path``."""
+    digest = hashlib.blake2b(digest_size=20)
+    with open(path, 'rb') as infile:
+        while chunk := infile.read(chunk_size):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def snapshot(directory, digests=None):
+    """Returns the files in ``directory`` with their stat and digest.
+
+    The files are mapped from their path relative to ``directory`` to a tuple
+    of their size, modification time, and content digest, skipping the files
+    that are not model inputs, see :func:`is_ignored`. The digests of files
+    with unchanged size and modification time are reused from the snapshot
+    ``digests``, if given.
+    """
+    directory = pathlib.Path(directory)
+    digests = digests or {}
+    files = {}
+
+    for root, _, filenames in os.walk(directory):
+        for filename in filenames:
+            path = pathlib.Path(root, filename)
+            relative = str(path.relative_to(directory))
+            if is_ignored(relative):
+                continue
+
+            stat = path.stat()
+            size, mtime = stat.st_size, stat.st_mtime_ns
+            previous = digests.get(relative)
+            if previous is not None and previous[:2] == (size, mtime):
+                files[relative] = previous
+            else:
+                files[relative] = (size, mtime, file_digest(path))
+
+    return files
+
+
+def fingerprint(patient, idx: int, digest, files):
+    """Returns the key identifying the inputs of the ``idx``th model.
+
+    Args:
+        patient: The patient evaluating the model.
+        idx: The simulation index of the model.
+        digest: The digest of the model's container image.
+        files: The snapshot of the patient's directory, see :func:`snapshot`.
+    """
+    events = patient.events
+    inputs = {
+        'config': {k: v for k, v in patient.items() if k not in ignored_keys},
+        'event': (events.event(idx) or {}).get('event'),
+        'model': events.model(idx),
+        'index': idx,
+        'digest': digest,
+        'files': sorted((path, d) for (path, (_, _, d)) in files.items()),
+    }
+    serialised = json.dumps(inputs, sort_keys=True, default=str)
+    return hashlib.blake2b(serialised.encode(), digest_size=20).hexdigest()
+
+
+class Fingerprinter:
+    """Records the inputs and outputs of model evaluations.
+
+    The key of the model's inputs, see :func:`fingerprint`, and the files
+    written by the model are persisted in the status of the model, see
+    :meth:`~isct.patient.Patient.record_model`. These are compared against
+    the current inputs of the models to find the models that are outdated,
+    see :meth:`~isct.patient.Patient.first_outdated_model`. Models that are
+    evaluated in batches, see :meth:`~isct.events.Events.batch`, do not
+    record their inputs and are always considered outdated.
+
+    >>> desist trial run /path/to/trial --incremental
+    """
+    def __init__(self):
+        """Initialise without any known container digests or snapshots."""
+        self.digests = {}
+
+        # The snapshot of each patient's directory after its latest model,
+        # such that the next model only hashes the files that changed.
+        self.snapshots = {}
+
+    def digest(self, container):
+        """Returns the (memoised) digest of the ``container``'s image."""
+        key = (type(container).__name__, container.image)
+        if key not in self.digests:
+            self.digests[key] = container.digest()
+        return self.digests[key]
+
+    def inputs(self, patient, idx: int, container, digests=None):
+        """Returns the key of the ``idx``th model's inputs and the snapshot.
+
+        The files written by earlier evaluations of this and subsequent models
+        are not considered as inputs. The key is ``None`` when the container's
+        digest is unknown. The snapshot reuses the file digests of the
+        snapshot ``digests``, see :func:`snapshot`, or otherwise of the
+        snapshot taken after the patient's preceding model, see :meth:`run`.
+        """
+        previous = self.snapshots.pop(patient.dir, None)
+        if (digest := self.digest(container)) is None:
+            return None, None
+
+        digests = previous if digests is None else digests
+
+        stale = patient.model_outputs(range(idx, patient['pipeline_length']))
+        before = snapshot(patient.dir, digests=digests)
+        inputs = {k: v for k, v in before.items() if k not in stale}
+        return fingerprint(patient, idx, digest, inputs), before
+
+    def run(self, patient, idx: int, container, args=''):
+        """Evaluate ``container`` for the ``idx``th model.
+
+        The inputs are not recorded when the container's digest is unknown or
+        when the runner does not evaluate commands, e.g. on dry runs.
+
+        Returns the success of the evaluation, the files written by the
+        model, and the key of its inputs, where the latter two are ``None``
+        when not known. The files written by failed evaluations are returned
+        as well, such that partial output is not mistaken for inputs of the
+        preceding models, while the key of failed evaluations is ``None``.
+        """
+        if not patient.runner.write_config:
+            return container.run(args=args), None, None
+
+        key, before = self.inputs(patient, idx, container)
+        if key is None:
+            logging.warning(f'No digest for `{container.image}`.')
+            return container.run(args=args), None, None
+
+        if (files := self.restore(key, patient.dir)) is not None:
+            logging.info(f'Restored model {idx} of `{patient.dir}`: {key}')
+            return True, files, key
+
+        success = container.run(args=args)
+        after = snapshot(patient.dir, digests=before)
+        files = [path for path, stat in after.items()
+                 if before.get(path) != stat]
+        if idx + 1 < patient['pipeline_length']:
+            self.snapshots[patient.dir] = after
+        if success is False:
+            return success, files, None
+
+        self.store(key, patient.dir, files)
+        return success, files, key
+
+    def restore(self, key, directory):
+        """Returns ``None``, as no outputs are stored."""
+        return None
+
+    def store(self, key, directory, files):
+        """Discards the ``files``, as no outputs are stored."""
+        pass
+
+
+class ResultCache(Fingerprinter):
+    """A size-bounded cache of the output of model evaluations.
+
+    Each entry is a directory in ``root`` named after the key of the model's
+    inputs, see :func:`fingerprint`, holding the files written by the model
+    and a manifest. Entries are written to a temporary directory first and
+    renamed into place, such that concurrent workers can share a cache.
+
+    The outputs are restored by copying the cached files. With ``link``, the
+    files are hard linked instead, which is only safe when models never
+    modify files in place that were written by preceding models.
+
+    When a model is evaluated with inputs that are cached, see
+    :meth:`Fingerprinter.run`, the cached output is restored instead of
+    evaluating the container.
+    """
+    def __init__(self, root, max_size=None, link=False):
+        """Initialise a cache in the directory ``root``.
+
+        Args:
+            root: The directory storing the cache's entries.
+            max_size: The maximum size of the cache in megabytes, unbounded
+                when not provided.
+            link: Hard link the restored files instead of copying them.
+        """
+        super().__init__()
+        self.root = pathlib.Path(root).absolute()
+        self.max_size = max_size
+        self.link = link
+
+        # The running total of the cache's size in bytes, which is only known
+        # after the entries are scanned for the first time.
+        self.size = None
+
+    def entry(self, key):
+        """Returns the directory of the entry identified by ``key``."""
+        return self.root.joinpath(key[:2], key)
+
+    def restore(self, key, directory):
+        """Restores the files of entry ``key`` into ``directory``.
+
+        Returns the restored files, or ``None`` when the entry is not present
+        in the cache.
+        """
+        entry = self.entry(key)
+        try:
+            with open(entry.joinpath(manifest)) as infile:
+                files = json.load(infile)['files']
+        except (FileNotFoundError, ValueError, KeyError):
+            return None
+
+        directory = pathlib.Path(directory)
+        try:
+            for path in files:
+                self.restore_file(entry.joinpath('files', path),
+                                  directory.joinpath(path))
+        except OSError:
+            # the entry is evicted concurrently
+            return None
+
+        # mark the entry as recently used
+        try:
+            os.utime(entry.joinpath(manifest))
+        except OSError:
+            # the entry is evicted concurrently, after its files are restored
+            pass
+        return files
+
+    def restore_file(self, source, target):
+        """Restores the cached file ``source`` at ``target``."""
+        os.makedirs(target.parent, exist_ok=True)
+        if target.exists():
+            target.unlink()
+
+        if self.link:
+            try:
+                return os.link(source, target)
+            except OSError:
+                # e.g. the cache is on another file system
+                pass
+
+        shutil.copy2(source, target)
+
+    def store(self, key, directory, files):
+        """Stores the ``files`` in ``directory`` as entry ``key``.
+
+        The least recently used entries are evicted afterwards when the cache
+        outgrows its size, see :meth:`ResultCache.reserve`.
+        """
+        entry = self.entry(key)
+        if entry.exists():
+            return
+
+        os.makedirs(entry.parent, exist_ok=True)
+        staging = pathlib.Path(tempfile.mkdtemp(dir=entry.parent))
+        size = 0
+        for path in files:
+            target = staging.joinpath('files', path)
+            os.makedirs(target.parent, exist_ok=True)
+            shutil.copy2(pathlib.Path(directory, path), target)
+            size += target.stat().st_size
+
+        with open(staging.joinpath(manifest), 'w') as outfile:
+            json.dump({'files': files, 'size': size, 'time': time.time()},
+                      outfile)
+
+        try:
+            os.rename(staging, entry)
+        except OSError:
+            # another process stored the same entry concurrently
+            shutil.rmtree(staging, ignore_errors=True)
+            return
+
+        self.reserve(size)
+
+    def reserve(self, size):
+        """Accounts for a stored entry of ``size`` bytes.
+
+        The entries are only scanned for the first entry stored, after which
+        the stored sizes are added to a running total. The least recently
+        used entries are evicted once the total exceeds ``max_size``, which
+        rescans the entries to include those stored by other processes.
+        """
+        if self.max_size is None:
+            return
+
+        if self.size is None:
+            self.size = sum(size for (_, size, _) in self.entries())
+        else:
+            self.size += size
+
+        if self.size > self.max_size * 2**20:
+            self.evict()
+
+    def entries(self):
+        """Returns the entries as ``(last used, size, directory)`` tuples."""
+        entries = []
+        for path in self.root.glob(f'*/*/{manifest}'):
+            try:
+                with open(path) as infile:
+                    size = json.load(infile)['size']
+                entries.append((path.stat().st_mtime, size, path.parent))
+            except (FileNotFoundError, ValueError, KeyError):
+                continue
+        return entries
+
+    def evict(self):
+        """Evicts the least recently used entries exceeding ``max_size``."""
+        if self.max_size is None:
+            return
+
+        entries = sorted(self.entries())
+        total = sum(size for (_, size, _) in entries)
+        limit = self.max_size * 2**20
+
+        for (_, size, path) in entries:
+            if total <= limit:
+                break
+            shutil.rmtree(path, ignore_errors=True)
+            total -= size
+
+        self.size = total
@@ -6,6 +6,11 @@ configuration inherits from :class:`dict` to provide dictionary-like behaviour
 and provides the :meth:`~isct.config.Config.read` and
 :func:`~isct.config.Config.write` functionalities to simplify reading and
 writing of the configuration files.
+
+The file format follows from the suffix of the configuration's path: YAML
+(``.yml``) is the default, while JSON (``.json``) and MessagePack
+(``.msgpack``) are supported for configurations that are generated rather than
+edited by hand, see :data:`~isct.utilities.config_formats`.
 """
 
 import collections
@@ -18,7 +23,7 @@ class Config(dict):
     """Configuration class.
 
     This class extends a :obj:`dict` with functions to read/write the
-    underlying dictionary to the YAML format.
+    underlying dictionary to the YAML, JSON, or MessagePack format.
     """
 
     def __init__(self, path, config):
@@ -54,17 +59,18 @@ class Config(dict):
 
     @classmethod
     def read(cls, path):
-        """Initialises :class:`Config` from the provided YAML file.
+        """Initialises :class:`Config` from the provided configuration file.
 
-        Attempts to parse the YAML file from ``path`` to a dictionary and on
+        Attempts to parse the file from ``path`` to a dictionary and on
         success returns an initialised :class:`Config`. If parsing the
-        YAML file did not succeed, the routine exits.
+        file did not succeed, the routine exits. The format is detected from
+        the file's suffix, see :func:`~isct.utilities.read_config`.
 
         Args:
-            path (str): Path to YAML file.
+            path (str): Path to the configuration file.
         """
         path = pathlib.Path(path)
-        config = utilities.read_yaml(path)
+        config = utilities.read_config(path)
 
         assert isinstance(config, collections.abc.Mapping), """To represent a
         configuration file the contents read from the YAML file `{path}` should
@@ -74,11 +80,12 @@ class Config(dict):
         return cls(path.parent, config=config)
 
     def write(self):
-        """Writes the configuation to disk as YAML.
+        """Writes the configuation to disk.
 
         The :class:`Config` is written as dictionary to disk. The file is
-        written in the YAML format.
+        written in the format matching the suffix of :attr:`Config.path`,
+        which defaults to the YAML format.
 
         The directory :attr:`Config.dir` is created when not yet present.
         """
-        utilities.write_yaml(self.path, dict(self))
+        utilities.write_config(self.path, dict(self))
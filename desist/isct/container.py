@@ -36,6 +36,10 @@ class Container(abc.ABC):
 
         self.runner = runner
 
+        # the invocation of the model evaluated by `run`, if any, forwarded to
+        # the runner to record its timing, see `isct.timing.Invocation`
+        self.invocation = None
+
     def bind(self, host, local):
         """Add a `(host, local)` path pair to the bind volumes.
 
@@ -61,10 +65,49 @@ class Container(abc.ABC):
         pairs = [f'{host}:{local}' for (host, local) in self.bind_volumes]
         return ' '.join(map(lambda s: f'{self.bind_flag} {s}', pairs))
 
+    @property
+    def image(self):
+        """Identifies the container's image."""
+        return self.tag
+
+    def warm_pool(self):
+        """Returns the runner's pool of warm instances, if it covers us.
+
+        See :class:`~isct.pool.ContainerPool`. Returns ``None`` when the
+        container should be started afresh.
+        """
+        pool = getattr(self.runner, 'pool', None)
+        if pool is not None and pool.covers(self) and pool.supports(self):
+            return pool
+        return None
+
+    def warmable(self):
+        """Returns ``True`` if the container can be evaluated in an instance.
+
+        See :meth:`start` and :meth:`exec`. By default, all containers can.
+        """
+        return True
+
     @abc.abstractmethod
     def run(self, args=''):
         """Run a container."""
 
+    @abc.abstractmethod
+    def digest(self):
+        """Returns an identifier of the image's contents, or ``None``."""
+
+    @abc.abstractmethod
+    def start(self, name):
+        """Start a long-lived instance of the container named ``name``."""
+
+    @abc.abstractmethod
+    def exec(self, name, args=''):
+        """Run the container's command in the instance named ``name``."""
+
+    @abc.abstractmethod
+    def stop(self, name):
+        """Stop the instance named ``name``."""
+
     @abc.abstractmethod
     def create(self):
         """Create a container."""
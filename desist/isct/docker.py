@@ -1,21 +1,63 @@
 """:class:`~isct.container.Container` implemementation for ``Docker``."""
+import click
+import functools
 import getpass
+import json
 import logging
 import os
+import shlex
+import subprocess
 import sys
 
 from .container import Container
 from .utilities import OS
 from .runner import Logger
 
+# The image entrypoints of the started instances by their name, which are
+# evaluated in the instances by `Docker.exec`.
+_entrypoints = {}
+
+
+def run_as_user(value):
+    """Returns ``False`` if ``DOCKER_USER`` opts out of running as the user.
+
+    The values ``0``, ``false``, ``no``, ``off``, and ``root`` opt out, while
+    any other integer, ``true``, ``yes``, ``on``, or an empty value do not.
+    Raises ``UsageError`` for other values.
+    """
+    value = value.strip().lower()
+    if value in ('false', 'no', 'off', 'root'):
+        return False
+    if value in ('', 'true', 'yes', 'on'):
+        return True
+
+    try:
+        return int(value) != 0
+    except ValueError:
+        raise click.UsageError(
+            f'Invalid `DOCKER_USER={value}`: use `0` to run Docker containers '
+            'as root, or `1` to run these as the current user.')
+
+
+@functools.lru_cache(maxsize=None)
+def log_user(user):
+    """Logs the ``user`` the containers run as, once for each process."""
+    logging.info(f'Running Docker containers as `{user}`, set `DOCKER_USER=0` '
+                 'to run these as root.')
+
 
 class Docker(Container):
     """Implements :class:`~isct.container.Container` for ``Docker``."""
-    def __init__(self, path, docker_group=False, runner=Logger()):
+    def __init__(self, path, docker_group=False, runner=Logger(), user=None):
         super().__init__(path, runner=runner)
         self.docker_group = docker_group
         self.bind_flag = '-v'
 
+        # Run as the current user on Linux, unless `DOCKER_USER=0`
+        if user is None:
+            user = run_as_user(os.environ.get('DOCKER_USER', ''))
+        self.run_as_user = user
+
         # Docker requires `sudo` when no part of user group; only on Linux
         self.sudo = ''
         if not docker_group:
@@ -32,18 +74,191 @@ class Docker(Container):
         cmd = f'{self.sudo} docker build {self.path.absolute()} -t {self.tag}'
         return self.runner.run(cmd.split())
 
+    def digest(self):
+        """Returns the identifier of the Docker image, or ``None``.
+
+        The identifier is the content hash of the image's configuration, which
+        changes whenever the image is rebuilt with different contents.
+        """
+        cmd = f'{self.sudo} docker image inspect -f {{{{.Id}}}} {self.tag}'
+        try:
+            result = subprocess.run(cmd.split(),
+                                    capture_output=True,
+                                    check=True,
+                                    text=True)
+        except (OSError, subprocess.CalledProcessError):
+            return None
+
+        return result.stdout.strip() or None
+
+    def entrypoint(self):
+        """Returns the entrypoint of the Docker image as list, or ``None``.
+
+        ``None`` is returned when the image declares no entrypoint, or when
+        the image cannot be inspected.
+        """
+        fmt = '{{json .Config.Entrypoint}}'
+        cmd = f'{self.sudo} docker image inspect -f'.split() + [fmt, self.tag]
+        try:
+            result = subprocess.run(cmd,
+                                    capture_output=True,
+                                    check=True,
+                                    text=True)
+            entrypoint = json.loads(result.stdout)
+        except (OSError, ValueError, subprocess.CalledProcessError):
+            return None
+
+        return [str(arg) for arg in entrypoint] if entrypoint else None
+
+    def warmable(self):
+        """Returns ``True`` if the image can be evaluated in an instance.
+
+        The instances evaluate the image's entrypoint with the arguments, see
+        :meth:`Docker.exec`. For images declaring only a ``CMD``, ``docker
+        run`` replaces the command by the arguments instead, which cannot be
+        mimicked within the instances. The instances idle through ``tail``,
+        see :meth:`Docker.start`, which requires the image to provide
+        ``/bin/sh`` and ``tail``. Images that cannot be inspected are started
+        afresh as well.
+        """
+        if self.entrypoint() is None:
+            return False
+
+        cmd = f'{self.sudo} docker run --rm --entrypoint /bin/sh'.split()
+        cmd += [self.tag, '-c', 'command -v tail']
+        try:
+            subprocess.run(cmd, capture_output=True, check=True)
+        except (OSError, subprocess.CalledProcessError):
+            return False
+
+        return True
+
+    @property
+    def user(self):
+        """The ``uid:gid`` the container runs as, or ``None``.
+
+        On Linux, the files written by the container are owned by the user
+        running inside the container, which is ``root`` by default. Instead,
+        the container is run as the current user, such that the files written
+        to the bound volumes are owned correctly from the start and their
+        permissions do not need to be updated afterwards.
+
+        This requires the container to be runnable by an unprivileged user.
+        Otherwise, the container can be run as ``root`` with the permissions
+        updated afterwards (see :meth:`Docker.update_file_permissions`) by
+        setting ``DOCKER_USER=0`` in the running environment, see
+        :func:`run_as_user` for the accepted values:
+
+        >>> DOCKER_USER=0 desist patient run ...
+        """
+        if not self.run_as_user:
+            return None
+
+        if OS.from_platform(sys.platform) != OS.LINUX:
+            return None
+
+        # If no volumes are written, the user does not matter
+        if len(self.bind_volumes) == 0:
+            return None
+
+        return f'{os.getuid()}:{os.getgid()}'
+
+    @property
+    def flags(self):
+        """The flags to run the container with, see :attr:`Docker.user`."""
+        if (user := self.user) is None:
+            return ''
+        log_user(user)
+        return f'--user {user}'
+
     def run(self, args=''):
         """Evaluate the Docker command.
 
-        Depending on the hardware and system configuration, this command will
+        On Linux, the container runs as the current user (see
+        :attr:`Docker.user`). When this is disabled, this command will
         run two commands. The first to evaluate the simulation and second to
         update possible file permissions of the emitted output files. Note,
         even when the simulation fails, it is still attempted to update the
         file permissions to reduce the change of leaving around files with the
         wrong permissions.
+
+        When the runner holds a pool of warm instances, the command is
+        evaluated in one of the pool's instances instead, see
+        :class:`~isct.pool.ContainerPool`.
         """
-        cmd = f'{self.sudo} docker run {self.volumes} {self.tag} {args}'
-        success = self.runner.run(cmd.split(), check=True)
+        if (pool := self.warm_pool()) is not None:
+            return pool.run(self, args)
+
+        cmd = (f'{self.sudo} docker run {self.flags} {self.volumes} '
+               f'{self.tag} {args}')
+        success = self.runner.run(cmd.split(), check=True,
+                                  invocation=self.client_invocation())
+        return self.fix_permissions(success)
+
+    def client_invocation(self):
+        """Returns the invocation timing the ``docker`` client's command.
+
+        The containers are children of the Docker daemon, rather than of the
+        ``docker`` client evaluated by the runner. The resource usage measured
+        by the runner is therefore not the container's and is not recorded.
+        """
+        if self.invocation is not None:
+            self.invocation.record_usage = False
+        return self.invocation
+
+    def start(self, name):
+        """Start a detached Docker container named ``name``.
+
+        The container idles until it is removed, while the image's entrypoint
+        is read once and evaluated by :meth:`~isct.docker.Docker.exec`.
+        Returns ``False`` when the image declares no entrypoint.
+        """
+        if (entrypoint := self.entrypoint()) is None:
+            return False
+
+        cmd = f'{self.sudo} docker run -d --rm --name {name}'.split()
+        cmd += ['--entrypoint', 'tail', *self.flags.split()]
+        for (host, local) in self.bind_volumes:
+            cmd += [self.bind_flag, f'{host}:{local}']
+        cmd += [self.tag, '-f', '/dev/null']
+
+        success = self.runner.run(cmd, check=True)
+        if success is not False:
+            _entrypoints[name] = entrypoint
+        return success
+
+    def exec(self, name, args=''):
+        """Evaluate the image's entrypoint in the container named ``name``.
+
+        The entrypoint and arguments are passed to ``docker exec`` as they
+        are, without evaluating these in a shell inside the container.
+        Similar to :meth:`~isct.docker.Docker.run`, the file permissions are
+        updated afterwards.
+        """
+        entrypoint = _entrypoints.get(name) or self.entrypoint() or []
+        cmd = f'{self.sudo} docker exec {name}'.split()
+        cmd = [*cmd, *entrypoint, *shlex.split(args)]
+        success = self.runner.run(cmd, check=True,
+                                  invocation=self.client_invocation())
+        return self.fix_permissions(success)
+
+    def stop(self, name):
+        """Remove the container named ``name``."""
+        _entrypoints.pop(name, None)
+        cmd = f'{self.sudo} docker rm -f {name}'
+        return self.runner.run(cmd.split(), check=True)
+
+    def fix_permissions(self, success):
+        """Update the file permissions after evaluating the container.
+
+        Returns the combined success of the evaluation and the update. Failed
+        evaluations as the current user point to running as ``root``, as the
+        image may require this.
+        """
+        if success is False and self.user is not None:
+            logging.warning(f'Container `{self.tag}` failed running as '
+                            f'`{self.user}`. Set `DOCKER_USER=0` when it '
+                            'needs to run as root.')
 
         if (cmd := self.update_file_permissions()) is None:
             return success
@@ -77,6 +292,9 @@ class Docker(Container):
         change the permissions of these newly created files, nor remove them
         from their system.
 
+        This is only required when the container is not run as the current
+        user, see :attr:`Docker.user`.
+
         This routine considers two scenarios:
 
         1. The host does have root permissions.
@@ -97,6 +315,10 @@ class Docker(Container):
         if len(self.bind_volumes) == 0:
             return None
 
+        # The files are owned by the right user already
+        if self.user is not None:
+            return None
+
         # FIXME: Resolve the hard coded paths to extract the patient or trial
         #        containers from. When using the conventions of `/trial` and
         #        `/patient` this will work, but  for any other approach the
@@ -1,4 +1,111 @@
 """Helper implementation for simulation events and their models."""
+import math
+import re
+import typing
+
+memory_units = {'': 1, 'K': 1 / 1024, 'M': 1, 'G': 1024, 'T': 1024**2}
+"""dict: Multipliers to convert memory units to megabytes."""
+
+
+def parse_memory(memory):
+    """Returns the memory in megabytes, e.g. ``30GB`` or ``512MB``.
+
+    Numeric values are interpreted as megabytes. Returns ``None`` when no
+    memory is provided.
+    """
+    if memory is None or isinstance(memory, (int, float)):
+        return memory
+
+    match = re.fullmatch(r'\s*([\d.]+)\s*([KMGT]?)i?B?\s*', str(memory),
+                         re.IGNORECASE)
+    if match is None:
+        raise ValueError(f'Invalid memory specification: `{memory}`.')
+
+    value, unit = match.groups()
+    return math.ceil(float(value) * memory_units[unit.upper()])
+
+
+def parse_walltime(walltime):
+    """Returns the walltime in seconds, e.g. ``HH:MM:SS`` or ``MM:SS``.
+
+    Numeric values are interpreted as seconds. Returns ``None`` when no
+    walltime is provided.
+    """
+    if walltime is None or isinstance(walltime, (int, float)):
+        return walltime
+
+    try:
+        seconds = 0
+        for part in str(walltime).split(':'):
+            seconds = 60 * seconds + int(part)
+    except ValueError:
+        raise ValueError(f'Invalid walltime specification: `{walltime}`.')
+
+    return seconds
+
+
+class Resources(typing.NamedTuple):
+    """Compute resources required to evaluate a simulation model.
+
+    The resources are declared by the optional ``resources`` key of a model
+    in the events specification, for example:
+
+    .. code-block:: yaml
+
+       models:
+       - label: meshing
+         resources:
+           cores: 8
+           memory: 30GB
+           walltime: 02:00:00
+
+    Attributes:
+        cores: The number of cores, defaults to a single core.
+        memory: The memory in megabytes, if specified.
+        walltime: The walltime in seconds, if specified.
+    """
+    cores: int = 1
+    memory: typing.Optional[int] = None
+    walltime: typing.Optional[int] = None
+
+    @classmethod
+    def from_dict(cls, resources):
+        """Parses the resources from a ``resources`` dictionary."""
+        resources = resources or {}
+        cores = int(resources.get('cores', 1))
+        if cores < 1:
+            raise ValueError(f'Invalid number of cores: `{cores}`.')
+
+        return cls(cores=cores,
+                   memory=parse_memory(resources.get('memory')),
+                   walltime=parse_walltime(resources.get('walltime')))
+
+    @classmethod
+    def maximum(cls, resources):
+        """Returns the resources sufficient for each of ``resources``.
+
+        The walltime is only known when it is known for all.
+        """
+        resources = list(resources) or [cls()]
+        walltimes = [r.walltime for r in resources]
+        return cls(cores=max(r.cores for r in resources),
+                   memory=max((r.memory for r in resources if r.memory),
+                              default=None),
+                   walltime=None if None in walltimes else max(walltimes))
+
+    @classmethod
+    def peak(cls, resources):
+        """Returns the resources to evaluate all ``resources`` in sequence.
+
+        The peak number of cores and memory are required, while the walltimes
+        are summed. The walltime is only known when it is known for all.
+        """
+        resources = list(resources) or [cls()]
+        walltimes = [r.walltime for r in resources]
+        return cls(cores=max(r.cores for r in resources),
+                   memory=max((r.memory for r in resources if r.memory),
+                              default=None),
+                   walltime=None if None in walltimes else sum(walltimes))
 
 
 class Events(list):
@@ -18,48 +125,80 @@ class Events(list):
     This class provides some helper routines to extract all events, specific
     event or model instances given a current simulation index, or to find the
     current event ID of a specific event.
+
+    On initialisation the events are flattened once into an index mapping each
+    simulation index to its event, model, and label. All lookups by simulation
+    index are therefore constant time. The events are considered immutable
+    after initialisation: modifying the list does not update the index.
     """
     def __init__(self, *args):
         list.__init__(self, *args)
 
+        self._events = [Event(event) for event in self]
+        self._index = [(event, model, model.get('label'))
+                       for event in self._events for model in event.models]
+
     def event_id(self, event):
         """Returns the sequence index of events given an event instance."""
         return self.index(event)
 
+    def _lookup(self, idx):
+        """Returns the index entry for simulation index ``idx``, if present."""
+        if 0 <= idx < len(self._index):
+            return self._index[idx]
+        return (None, None, None)
+
     def model(self, idx):
         """Returns the model corresponding to simulation index ``idx``."""
-        for (i, m) in enumerate(self.models):
-            if i == idx:
-                return m
+        return self._lookup(idx)[1]
 
     def label(self, idx):
         """Returns the label corresponding to simulation index ``idx``."""
-        for (i, label) in enumerate(self.labels):
-            if i == idx:
-                return label
+        return self._lookup(idx)[2]
 
     def event(self, idx):
         """Returns the event corresponding to simulation index ``idx``."""
-        cnt = 0
-        for event in self:
-            for m in Event(event).models:
-                if cnt == idx:
-                    return Event(event)
-                cnt += 1
+        return self._lookup(idx)[0]
 
     @property
     def models(self):
         """Yields all models present in all events, in flattened order."""
-        for event in self:
-            for m in Event(event).models:
-                yield m
+        for (_, model, _) in self._index:
+            yield model
 
     @property
     def labels(self):
         """Yields all labels present in all events, in flattened order."""
-        for event in self:
-            for label in Event(event).labels:
-                yield label
+        for (_, _, label) in self._index:
+            yield label
+
+    def resources(self, idx):
+        """Returns the resources of the model at simulation index ``idx``."""
+        return Resources.from_dict((self.model(idx) or {}).get('resources'))
+
+    def peak_resources(self):
+        """Returns the resources to evaluate the full simulation pipeline.
+
+        See :meth:`Resources.peak`.
+        """
+        return Resources.peak(
+            Resources.from_dict(model.get('resources'))
+            for model in self.models)
+
+    def batch(self, idx):
+        """Returns the batch size of the model at simulation index ``idx``.
+
+        The optional ``batch`` key of a model sets the number of patients
+        that are evaluated by a single invocation of the model's container.
+        This amortises the start-up of the container over many patients for
+        short models. By default, each patient is evaluated individually.
+        """
+        return max(1, int((self.model(idx) or {}).get('batch', 1)))
+
+    @property
+    def batch_size(self):
+        """The largest batch size of all models, see :meth:`Events.batch`."""
+        return max(map(self.batch, range(len(self._index))), default=1)
 
     def to_dict(self):
         """Returns a list of ``Events`` in their ``key:value`` dictionary."""
@@ -81,20 +220,23 @@ class Event(dict):
 
     def model(self, idx):
         """Returns the label of the ``idx``th model in the event."""
-        models = list(self.models)
+        models = self.get('models') or []
         if idx >= 0 and idx < len(models):
             return models[idx]
 
     def label(self, idx):
         """Returns the label of the ``idx``th label in the event."""
-        labels = list(self.labels)
-        if idx >= 0 and idx < len(labels):
-            return labels[idx]
+        if (model := self.model(idx)) is not None:
+            return model.get('label')
+
+    def resources(self, idx):
+        """Returns the resources of the ``idx``th model in the event."""
+        return Resources.from_dict((self.model(idx) or {}).get('resources'))
 
     @property
     def models(self):
         """Yield all models available in the current event."""
-        for model in self.get('models'):
+        for model in self.get('models') or []:
             yield model
 
     @property
@@ -0,0 +1,263 @@
+"""The runtime history of the models evaluated in a trial.
+
+The runtime of each model evaluation is appended to the history in
+``trial/.desist/runtimes``, see :meth:`RuntimeHistory.record`. The history
+predicts the runtime of the models of the patients, which allows to evaluate
+the patients with the longest expected runtime first, see
+:attr:`~isct.trial.Trial.order`. When a few slow patients are evaluated last,
+the other workers are idle until these complete. Starting the slowest
+patients first reduces the total runtime of the trial.
+
+By default, the runtime of a model is predicted as the mean runtime of its
+previous evaluations. When the runtime of the models depends on parameters in
+the patient configuration, the runtime is regressed on these parameters
+through ordinary least squares, see :attr:`~isct.trial.Trial.runtime_keys`.
+
+The history is stored as JSON lines, where each line holds a model's label,
+its entry in the pipeline, its runtime in seconds, and the numeric
+parameters of the patient configuration.
+
+>>> desist trial run /path/to/trial --order longest-first --runtime-key age
+"""
+import collections
+import json
+import logging
+import os
+import pathlib
+
+from .index import index_dir
+
+history_file = 'runtimes'
+"""str: Filename of the runtime history inside the trial's metadata."""
+
+history_size = 1000
+"""int: The number of most recent evaluations considered for each model."""
+
+
+def history_path(trial_dir):
+    """Return the path of the runtime history of the trial at ``trial_dir``."""
+    return pathlib.Path(trial_dir).joinpath(index_dir, history_file)
+
+
+def model_key(model):
+    """Returns the key identifying the model's entry in the pipeline."""
+    return json.dumps(model, sort_keys=True, default=str)
+
+
+def recent(records):
+    """Returns the ``history_size`` most recent records of each model."""
+    counts = collections.Counter()
+    kept = []
+    for record in reversed(records):
+        key = model_key(record['model'])
+        if counts[key] < history_size:
+            counts[key] += 1
+            kept.append(record)
+    return kept[::-1]
+
+
+def file_identity(stat):
+    """Returns the device, inode, and size of the file's ``stat``."""
+    return stat.st_dev, stat.st_ino, stat.st_size
+
+
+def compact(path, records, identity):
+    """Replace the history at ``path`` by the given ``records``.
+
+    Similar to :meth:`~isct.index.TrialIndex.write`, the records are written
+    to a temporary file first, which then replaces the history. The history
+    is only replaced when it still matches the ``identity`` it had when the
+    records were read, see :func:`file_identity`, such that records appended
+    by other processes in the meantime are not lost. Failures to write are
+    logged, but not fatal.
+    """
+    tmp = path.with_suffix(f'.{os.getpid()}.tmp')
+    try:
+        with open(tmp, 'w') as outfile:
+            outfile.writelines(json.dumps(record, default=str) + '\n'
+                               for record in records)
+
+        if file_identity(os.stat(path)) != identity:
+            # the history was appended to or replaced since it was read
+            os.remove(tmp)
+            return
+
+        os.replace(tmp, path)
+    except OSError as err:
+        logging.warning(f'Failed to compact runtime history: {err}')
+
+
+def parameters(config):
+    """Returns the numeric, top-level values of the configuration."""
+    return {k: v for k, v in config.items()
+            if isinstance(v, (int, float)) and not isinstance(v, bool)}
+
+
+def mean(values, default=0.0):
+    """Returns the mean of ``values``, or ``default`` when empty."""
+    values = list(values)
+    return sum(values) / len(values) if values else default
+
+
+def least_squares(rows, values):
+    """Returns the coefficients minimising the squared residuals.
+
+    Solves the normal equations of the ``rows`` of the design matrix through
+    Gaussian elimination. Returns ``None`` when the system is singular, e.g.
+    when a parameter is constant across the evaluations.
+    """
+    n = len(rows[0])
+    system = [[sum(row[i] * row[j] for row in rows) for j in range(n)]
+              for i in range(n)]
+    for i in range(n):
+        system[i].append(sum(row[i] * v for row, v in zip(rows, values)))
+
+    for col in range(n):
+        pivot = max(range(col, n), key=lambda row: abs(system[row][col]))
+        if abs(system[pivot][col]) < 1e-9:
+            return None
+        system[col], system[pivot] = system[pivot], system[col]
+
+        for row in range(n):
+            if row != col:
+                factor = system[row][col] / system[col][col]
+                system[row] = [a - factor * b
+                               for a, b in zip(system[row], system[col])]
+
+    return [system[i][n] / system[i][i] for i in range(n)]
+
+
+class Estimate:
+    """The expected runtime of a model, given its previous evaluations.
+
+    The runtime is regressed on the patient parameters ``keys`` when each of
+    the evaluations holds these parameters and the evaluations outnumber the
+    parameters. Otherwise, the mean runtime is used.
+    """
+    def __init__(self, records, keys=()):
+        """Initialise the estimate from the history's ``records``."""
+        self.keys = list(keys)
+        self.mean = mean(record['duration'] for record in records)
+        self.coefficients = None
+
+        rows = [[1.0] + [record.get('config', {}).get(k) for k in self.keys]
+                for record in records]
+        rows = [row for row in rows if None not in row]
+        if self.keys and len(rows) == len(records) > len(self.keys) + 1:
+            durations = [record['duration'] for record in records]
+            self.coefficients = least_squares(rows, durations)
+
+    def predict(self, config):
+        """Returns the expected runtime for the patient ``config``."""
+        values = parameters(config)
+        if self.coefficients is None or not values.keys() >= set(self.keys):
+            return self.mean
+
+        row = [1.0] + [values[key] for key in self.keys]
+        return max(0.0, sum(c * x for c, x in zip(self.coefficients, row)))
+
+
+class RuntimeHistory:
+    """Predicts the runtime of the patients' models from earlier runtimes.
+
+    The runtime of models without evaluations are predicted by the mean of the
+    models sharing their label, i.e. container, or by the mean of all models
+    otherwise.
+    """
+    def __init__(self, records=(), keys=()):
+        """Initialise the history from its records.
+
+        Args:
+            records: The recorded evaluations, in order of evaluation.
+            keys: The patient parameters the runtime is regressed on.
+        """
+        models = collections.defaultdict(list)
+        labels = collections.defaultdict(list)
+        for record in records:
+            models[model_key(record['model'])].append(record)
+            labels[record['label']].append(record['duration'])
+
+        self.estimates = {key: Estimate(evaluations[-history_size:], keys)
+                          for key, evaluations in models.items()}
+        self.labels = {label: mean(durations)
+                       for label, durations in labels.items()}
+        self.default = mean(self.labels.values())
+
+    def __len__(self):
+        """Returns the number of models present in the history."""
+        return len(self.estimates)
+
+    @classmethod
+    def read(cls, trial_dir, keys=()):
+        """Read the history of the trial at ``trial_dir``.
+
+        Returns an empty history when no history is present. Lines that cannot
+        be parsed, e.g. due to an interrupted write, are ignored. Only the
+        ``history_size`` most recent records of each model are retained: the
+        history on disk is compacted to these records once it outgrows them.
+        """
+        path = history_path(trial_dir)
+        records, lines, identity = [], 0, None
+        try:
+            with open(path, 'rb') as infile:
+                data = infile.read()
+                stat = os.fstat(infile.fileno())
+                identity = (stat.st_dev, stat.st_ino, len(data))
+
+                for line in data.splitlines():
+                    lines += 1
+                    try:
+                        record = json.loads(line)
+                        records.append({
+                            'label': record['label'],
+                            'model': record['model'],
+                            'duration': float(record['duration']),
+                            'config': dict(record.get('config') or {}),
+                        })
+                    except (ValueError, KeyError, TypeError):
+                        continue
+        except (FileNotFoundError, NotADirectoryError):
+            pass
+
+        records = recent(records)
+        if lines > 2 * len(records) + 16:
+            compact(path, records, identity)
+
+        return cls(records, keys=keys)
+
+    @staticmethod
+    def record(patient, idx: int, duration: float):
+        """Append the ``duration`` of the patient's ``idx``th model.
+
+        Similar to :meth:`~isct.index.TrialIndex.update`, the record is only
+        appended when the patient is part of a trial with metadata, and is
+        appended in a single write, such that this is safe when multiple
+        processes evaluate patients of the same trial.
+        """
+        path = history_path(patient.dir.parent)
+        if not path.parent.exists():
+            return
+
+        record = {
+            'label': patient.events.label(idx),
+            'model': patient.events.model(idx),
+            'duration': round(duration, 3),
+            'config': parameters(patient),
+        }
+        try:
+            with open(path, 'a') as outfile:
+                outfile.write(json.dumps(record, default=str) + '\n')
+        except OSError as err:
+            logging.warning(f'Failed to update runtime history: {err}')
+
+    def predict(self, patient, idx: int):
+        """Returns the expected runtime of the patient's ``idx``th model."""
+        key = model_key(patient.events.model(idx))
+        if (estimate := self.estimates.get(key)) is not None:
+            return estimate.predict(patient)
+        return self.labels.get(patient.events.label(idx), self.default)
+
+    def cost(self, patient, start: int = 0):
+        """Returns the expected runtime of the patient's remaining models."""
+        return sum(self.predict(patient, idx)
+                   for idx in range(start, patient['pipeline_length']))
@@ -0,0 +1,238 @@
+"""Persistent index of the patients present in a trial.
+
+Discovering the patients of a trial requires listing the trial directory and
+parsing each ``patient.yml`` to verify the directory contains a valid patient.
+For large cohorts, especially on network file systems, this dominates the
+runtime of trial-wide commands. The :class:`TrialIndex` stores the discovered
+patient directories together with their ``id``, ``prefix``, and the
+modification time of their configuration file in
+``trial/.desist/index``. On subsequent use, only the patients with a modified
+(or missing) index entry are parsed again.
+
+The index is stored as JSON lines, where later lines take precedence over
+earlier lines. This allows :meth:`TrialIndex.update` to append a single entry
+whenever a patient configuration is written, without having to rewrite the
+full index. The journal is compacted once it grows too large.
+"""
+import json
+import logging
+import os
+import pathlib
+
+from .config import Config
+
+index_dir = '.desist'
+"""str: Directory inside the trial directory holding the trial's metadata."""
+
+index_file = 'index'
+"""str: Filename of the patient index inside :attr:`index_dir`."""
+
+
+class TrialIndex(dict):
+    """Mapping of patient directory names to their index entries.
+
+    Each entry holds the patient's ``id``, ``prefix``, the name of the
+    ``config`` file, and the modification time ``mtime`` (in nanoseconds) of
+    the configuration file at the moment the entry was recorded.
+    """
+    def __init__(self, trial_dir, entries=None):
+        """Initialise an index for the trial located at ``trial_dir``.
+
+        Args:
+            trial_dir: The trial directory containing the patients.
+            entries: Initial entries of the index.
+        """
+        super().__init__(dict(entries or {}))
+        self.dir = pathlib.Path(trial_dir)
+
+        # The position up to which the journal on disk has been consumed,
+        # together with the identity of the file that was consumed.
+        self.journal_length = len(self)
+        self.offset = 0
+        self.inode = None
+
+    @property
+    def path(self):
+        """Path pointing to the index file: ``trial/.desist/index``."""
+        return index_path(self.dir)
+
+    @classmethod
+    def read(cls, trial_dir):
+        """Read the index of the trial at ``trial_dir``.
+
+        Returns an empty index when no index is present.
+        """
+        return cls(trial_dir).load()
+
+    def load(self):
+        """Consume the journal entries appended since the last load.
+
+        Only complete lines are consumed, such that entries that are still
+        being appended by another process are picked up on a next load. When
+        the index was replaced or truncated, it is read from the start. Lines
+        that cannot be parsed, e.g. due to an interrupted write, are ignored:
+        the corresponding patients are simply parsed again on
+        :meth:`TrialIndex.refresh`.
+        """
+        try:
+            with open(self.path, 'rb') as infile:
+                stat = os.fstat(infile.fileno())
+                inode = (stat.st_dev, stat.st_ino)
+                if inode != self.inode or stat.st_size < self.offset:
+                    self.clear()
+                    self.inode, self.offset, self.journal_length = inode, 0, 0
+
+                infile.seek(self.offset)
+                data = infile.read()
+        except (FileNotFoundError, NotADirectoryError):
+            return self
+
+        data = data[:data.rfind(b'\n') + 1]
+        self.offset += len(data)
+
+        for line in data.splitlines():
+            self.journal_length += 1
+            try:
+                entry = json.loads(line)
+                self[entry.pop('name')] = entry
+            except (ValueError, KeyError, AttributeError):
+                continue
+
+        return self
+
+    def write(self):
+        """Write the compacted index to disk.
+
+        The index is written to a temporary file first, which then replaces
+        the original index to avoid partially written indices. Failures to
+        write are logged, but not fatal: the index is only an optimisation.
+        """
+        tmp = self.path.with_suffix('.tmp')
+        try:
+            os.makedirs(self.path.parent, exist_ok=True)
+            with open(tmp, 'w') as outfile:
+                outfile.writelines(
+                    entry_line(name, entry) for name, entry in self.items())
+            os.replace(tmp, self.path)
+            stat = os.stat(self.path)
+        except OSError as err:
+            logging.warning(f'Failed to write index `{self.path}`: {err}')
+            return
+
+        self.inode = (stat.st_dev, stat.st_ino)
+        self.offset = stat.st_size
+        self.journal_length = len(self)
+
+    @staticmethod
+    def update(config):
+        """Record the configuration in the index of its trial, if present.
+
+        The entry is appended to an existing index only: patients that are not
+        part of an indexed trial do not create an index. As the entry is
+        appended in a single write, this is safe when multiple processes
+        update patients of the same trial.
+
+        Args:
+            config: The (just written) patient configuration.
+        """
+        path = index_path(config.dir.parent)
+        if not path.exists():
+            return
+
+        try:
+            entry = new_entry(config.path, config)
+            with open(path, 'a') as outfile:
+                outfile.write(entry_line(config.dir.name, entry))
+        except (OSError, KeyError) as err:
+            logging.warning(f'Failed to update trial index `{path}`: {err}')
+
+    def refresh(self, config_names):
+        """Synchronise the index with the patients present on disk.
+
+        The trial directory is scanned once and only the configuration files
+        of each subdirectory are inspected using ``stat``. A configuration
+        file is only parsed when its modification time differs from the
+        recorded entry, or if no entry is present. Entries for removed
+        patients are dropped. The index is written when it changed.
+
+        Similar to reading a :class:`~isct.patient.Patient`, a missing
+        configuration file marks a directory as "not a patient", while any
+        other error when parsing the configuration file is raised.
+
+        Args:
+            config_names: Candidate filenames of the patient configuration
+                file, in order of precedence.
+        """
+        self.load()
+
+        changed = False
+        present = set()
+
+        with os.scandir(self.dir) as entries:
+            for entry in entries:
+                if entry.name == index_dir or not entry.is_dir():
+                    continue
+
+                recorded = self.get(entry.name, {})
+                path, mtime = stat_config(entry.path, config_names)
+                if path is None:
+                    continue
+
+                present.add(entry.name)
+                current = (path.name, mtime)
+                if (recorded.get('config'), recorded.get('mtime')) == current:
+                    continue
+
+                self[entry.name] = new_entry(path, Config.read(path), mtime)
+                changed = True
+
+        for name in set(self) - present:
+            del self[name]
+            changed = True
+
+        # Compact the journal when the appended updates outgrow the index.
+        if changed or self.journal_length > 2 * len(self) + 16:
+            self.write()
+
+        return self
+
+
+def index_path(trial_dir):
+    """Return the path of the patient index of the trial at ``trial_dir``."""
+    return pathlib.Path(trial_dir).joinpath(index_dir, index_file)
+
+
+def stat_config(directory, config_names):
+    """Returns the path and modification time of a configuration file.
+
+    The candidate ``config_names`` are considered in order of precedence.
+    Returns ``(None, None)`` when no configuration file is present in
+    ``directory``. Unlike :func:`~isct.utilities.find_config`, each candidate
+    is only stat'ed once, as its modification time is needed by the index.
+    """
+    for name in config_names:
+        path = pathlib.Path(directory).joinpath(name)
+        try:
+            return path, os.stat(path).st_mtime_ns
+        except (FileNotFoundError, NotADirectoryError):
+            continue
+
+    return None, None
+
+
+def new_entry(path, config, mtime=None):
+    """Return an index entry for the configuration ``config`` at ``path``."""
+    if mtime is None:
+        mtime = os.stat(path).st_mtime_ns
+
+    return {
+        'id': config['id'],
+        'prefix': config['prefix'],
+        'config': pathlib.Path(path).name,
+        'mtime': mtime,
+    }
+
+
+def entry_line(name, entry):
+    """Format a single index entry as JSON line."""
+    return json.dumps({'name': name, **entry}) + '\n'
@@ -3,18 +3,35 @@
 Extends the configuration functionality :class:`~isct.config.Config` with
 additional patient specific functionality.
 """
+import datetime
 import pathlib
+import yaml
 
 from .config import Config
 from .container import create_container
 from .runner import Logger
 from .events import Events
-from .utilities import FileCleaner, CleanFiles
+from .history import RuntimeHistory
+from .index import TrialIndex
+from .timing import Invocation
+from .utilities import FileCleaner, CleanFiles, config_formats, find_config
+from .utilities import read_config, write_config
 
 patient_config = 'patient.yml'
+patient_configs = [f'patient{sfx}' for (sfx, _, _) in config_formats.values()]
+"""list: Candidate patient configuration filenames, in order of precedence."""
 patient_path = pathlib.Path('/patient')
 
 
+def find_patient_config(directory):
+    """Returns the path of the patient configuration file in ``directory``.
+
+    The candidates in :data:`patient_configs` are considered in order, which
+    defaults to ``patient.yml`` when no configuration file is present.
+    """
+    return find_config(directory, patient_configs)
+
+
 class Patient(Config):
     """A virtual patient represented by its configuration file."""
     def __init__(
@@ -24,6 +41,7 @@ class Patient(Config):
             prefix='patient',
             config={},
             runner=Logger(),
+            config_name=patient_config,
     ):
         """Initialise a virtual patient.
 
@@ -33,11 +51,13 @@ class Patient(Config):
             prefix: The directory prefix.
             config: A default patient configuration to extend.
             runner: The desired command evaluation.
+            config_name: The filename of the patient configuration, its
+                suffix determines the configuration's file format.
         """
         # form patient path from prefix and ID
         path = pathlib.Path(path)
         path = path.joinpath(f'{prefix}_{idx:05}')
-        path = path.joinpath(patient_config)
+        path = path.joinpath(config_name)
 
         # assign command runner
         self.runner = runner
@@ -75,6 +95,22 @@ class Patient(Config):
 
         # obtain config from provided filepath
         config = super().read(path)
+        return cls.from_config(path, config, runner=runner)
+
+    @classmethod
+    def from_config(cls, path, config, runner=Logger()):
+        """Initialises a patient from an already parsed configuration.
+
+        This reconstructs the patient from the ``id`` and ``prefix`` present
+        in the configuration, without reading the configuration file at
+        ``path`` from disk.
+
+        Args:
+            path: The path of the patient's configuration file.
+            config: The patient's configuration.
+            runner: The desired command evaluation.
+        """
+        path = pathlib.Path(path)
 
         # extract keyword arguments and reconstruct patient
         idx, prefix = config['id'], config['prefix']
@@ -101,52 +137,269 @@ class Patient(Config):
         """Create a patient directory with configuration files."""
         self.write()
 
+    def write(self):
+        """Writes the configuration to disk and updates the trial's index."""
+        super().write()
+        TrialIndex.update(self)
+
+    def __setitem__(self, key, value):
+        """Sets ``key``, replacing ``events`` invalidates :attr:`events`."""
+        if key == 'events':
+            self.__dict__.pop('_events', None)
+        super().__setitem__(key, value)
+
     @property
     def events(self):
-        """Return all events present for the current patient."""
-        return Events(self.get('events'))
-
-    def run(self):
-        """Evaluate simulation of virtual patient."""
-        events = Events(self.get('events'))
-        container_path = self.get('container-path')
-
-        for idx, model in enumerate(events.labels):
-            container = create_container(f'{model}',
-                                         container_path=container_path,
-                                         runner=self.runner)
-            container.bind(self.dir, patient_path)
-            args = f'/patient/{self.path.name} {idx} event'
-            success = container.run(args=args)
+        """Return all events present for the current patient.
 
-            # Here we assert with `not False` to allow `None` as valid output
-            # too. Any verbose logger, i.e. the command is simply logged or
-            # printed to the console, does not have a notion of success/failure
-            # and will sipmly return None. Thus, only when the runner can
-            # make a meaningful conclusion on success/failure will True/False
-            # values be returned.
-            assert success is not False, "Patient event simulation failed."
+        The events are initialised once and reused, as long as the patient's
+        ``events`` are not replaced, see :class:`~isct.events.Events`.
+        """
+        events = self.get('events')
+        cached = getattr(self, '_events', None)
+        if cached is None or cached[0] is not events:
+            cached = self._events = (events, Events(events))
+        return cached[1]
 
+    @property
+    def model_status(self):
+        """The persisted status of each model, see :meth:`record_model`."""
+        return self.get('model_status') or []
+
+    def record_model(self, idx: int, success: bool, outputs=None,
+                     fingerprint=None, duration=None, exit_code=None):
+        """Persists the status of the ``idx``th model in the configuration.
+
+        The status holds the model's label, ``completed``, ``failed``, or
+        ``outdated`` (see :meth:`invalidate`), the time of completion, its
+        runtime in seconds, the exit code of its container, and the files
+        written by the model and the key of its inputs, if known, see
+        :class:`~isct.cache.Fingerprinter`. The
+        runtime of completed models is appended to the trial's
+        :class:`~isct.history.RuntimeHistory`. Similar to
+        :meth:`~isct.patient.Patient.finalise`, the status is only written
+        when the runner is able to actually invoke the simulations, see
+        :meth:`write_status`.
+        """
+        if not self.runner.write_config:
+            return
+
+        status = list(self.model_status)
+        status += [None] * (idx + 1 - len(status))
+        status[idx] = {
+            'label': self.events.label(idx),
+            'status': 'completed' if success else 'failed',
+            'time': datetime.datetime.now().isoformat(timespec='seconds'),
+        }
+        if outputs is not None:
+            status[idx]['outputs'] = sorted(outputs)
+        if fingerprint is not None:
+            status[idx]['fingerprint'] = fingerprint
+        if duration is not None:
+            status[idx]['duration'] = round(duration, 3)
+            if success:
+                RuntimeHistory.record(self, idx, duration)
+        if exit_code is not None:
+            status[idx]['exit_code'] = exit_code
+
+        self['model_status'] = status
+        self.write_status()
+
+    def write_status(self):
+        """Writes the status of the models without replacing other changes.
+
+        The containers may modify the patient's configuration while the
+        pipeline is evaluated. Therefore, the configuration is read from disk
+        and only its ``model_status`` and ``completed`` are replaced. The
+        full configuration is written when it cannot be read.
+        """
+        try:
+            config = dict(read_config(self.path))
+        except (OSError, TypeError, ValueError, yaml.YAMLError):
+            return self.write()
+
+        config['model_status'] = self.model_status
+        config['completed'] = self.completed
+        write_config(self.path, config)
+        TrialIndex.update(self)
+
+    def model_outputs(self, models):
+        """Returns the recorded files written by the given ``models``."""
+        status = self.model_status
+        return {path
+                for idx in models if idx < len(status) and status[idx]
+                for path in status[idx].get('outputs', [])}
+
+    def first_incomplete_model(self):
+        """Returns the simulation index of the first incomplete model.
+
+        A model is complete when its status is ``completed`` and it evaluated
+        the model currently at its index of the pipeline. Returns the pipeline
+        length when all models are completed.
+        """
+        status = self.model_status
+        for idx in range(self['pipeline_length']):
+            model = status[idx] if idx < len(status) else None
+            if not model or model.get('status') != 'completed':
+                return idx
+            if model.get('label') != self.events.label(idx):
+                return idx
+
+        return self['pipeline_length']
+
+    def first_outdated_model(self, fingerprints):
+        """Returns the simulation index of the first outdated model.
+
+        A model is outdated when it is incomplete, see
+        :meth:`first_incomplete_model`, when the files it wrote are missing,
+        or when the key of its current inputs differs from the key recorded
+        on its last evaluation, see :class:`~isct.cache.Fingerprinter`. Models
+        without a recorded key, or with an unknown container digest, are
+        considered outdated. Returns the pipeline length when all models are
+        up to date.
+        """
+        status = self.model_status
+        files = None
+        for idx in range(self.first_incomplete_model()):
+            model = status[idx]
+            outputs = model.get('outputs', [])
+            if not all(self.dir.joinpath(path).exists() for path in outputs):
+                return idx
+
+            key, files = fingerprints.inputs(self, idx, self.container(idx),
+                                             digests=files)
+            if key is None or key != model.get('fingerprint'):
+                return idx
+
+        return self.first_incomplete_model()
+
+    def invalidate(self, fingerprints):
+        """Clears the status of the outdated models and their successors.
+
+        The models starting at the first outdated model, see
+        :meth:`first_outdated_model`, are marked as ``outdated``, such that a
+        resumed evaluation evaluates these models again, while the output of
+        the preceding models is kept. The files recorded for the outdated
+        models are kept in their status, such that their output on disk is
+        not mistaken for inputs of the models evaluated again. Returns the
+        simulation index of the first outdated model.
+        """
+        idx = self.first_outdated_model(fingerprints)
+        if idx == self['pipeline_length'] and self.completed:
+            return idx
+
+        status = self.model_status[:idx]
+        for model in self.model_status[idx:]:
+            outputs = (model or {}).get('outputs')
+            status.append({'label': model.get('label'),
+                           'status': 'outdated',
+                           'outputs': outputs} if outputs else None)
+        while status and status[-1] is None:
+            status.pop()
+
+        self.completed = False
+        self['model_status'] = status
+        if self.runner.write_config:
+            self.write()
+        return idx
+
+    def run(self, models=None, resume=False):
+        """Evaluate simulation of virtual patient.
+
+        Args:
+            models: The simulation indices of the models to evaluate, in
+                order. By default, all models of the pipeline are evaluated.
+                The patient is only finalised when the last model of the
+                pipeline is evaluated.
+            resume: Start at the first incomplete model of the pipeline,
+                see :meth:`first_incomplete_model`, rather than at the first
+                model. Only used when no ``models`` are given.
+        """
+        if models is None:
+            start = self.first_incomplete_model() if resume else 0
+            models = range(start, self['pipeline_length'])
+
+        for idx in models:
+            self.run_model(idx)
+
+        if self.completes_pipeline(models):
+            self.finalise()
+
+    def completes_pipeline(self, models=None):
+        """Returns true if ``models`` include the pipeline's last model."""
+        last = self['pipeline_length'] - 1
+        return models is None or max(models, default=last) == last
+
+    def run_model(self, idx: int):
+        """Evaluate the simulation of the ``idx``th model of the pipeline.
+
+        The models of a patient depend on each other's output, thus, the
+        models should be evaluated in order. This allows schedulers to
+        interleave the models of different patients, see
+        :class:`~isct.scheduler.ModelScheduler`.
+        """
+        container = self.container(idx)
+        container.invocation = Invocation([self], idx)
+        args = f'/patient/{self.path.name} {idx} event'
+
+        # record the model's inputs, or restore the model's output when its
+        # inputs were evaluated before
+        outputs, key = None, None
+        if (cache := getattr(self.runner, 'cache', None)) is not None:
+            success, outputs, key = cache.run(self, idx, container, args=args)
+        else:
+            success = container.run(args=args)
+
+        # only the runtime and exit code of the container itself are recorded,
+        # which are not known for restored outputs or runners that do not time
+        # invocations
+        invocation = container.invocation
+        self.record_model(idx, success is not False, outputs=outputs,
+                          fingerprint=key, duration=invocation.wall,
+                          exit_code=invocation.exit_code)
+
+        # Here we assert with `not False` to allow `None` as valid output
+        # too. Any verbose logger, i.e. the command is simply logged or
+        # printed to the console, does not have a notion of success/failure
+        # and will sipmly return None. Thus, only when the runner can
+        # make a meaningful conclusion on success/failure will True/False
+        # values be returned.
+        assert success is not False, "Patient event simulation failed."
+
+    def container(self, idx: int):
+        """Returns the ``idx``th model's container bound to the patient."""
+        container = create_container(f'{self.events.label(idx)}',
+                                     container_path=self.get('container-path'),
+                                     runner=self.runner)
+        container.bind(self.dir, patient_path)
+        return container
+
+    def finalise(self):
+        """Mark the patient as completed after all models are evaluated."""
         # Update the local configuration file only when the runner is able
         # to actually invoke the simulations, i.e. do not update the config
         # files when running with a verbose runner, e.g. a `Logger`.
         if self.runner.write_config:
 
-            # FIXME: the marking of a patient simulation as `completed` could
-            # be make more general by storing a completed boolean per event.
-            # So, we can then set here
-            # `self.completed = all([e.completed for e in events.models])
             self.completed = True
             self.write()
 
+    def clean(self):
+        """Clean simulation output after the patient's simulations.
+
+        The default patient keeps all files, see :class:`LowStoragePatient`.
+        """
+        pass
+
     def reset(self):
         """Resets the status of a patient.
 
-        This unsets the completed flag to ``False``, such that the patient
-        is not marked as completed anymore and will be evaluated again in
-        subsequent pipeline evaluations.
+        This unsets the completed flag to ``False`` and clears the status of
+        the models, such that the patient is not marked as completed anymore
+        and will be evaluated again in subsequent pipeline evaluations.
         """
         self.completed = False
+        self['model_status'] = []
         self.write()
 
 
@@ -165,14 +418,44 @@ class LowStoragePatient(Patient):
 
     @classmethod
     def from_patient(cls, patient, clean_mode):
-        """Initialise a LowStoragePatient from a patient class."""
-        patient = cls.read(patient.path, runner=patient.runner)
+        """Initialise a LowStoragePatient from a patient class.
+
+        The patient's configuration is copied from the provided instance, such
+        that the configuration file is not parsed again.
+        """
+        patient = cls.from_config(patient.path,
+                                  dict(patient),
+                                  runner=patient.runner)
         patient.file_cleaner = FileCleaner(clean_mode)
         return patient
 
-    def run(self):
-        """Cleans simulation output after all models are completed."""
+    def run(self, models=None, resume=False):
+        """Cleans simulation output after all models are completed.
+
+        When only a subset of the ``models`` is evaluated, the files are only
+        cleaned after the pipeline's last model, as the output is required by
+        the subsequent models, or when the simulation fails.
+        """
+        success = False
         try:
-            super().run()
+            super().run(models, resume=resume)
+            success = True
         finally:
-            self.file_cleaner.clean_files(self.dir)
+            if not success or self.completes_pipeline(models):
+                self.clean()
+
+    def clean(self):
+        """Cleans simulation output according to the ``FileCleaner``.
+
+        When the patient is incomplete, the status of its models is cleared,
+        as the output of the completed models may have been removed. Thus,
+        the patient is not resumed, but evaluated from its first model.
+        """
+        self.file_cleaner.clean_files(self.dir)
+
+        if self.file_cleaner.mode == CleanFiles.NONE or self.completed:
+            return
+
+        if self.model_status and self.runner.write_config:
+            self['model_status'] = []
+            self.write()
@@ -0,0 +1,210 @@
+"""Pools of warm container instances reused across patients.
+
+By default, each model of each patient starts a fresh container, i.e. a
+``docker run`` or ``singularity run`` per invocation. For short models, the
+start-up of the container can take a considerable share of the runtime. A
+:class:`ContainerPool` keeps long-lived instances of the containers around,
+i.e. ``docker run -d`` or ``singularity instance start``, and evaluates the
+models inside these instances through ``docker exec`` or ``singularity run
+instance://``.
+
+The instances bind the trial directory at its own path, such that a single
+instance serves all patients of the trial. The container's arguments are
+translated from the bind volumes of the container to the corresponding paths
+on the host. Each instance is recycled after a number of uses, or as soon as
+an evaluation fails, to limit the state carried over between patients.
+Containers that cannot be evaluated in an instance, see
+:meth:`~isct.container.Container.warmable`, are started afresh.
+
+The pool is attached to the :class:`~isct.runner.Runner`, which is shared by
+all patients of a trial. When the runner is sent to worker processes, e.g. by
+:class:`~isct.runner.PoolRunner`, each worker process maintains its own pool,
+which stops its instances when the worker process exits.
+
+>>> desist trial run /path/to/trial --warm 50
+"""
+import collections
+import copy
+import itertools
+import logging
+import multiprocessing.util
+import os
+import pathlib
+import shlex
+import threading
+
+# The pools by their key and process, such that pools sent to worker processes
+# resolve to a single pool in each worker. Forked workers inherit the pools of
+# their parent, which are not used as their instances are not stopped by the
+# worker.
+_pools = {}
+
+
+def _shared_pool(key, root, uses):
+    """Returns the pool for ``key`` in the current process."""
+    if (pool := _pools.get((key, os.getpid()))) is None:
+        pool = ContainerPool(root, uses=uses, key=key)
+    return pool
+
+
+class Instance:
+    """A warm instance of a container, identified by its ``name``."""
+    def __init__(self, container, name):
+        self.container = container
+        self.name = name
+        self.uses = 0
+
+
+class ContainerPool:
+    """Maintains warm instances of containers for the patients in ``root``.
+
+    The instances are started lazily on first use of a container and kept
+    idle in between evaluations. Concurrent evaluations of the same container
+    each acquire their own instance, such that the pool grows to the number
+    of concurrent evaluations.
+
+    The pool can be used as context manager, stopping all instances on exit:
+
+    >>> with ContainerPool(trial.dir, uses=50) as pool:
+    ...     runner.pool = pool
+    ...     trial.run()
+    """
+    def __init__(self, root, uses: int = 100, key=None):
+        """Initialise a pool of instances binding the directory ``root``.
+
+        Args:
+            root: The directory bound into the instances, e.g. the trial.
+            uses: The number of evaluations after which instances are
+                recycled.
+            key: Identifies the pool across processes, defaults to a unique
+                identifier of the pool.
+        """
+        self.root = pathlib.Path(root).absolute()
+        self.uses = max(1, uses)
+        self.key = key if key is not None else (os.getpid(), id(self))
+
+        self.idle = collections.defaultdict(list)
+        self.warmable = {}
+        self.lock = threading.Lock()
+        self.count = itertools.count()
+        self.started = 0
+
+        _pools[(self.key, os.getpid())] = self
+
+        # worker processes exit without evaluating `atexit` handlers
+        multiprocessing.util.Finalize(self, self.close, exitpriority=10)
+
+    def __reduce__(self):
+        """Pickles the pool as a reference to the pool of each process."""
+        return _shared_pool, (self.key, self.root, self.uses)
+
+    def __enter__(self):
+        """Returns the pool itself."""
+        return self
+
+    def __exit__(self, *args):
+        """Stops the idle instances, see :meth:`ContainerPool.close`."""
+        self.close()
+
+    def covers(self, container):
+        """Returns ``True`` if all volumes of ``container`` are in the root."""
+        return all(host == self.root or self.root in host.parents
+                   for (host, _) in container.bind_volumes)
+
+    def supports(self, container):
+        """Returns ``True`` if ``container`` can be evaluated in an instance.
+
+        This is determined once for each image, see
+        :meth:`~isct.container.Container.warmable`, where a warning is logged
+        for images that are started afresh instead.
+        """
+        key = (type(container).__name__, container.image)
+        if (warmable := self.warmable.get(key)) is None:
+            warmable = container.warmable()
+            with self.lock:
+                warned = key in self.warmable
+                self.warmable[key] = warmable
+            if not (warmable or warned):
+                logging.warning(f'Container `{container.image}` cannot be '
+                                'evaluated in warm instances, it is started '
+                                'for each evaluation instead.')
+        return warmable
+
+    @staticmethod
+    def translate(container, args):
+        """Translates paths in ``args`` to the host paths of the volumes.
+
+        The arguments are split as by a shell, and the translated arguments
+        are quoted, such that host paths holding whitespace remain intact.
+        """
+        def host_path(arg):
+            for (host, local) in container.bind_volumes:
+                local = str(local)
+                if arg == local or arg.startswith(f'{local}/'):
+                    return f'{host}{arg[len(local):]}'
+            return arg
+
+        return ' '.join(shlex.quote(host_path(arg))
+                        for arg in shlex.split(args))
+
+    def acquire(self, container):
+        """Returns an idle or newly started instance of ``container``.
+
+        Returns ``None`` when the instance failed to start.
+        """
+        key = (type(container).__name__, container.image)
+        with self.lock:
+            if self.idle[key]:
+                return self.idle[key].pop()
+            name = f'desist-{container.tag}-{os.getpid()}-{next(self.count)}'
+
+        # the instance is independent of the container's volumes, as it binds
+        # the root directory at its own path
+        warm = copy.copy(container)
+        warm.bind_volumes = []
+        warm.bind(self.root, self.root)
+
+        if warm.start(name) is False:
+            return None
+
+        with self.lock:
+            self.started += 1
+        return Instance(warm, name)
+
+    def release(self, instance, success):
+        """Returns ``instance`` to the pool, or recycles it."""
+        instance.uses += 1
+        if success is False or instance.uses >= self.uses:
+            instance.container.stop(instance.name)
+            return
+
+        key = (type(instance.container).__name__, instance.container.image)
+        with self.lock:
+            self.idle[key].append(instance)
+
+    def run(self, container, args=''):
+        """Evaluate ``container`` with ``args`` in a warm instance.
+
+        The container's bind volumes should be covered by the pool, see
+        :meth:`ContainerPool.covers`. Returns the success of the evaluation.
+        """
+        if (instance := self.acquire(container)) is None:
+            return False
+
+        success = False
+        try:
+            success = container.exec(instance.name,
+                                     self.translate(container, args))
+        finally:
+            self.release(instance, success)
+
+        return success
+
+    def close(self):
+        """Stops all idle instances."""
+        with self.lock:
+            instances = [i for idle in self.idle.values() for i in idle]
+            self.idle.clear()
+
+        for instance in instances:
+            instance.container.stop(instance.name)
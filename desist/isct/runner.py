@@ -6,14 +6,24 @@ behaviour can be changed to, for example, logging commands, running commands
 sequentially, to emitting instructions for parallel evaluation.
 """
 import abc
+import asyncio
 import click
+import collections
+import concurrent.futures
 import subprocess
 import logging
+import math
 import os
 import sys
+import threading
+from logging.handlers import RotatingFileHandler
 
 
-def new_runner(verbose: bool, parallel: bool = False, qcg: bool = False):
+def new_runner(verbose: bool,
+               parallel: bool = False,
+               qcg: bool = False,
+               jobs: int = 1,
+               asynchronous: bool = False):
     """Return an initialised runner matching `verbose` and parallel`.
 
     Note: when ambiguous arguments are provided, the function only returns the
@@ -24,6 +34,9 @@ def new_runner(verbose: bool, parallel: bool = False, qcg: bool = False):
         verbose: If the evaluation should only be verbose to console.
         parallel: If the evaluation should happen in ``GNU Parallel``.
         qcg: If the evaluation should happen using ``QCG``
+        jobs: The number of worker processes to evaluate patients with.
+        asynchronous: If the ``jobs`` are evaluated by ``asyncio`` in a single
+            process rather than in worker processes.
     """
     if verbose or (parallel and qcg):
         return Logger()
@@ -34,9 +47,178 @@ def new_runner(verbose: bool, parallel: bool = False, qcg: bool = False):
     if qcg:
         return QCGRunner()
 
+    if asynchronous:
+        return AsyncRunner(jobs)
+
+    if jobs > 1:
+        return PoolRunner(jobs)
+
     return LocalRunner()
 
 
+def imap_unordered(executor, func, iterable, capacity: int, weight=None):
+    """Yields ``func(item)`` for all items as soon as they are completed.
+
+    The items are submitted to the ``executor`` while the total ``weight`` of
+    the submissions that are not yet completed does not exceed ``capacity``.
+    By default each item has unit weight, i.e. at most ``capacity`` items are
+    pending. An item weighing more than ``capacity`` is submitted on its own.
+    This avoids submitting all items at once, which keeps memory bounded and
+    allows to consume ``iterable`` lazily.
+    """
+    pending = {}
+    for item in iterable:
+        required = min(weight(item), capacity) if weight else 1
+        while pending and sum(pending.values()) + required > capacity:
+            done, _ = concurrent.futures.wait(
+                pending, return_when=concurrent.futures.FIRST_COMPLETED)
+            for future in done:
+                pending.pop(future)
+                yield future.result()
+
+        pending[executor.submit(func, item)] = required
+
+    for future in concurrent.futures.as_completed(pending):
+        yield future.result()
+
+
+def worker_logs():
+    """Writes the log files of a worker process to ``<log>.<pid>``.
+
+    Worker processes inherit the rotating log files of the driver process,
+    see ``desist --log``, where the processes would clobber each other's
+    rollovers. Instead, each worker writes to a log file of its own, e.g.
+    ``isct.log.1234``, with the same size limit and formatting.
+    """
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        if not isinstance(handler, RotatingFileHandler):
+            continue
+
+        # the driver's handler is not closed, as its stream is shared
+        worker = RotatingFileHandler(f'{handler.baseFilename}.{os.getpid()}',
+                                     maxBytes=handler.maxBytes,
+                                     backupCount=handler.backupCount,
+                                     delay=True)
+        worker.setLevel(handler.level)
+        worker.setFormatter(handler.formatter)
+        root.removeHandler(handler)
+        root.addHandler(worker)
+
+
+def exit_code(status: int):
+    """Returns the exit code of a ``wait`` status, negative for signals."""
+    if os.WIFSIGNALED(status):
+        return -os.WTERMSIG(status)
+    return os.WEXITSTATUS(status)
+
+
+def read_io(pid: int):
+    """Returns the bytes read and written from storage by process ``pid``.
+
+    The counters are read from ``/proc/<pid>/io``, which includes the
+    counters of the process' children that were waited for. Returns an empty
+    dictionary when unavailable, e.g. on macOS.
+    """
+    counters = {}
+    try:
+        with open(f'/proc/{pid}/io') as infile:
+            for line in infile:
+                key, _, value = line.partition(':')
+                if key in ('read_bytes', 'write_bytes'):
+                    counters[key] = int(value)
+    except (OSError, ValueError):
+        return {}
+    return counters
+
+
+def wait_usage(process):
+    """Waits for ``process`` and returns its exit code and resource usage.
+
+    The resource usage holds the CPU time, in seconds, and the peak resident
+    memory, in megabytes, of the process and its children, obtained through
+    ``os.wait4``. On Linux, the bytes read and written from storage are
+    included, see :func:`read_io`, which are read after the process exits,
+    but before it is reaped. The usage is ``None`` when ``os.wait4`` is not
+    available.
+    """
+    if not hasattr(os, 'wait4'):
+        return process.wait(), None
+
+    io = {}
+    if hasattr(os, 'waitid') and hasattr(os, 'WNOWAIT'):
+        try:
+            os.waitid(os.P_PID, process.pid, os.WEXITED | os.WNOWAIT)
+            io = read_io(process.pid)
+        except ChildProcessError:
+            return process.wait(), None
+
+    try:
+        _, status, rusage = os.wait4(process.pid, 0)
+    except ChildProcessError:
+        return process.wait(), None
+
+    # `ru_maxrss` is reported in kilobytes, except on macOS in bytes
+    scale = 2**20 if sys.platform == 'darwin' else 2**10
+    process.returncode = exit_code(status)
+    return process.returncode, {
+        'cpu_user': round(rusage.ru_utime, 6),
+        'cpu_system': round(rusage.ru_stime, 6),
+        'max_rss': round(rusage.ru_maxrss / scale, 3),
+        **io,
+    }
+
+
+class OutputTail:
+    """Logs the output of a command line by line as it is produced.
+
+    The output is fed in chunks, which are split into lines and logged
+    immediately. Only the last ``maxlen`` lines are kept in memory, e.g. to
+    report on failures, such that the memory remains bounded regardless of
+    the total size of the output. Lines exceeding ``chunk_size`` bytes are
+    logged in pieces. The logged lines start with ``prefix``, e.g. to tell
+    apart the output of commands evaluated concurrently.
+    """
+    def __init__(self, maxlen: int = 100, chunk_size: int = 2**16,
+                 prefix: str = ''):
+        self.lines = collections.deque(maxlen=maxlen)
+        self.chunk_size = chunk_size
+        self.prefix = prefix
+        self.buffer = b''
+
+    def __str__(self):
+        """The retained lines, separated by newlines."""
+        return '\n'.join(self.lines)
+
+    def log(self, line):
+        """Log a single line and append it to the tail."""
+        line = line.decode(errors='replace').rstrip('\r')
+        logging.info(f'{self.prefix}{line}')
+        self.lines.append(line)
+
+    def feed(self, chunk):
+        """Log all complete lines in ``chunk``, buffering the remainder."""
+        *lines, self.buffer = (self.buffer + chunk).split(b'\n')
+        if len(self.buffer) >= self.chunk_size:
+            lines, self.buffer = lines + [self.buffer], b''
+
+        for line in lines:
+            self.log(line)
+
+    def flush(self):
+        """Log the remaining buffered output, if any."""
+        if self.buffer:
+            self.log(self.buffer)
+        self.buffer = b''
+
+
+async def stream_output(stream, tail: OutputTail):
+    """Feeds the output of ``asyncio`` ``stream`` into ``tail``."""
+    while chunk := await stream.read(tail.chunk_size):
+        tail.feed(chunk)
+    tail.flush()
+
+
 class Runner(abc.ABC):
     """Abstract implementation of a command runner.
 
@@ -49,10 +231,17 @@ class Runner(abc.ABC):
     where the commands are only logged, i.e. the are not evaluated, the config
     files should probably not be updated. This behaviour is controlled by
     setting the `write_config` attribute in child implementations.
+
+    The optional `pool` attribute holds a :class:`~isct.pool.ContainerPool`
+    of warm container instances that are reused across patients, while the
+    optional `cache` attribute holds a :class:`~isct.cache.ResultCache` of
+    the output of model evaluations.
     """
 
     def __init__(self):
         self.write_config = False
+        self.pool = None
+        self.cache = None
 
     def format(self, cmd):
         """Formatting for the command for logging."""
@@ -61,7 +250,8 @@ class Runner(abc.ABC):
         return cmd
 
     @abc.abstractmethod
-    def run(self, cmd, check: bool = True, shell: bool = False):
+    def run(self, cmd, check: bool = True, shell: bool = False,
+            invocation=None):
         """Run the provided command.
 
         Implements how the command should be evaluated.
@@ -71,6 +261,9 @@ class Runner(abc.ABC):
                  as a space-separated string of commands.
             check: If successfull evaluation of the command is enforced.
             shell: If `shell=True` is passed to `subprocess`.
+            invocation: The :class:`~isct.timing.Invocation` of the model
+                evaluated by the command, if any. Runners evaluating the
+                command mark its start and end to record its timing.
         """
 
         # FIXME: `shell = False` is not needed in all commands
@@ -85,13 +278,34 @@ class Runner(abc.ABC):
         """
         pass
 
+    def close(self):
+        """Release the resources held by the runner, if any.
+
+        Runners holding resources, such as the event loop of
+        :class:`~isct.runner.AsyncRunner`, release these once all commands
+        are evaluated. By default, the runner holds no resources.
+        """
+        pass
+
+    def map(self, func, iterable, weight=None):
+        """Yields ``func(item)`` for all items in ``iterable``.
+
+        By default, the items are evaluated sequentially and in order.
+        Concurrent runners, such as :class:`~isct.runner.PoolRunner`,
+        evaluate the items concurrently and yield the results in order of
+        completion. The optional ``weight`` returns the number of cores
+        required by an item, which concurrent runners use to avoid
+        oversubscribing their ``jobs`` cores.
+        """
+        yield from map(func, iterable)
+
 
 class Logger(Runner):
     """A runner implementation printing the commands to `stdout`."""
     def __init__(self):
         super().__init__()
 
-    def run(self, cmd, check=True, shell=False):
+    def run(self, cmd, check=True, shell=False, invocation=None):
         """Prints the commands to `stdout`."""
         msg = self.format(cmd)
         logging.info(msg)
@@ -101,22 +315,26 @@ class Logger(Runner):
 class LocalRunner(Runner):
     """A runner evaluating commands on the local machine.
 
-    The commands are evaluated using ``subprocess.run``. The commands and its
+    The commands are evaluated using ``subprocess.Popen``. The commands and its
     output are echoed into the log files and/or the console by providing the
-    command-line arguments ``--log LOGFILE`` or ``-v``.
+    command-line arguments ``--log LOGFILE`` or ``-v``. The output is streamed
+    into the logs line by line while it is produced, only the last ``tail``
+    lines are kept in memory to report on failures.
 
     >>> isct --log /tmp/isct.log trial run /path/to/trial/
     >>> isct -v trial run /path/to/trial/
     """
-    def __init__(self):
+    def __init__(self, tail: int = 100):
         super().__init__()
         self.write_config = True
+        self.tail = tail
 
-    def run(self, cmd, check: bool = True, shell: bool = False):
-        """Run commands locally by invoking ``subprocess.run``.
+    def run(self, cmd, check: bool = True, shell: bool = False,
+            invocation=None):
+        """Run commands locally by invoking ``subprocess.Popen``.
 
         The preferred approach is to provide the commands as a list of strings
-        that can be passed into ``subprocess.run`` directly, without having
+        that can be passed into ``subprocess.Popen`` directly, without having
         to invoke ``shell=True``. If there is no other way to evaluate the
         command on the local system, the optional boolean can be set.
 
@@ -125,37 +343,206 @@ class LocalRunner(Runner):
             check: Successfull outcome of the command ``cmd`` is asserted. On
                    failure an message is displayed.
             shell: If ``shell``: ``shell=True`` is passed into
-                   ``subprocess.run``. However, it is adviced to not run the
+                   ``subprocess.Popen``. However, it is adviced to not run the
                    commands with ``shell=True`` explicitly if it can be
                    avoided.
+            invocation: The invocation of the model evaluated by ``cmd``,
+                which records the timing of the command, if given.
         """
         msg = self.format(cmd)
         logging.info(msg)
 
-        try:
-            process = subprocess.run(cmd,
-                                     check=check,
-                                     shell=shell,
-                                     stdout=subprocess.PIPE,
-                                     stderr=subprocess.STDOUT,
-                                     env={**os.environ})
+        # The output is streamed into the logs while it is produced, rather
+        # than capturing the full output in memory.
+        tail = self.output_tail(invocation)
+        if invocation is not None:
+            invocation.started()
+        with subprocess.Popen(cmd,
+                              shell=shell,
+                              stdout=subprocess.PIPE,
+                              stderr=subprocess.STDOUT,
+                              env={**os.environ}) as process:
+            while chunk := process.stdout.read1(tail.chunk_size):
+                tail.feed(chunk)
+            tail.flush()
+
+            # the process is reaped here to obtain its resource usage, which
+            # is recorded together with the invocation's timing
+            if invocation is not None:
+                returncode, usage = wait_usage(process)
+                invocation.finished(returncode, usage=usage)
+
+        return self.report(msg, process.wait(), tail, check)
+
+    def output_tail(self, invocation=None):
+        """Returns the tail of a command's output.
+
+        The output of a command evaluating a model, i.e. with an
+        ``invocation``, is prefixed by the patient's directory, see
+        :attr:`~isct.timing.Invocation.prefix`.
+        """
+        prefix = invocation.prefix if invocation is not None else ''
+        return OutputTail(self.tail, prefix=prefix)
+
+    def report(self, msg, returncode: int, tail: OutputTail, check: bool):
+        """Reports failures of the command ``msg`` and returns its success.
+
+        When ``check`` is set, a nonzero ``returncode`` is reported to the
+        logs, including the captured ``tail`` of the output, and the console.
+        """
+        if returncode == 0 or not check:
+            return True
 
-        except subprocess.CalledProcessError as e:
-            msg = f'Command: `{msg}` failed with error: `{e}`.'
-            logging.critical(f'Subprocess failed: {e}.')
-            logging.critical(f'Captured output: {e.stdout.decode().rstrip()}')
+        msg = f'Command: `{msg}` failed with exit code: `{returncode}`.'
+        logging.critical(f'Subprocess failed: {msg}')
+        logging.critical(f'Captured output: {tail}')
 
-            # report to console
-            click.echo(click.style(msg, fg="red"))
+        # report to console
+        click.echo(click.style(msg, fg="red"))
+        return False
 
-            if check:
-                return False
 
-        # capture the output of the subcommand in the logs
-        for line in process.stdout.decode().split('\n'):
-            logging.info(line)
+class PoolRunner(LocalRunner):
+    """A runner evaluating patients concurrently in worker processes.
 
-        return True
+    The commands themselves are evaluated as in :class:`LocalRunner`, while
+    :meth:`PoolRunner.map` distributes the work, i.e. the patients, over a
+    pool of ``jobs`` worker processes. The work is submitted from a single
+    driver process, such that the trial's configuration is read only once.
+    The workers write their logs to separate files, see :func:`worker_logs`.
+
+    >>> isct trial run /path/to/trial/ --jobs 4
+    """
+    def __init__(self, jobs: int):
+        super().__init__()
+        self.jobs = jobs
+
+    def map(self, func, iterable, weight=None):
+        """Yields ``func(item)`` evaluated in the process pool.
+
+        The results are yielded in order of completion. Note, both ``func``
+        and the items must be picklable to be sent to the worker processes.
+        When the ``weight`` of the items is given, at most ``jobs`` cores are
+        in use at once.
+        """
+        capacity = self.jobs if weight else 2 * self.jobs
+        with concurrent.futures.ProcessPoolExecutor(
+                self.jobs, initializer=worker_logs) as executor:
+            yield from imap_unordered(executor, func, iterable, capacity,
+                                      weight)
+
+
+class AsyncRunner(LocalRunner):
+    """A runner evaluating commands concurrently through ``asyncio``.
+
+    The commands are started with ``asyncio.create_subprocess_exec`` on an
+    event loop running in a background thread, where a bounded semaphore
+    limits the number of commands in flight to ``jobs``. The output of the
+    commands is streamed into the logs while it is produced, only the last
+    ``tail`` lines are kept in memory to report on failures.
+
+    Similar to :class:`PoolRunner`, :meth:`AsyncRunner.map` evaluates the
+    patients concurrently, however, in threads of a single process. The
+    patients therefore do not have to be sent to worker processes.
+
+    >>> isct trial run /path/to/trial/ --jobs 16 --asyncio
+    """
+    def __init__(self, jobs: int = 1, tail: int = 100):
+        super().__init__(tail)
+        self.jobs = jobs
+        self._loop = None
+        self._thread = None
+        self._semaphore = None
+        self._lock = threading.Lock()
+
+    @property
+    def loop(self):
+        """The event loop evaluating the commands, started on first use."""
+        with self._lock:
+            if self._loop is None:
+                self._loop = asyncio.new_event_loop()
+                self._semaphore = None
+                self._thread = threading.Thread(target=self._loop.run_forever,
+                                                daemon=True)
+                self._thread.start()
+            return self._loop
+
+    def close(self):
+        """Stop the event loop, it is started again when commands are run.
+
+        The loop is closed once its thread exits, which releases the loop's
+        file descriptors.
+        """
+        with self._lock:
+            loop, self._loop = self._loop, None
+            thread, self._thread = self._thread, None
+
+        if loop is not None:
+            loop.call_soon_threadsafe(loop.stop)
+            thread.join()
+            loop.close()
+
+    async def run_async(self, cmd, check: bool = True, shell: bool = False,
+                        invocation=None):
+        """Evaluate the command as ``asyncio`` subprocess.
+
+        See :meth:`LocalRunner.run` for the description of the arguments.
+        """
+        # The semaphore is created within the loop it is used by.
+        if self._semaphore is None:
+            self._semaphore = asyncio.BoundedSemaphore(self.jobs)
+
+        msg = self.format(cmd)
+        tail = self.output_tail(invocation)
+
+        async with self._semaphore:
+            logging.info(msg)
+            if invocation is not None:
+                invocation.started()
+            kwargs = {
+                'stdout': asyncio.subprocess.PIPE,
+                'stderr': asyncio.subprocess.STDOUT,
+                'env': {**os.environ},
+            }
+            if shell:
+                process = await asyncio.create_subprocess_shell(msg, **kwargs)
+            else:
+                process = await asyncio.create_subprocess_exec(*cmd, **kwargs)
+
+            await stream_output(process.stdout, tail)
+            returncode = await process.wait()
+            if invocation is not None:
+                invocation.finished(returncode)
+
+        return self.report(msg, returncode, tail, check)
+
+    def run(self, cmd, check: bool = True, shell: bool = False,
+            invocation=None):
+        """Run the command on the event loop and wait for its completion.
+
+        This is safe to call from multiple threads concurrently: at most
+        ``jobs`` commands are evaluated at the same time.
+        """
+        future = asyncio.run_coroutine_threadsafe(
+            self.run_async(cmd, check=check, shell=shell,
+                           invocation=invocation), self.loop)
+        return future.result()
+
+    def map(self, func, iterable, weight=None):
+        """Yields ``func(item)`` evaluated concurrently in threads.
+
+        The results are yielded in order of completion. As the commands are
+        bounded by the semaphore, the threads spend their time waiting. When
+        the ``weight`` of the items is given, at most ``jobs`` cores are in
+        use at once.
+        """
+        capacity = self.jobs if weight else 2 * self.jobs
+        try:
+            with concurrent.futures.ThreadPoolExecutor(self.jobs) as executor:
+                yield from imap_unordered(executor, func, iterable, capacity,
+                                          weight)
+        finally:
+            self.close()
 
 
 class ParallelRunner(Runner):
@@ -170,8 +557,13 @@ class ParallelRunner(Runner):
     def __init__(self):
         super().__init__()
 
-    def run(self, cmd):
-        """Emit commands over ``stdout`` for ``GNU Parallel``."""
+    def run(self, cmd, check: bool = True, shell: bool = False,
+            invocation=None):
+        """Emit commands over ``stdout`` for ``GNU Parallel``.
+
+        The commands are not evaluated, hence the remaining arguments, see
+        :meth:`Runner.run`, are ignored.
+        """
         msg = self.format(cmd)
         logging.info(msg)
         sys.stdout.write(f'{msg}\n')
@@ -187,8 +579,9 @@ class QCGRunner(Runner):
     evaluated, where each command passed to ``run`` is appended to the job
     list.
 
-    Note: the ``LocalManager`` is only initialised on
-    :func:`isct.runner.QCGrunner.wait` and not immediately when the class is
+    Note: the ``LocalManager`` is only initialised when the first jobs are
+    submitted, i.e. on :func:`isct.runner.QCGRunner.run_iterations` or
+    :func:`isct.runner.QCGrunner.wait`, and not immediately when the class is
     initialised. Only when commands are to be evaluated, we really need the
     manager to be active, until then we delay the QCG service.
 
@@ -206,10 +599,62 @@ class QCGRunner(Runner):
         super().__init__()
         self.jobs = Jobs()
         self.manager = QCGManager
+        self.new_jobs = Jobs
+        self.active_manager = None
 
-    def run(self, cmd):
-        """Add the command to the ``QCG`` job queue."""
-        self.jobs.add(script=' '.join(cmd), numCores=1)
+    @staticmethod
+    def job_attributes(resources=None, name=None, after=None):
+        """Returns the ``QCG`` job attributes for the provided arguments.
+
+        Args:
+            resources (:class:`~isct.events.Resources`, optional): The
+                resources required by the job, defaults to one core.
+            name: The unique name of the job, required to depend on the job.
+            after: The names of the jobs to complete before this job starts.
+        """
+        attributes = {'numCores': resources.cores if resources else 1}
+        if resources and resources.walltime:
+            # QCG expects the walltime with units, rounded up to minutes
+            attributes['wt'] = f'{math.ceil(resources.walltime / 60)}m'
+        if name:
+            attributes['name'] = name
+        if after:
+            attributes['after'] = list(after)
+
+        return attributes
+
+    def run(self, cmd, check: bool = True, shell: bool = False,
+            invocation=None, *, resources=None, name=None, after=None):
+        """Add the command to the ``QCG`` job queue.
+
+        The command is evaluated by ``QCG`` later on, hence the arguments of
+        :meth:`Runner.run` are ignored. See :meth:`QCGRunner.job_attributes`
+        for the keyword-only arguments.
+        """
+        self.jobs.add(script=self.format(cmd),
+                      **self.job_attributes(resources, name, after))
+
+    def run_iterations(self, script, iterations: int, resources=None,
+                       name=None):
+        """Submit a single job evaluating ``script`` for ``iterations``.
+
+        In contrast to :meth:`QCGRunner.run`, the job is submitted to the
+        manager immediately, such that ``QCG`` starts evaluating the jobs
+        while further jobs are still being prepared. ``QCG`` substitutes the
+        iteration index, ranging from ``0`` to ``iterations - 1``, for
+        ``${it}`` in the ``script``. The ``resources`` apply to each iteration.
+        """
+        jobs = self.new_jobs()
+        jobs.add(script=script,
+                 iteration=iterations,
+                 **self.job_attributes(resources, name))
+        self.submit(jobs)
+
+    def submit(self, jobs):
+        """Submit ``jobs`` to the manager, which is started on first use."""
+        if self.active_manager is None:
+            self.active_manager = self.manager()
+        self.active_manager.submit(jobs)
 
     def wait(self):
         """Submit all jobs and wait until ``QCG`` has completed all jobs.
@@ -217,7 +662,13 @@ class QCGRunner(Runner):
         Note: the jobs are evaluated on all available resources detected by the
         ``qcg.pilotjob.api.manager.LocalManager``.
         """
-        manager = self.manager()
-        manager.submit(self.jobs)
-        manager.wait4all()
-        manager.finish()
+        if self.jobs.jobs():
+            self.submit(self.jobs)
+            self.jobs = self.new_jobs()
+
+        if self.active_manager is None:
+            return
+
+        self.active_manager.wait4all()
+        self.active_manager.finish()
+        self.active_manager = None
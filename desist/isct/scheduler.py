@@ -0,0 +1,139 @@
+"""Scheduling of patient simulations at the granularity of models.
+
+A :class:`~isct.patient.Patient` evaluates its simulation pipeline as a
+sequence of models, where each model depends on the output of its preceding
+models. When patients are the unit of work, e.g. in
+:class:`~isct.trial.PoolTrial`, a slow model of one patient can not overlap
+with a fast model of another patient once all workers are occupied by the
+same stage of their pipelines.
+
+The :class:`ModelScheduler` breaks the pipeline of each patient into one task
+per model. Within a patient, the task of a model is only submitted after the
+task of its preceding model completed, while the ready tasks of all patients
+are dispatched onto a shared pool of workers. The tasks are packed onto the
+available cores using the :class:`~isct.events.Resources` of the models.
+"""
+import collections
+import concurrent.futures
+import logging
+
+
+def run_model(patient, idx: int):
+    """Evaluate the ``idx``th model of ``patient`` and return its success."""
+    try:
+        patient.run_model(idx)
+    except Exception as err:
+        logging.critical(
+            f'Patient `{patient.dir}` failed in model {idx}: {err}')
+        return False
+
+    return True
+
+
+class ModelScheduler:
+    """Dispatches the models of many patients onto a pool of workers.
+
+    The workers are threads: the models are evaluated as commands through
+    the patient's :class:`~isct.runner.Runner`, where the workers merely wait
+    for the commands' completion. This requires the runner to be thread-safe,
+    e.g. :class:`~isct.runner.LocalRunner` or
+    :class:`~isct.runner.AsyncRunner`.
+
+    Ready models of patients already in progress take precedence over the
+    first model of new patients. This limits the number of patients that are
+    in progress at the same time, which keeps the amount of intermediate
+    simulation output bounded.
+
+    Each model occupies the number of cores declared in its
+    :class:`~isct.events.Resources`. The first ready model that fits onto
+    the free cores is dispatched, such that small models fill the cores left
+    idle by large models. A model requiring more than ``jobs`` cores is only
+    dispatched when all cores are free. At most ``jobs`` models are waiting
+    for free cores, such that the patients are still consumed lazily.
+    """
+    def __init__(self, jobs: int = 1):
+        """Initialise a scheduler using at most ``jobs`` cores at once.
+
+        Args:
+            jobs: The number of cores available to evaluate models on.
+        """
+        self.jobs = jobs
+
+    def cores(self, patient, idx: int):
+        """Returns the cores occupied by the ``idx``th model of ``patient``."""
+        return min(patient.events.resources(idx).cores, self.jobs)
+
+    def run(self, patients, resume=False):
+        """Yields ``(directory, success)`` for each completed patient.
+
+        The patients are consumed lazily from ``patients`` and are yielded in
+        order of completion. A patient is finalised, see
+        :meth:`~isct.patient.Patient.finalise`, once all its models succeed.
+        When a model fails, the patient's remaining models are not evaluated.
+        In either case, the patient's files are cleaned afterwards. With
+        ``resume``, the patients start at their first incomplete model, see
+        :meth:`~isct.patient.Patient.first_incomplete_model`.
+        """
+        patients = iter(patients)
+        ready = collections.deque()
+        pending = {}
+        free = self.jobs
+
+        with concurrent.futures.ThreadPoolExecutor(self.jobs) as executor:
+            while True:
+                # Fill the free cores, first with the ready models of patients
+                # in progress, then with the first model of the next patients.
+                while free > 0:
+                    task = next((t for t in ready if self.cores(*t) <= free),
+                                None)
+                    if task is not None:
+                        ready.remove(task)
+                    elif ready and not pending:
+                        task = ready.popleft()
+                    elif len(ready) < self.jobs and (
+                            patient := next(patients, None)) is not None:
+                        start = 0
+                        if resume:
+                            start = patient.first_incomplete_model()
+                        ready.append((patient, start))
+                        continue
+                    else:
+                        break
+
+                    patient, idx = task
+                    if idx >= patient['pipeline_length']:
+                        yield self.complete(patient, True)
+                        continue
+
+                    free -= self.cores(patient, idx)
+                    future = executor.submit(run_model, patient, idx)
+                    pending[future] = task
+
+                if not pending:
+                    break
+
+                done, _ = concurrent.futures.wait(
+                    pending, return_when=concurrent.futures.FIRST_COMPLETED)
+
+                for future in done:
+                    patient, idx = pending.pop(future)
+                    free += self.cores(patient, idx)
+                    success = future.result()
+                    if success and idx + 1 < patient['pipeline_length']:
+                        ready.append((patient, idx + 1))
+                    else:
+                        yield self.complete(patient, success)
+
+    @staticmethod
+    def complete(patient, success: bool):
+        """Finalise and clean ``patient`` once its pipeline is completed."""
+        try:
+            if success:
+                patient.finalise()
+        except Exception as err:
+            logging.critical(f'Patient `{patient.dir}` failed: {err}')
+            success = False
+        finally:
+            patient.clean()
+
+        return patient.dir, success
@@ -1,6 +1,7 @@
 """:class:`~isct.container.Container` implemementation for ``Singularity``."""
 import os
 import pathlib
+import shlex
 
 from .container import Container
 from .runner import Logger
@@ -32,6 +33,31 @@ class Singularity(Container):
         # to run multiple commands in the runner, `shell=True` is required
         return self.runner.run(cmd, check=True, shell=True)
 
+    @property
+    def image(self):
+        """The path to the container's image."""
+        return str(self.container)
+
+    @property
+    def flags(self):
+        """The flags to run the container with, see ``Singularity.run``."""
+        if int(os.environ.get("SINGULARITY_CONTAINALL", -1)) == 0:
+            return ''
+        return '--containall'
+
+    def digest(self):
+        """Returns an identifier of the Singularity image, or ``None``.
+
+        Hashing the contents of large images is expensive, instead the image
+        is identified by its path, size, and modification time.
+        """
+        try:
+            stat = self.container.stat()
+        except OSError:
+            return None
+
+        return f'{self.container}:{stat.st_size}:{stat.st_mtime_ns}'
+
     def exists(self):
         """Returns true if the Singularity container image exists."""
         cmd = f'test -e {str(self.container)}'
@@ -60,11 +86,31 @@ class Singularity(Container):
         For example, the variable can be set for a single invocation as:
 
         >>> SINGULARITY_CONTAINALL=0 desist patient run ...
+
+        When the runner holds a pool of warm instances, the command is
+        evaluated in one of the pool's instances instead, see
+        :class:`~isct.pool.ContainerPool`.
         """
+        if (pool := self.warm_pool()) is not None:
+            return pool.run(self, args)
 
-        flags = '--containall'
-        if int(os.environ.get("SINGULARITY_CONTAINALL", -1)) == 0:
-            flags = ''
+        cmd = f'singularity run {self.flags} {self.volumes} {self.container}'
+        return self.runner.run(f'{cmd} {args}'.split(), check=True,
+                               invocation=self.invocation)
+
+    def start(self, name):
+        """Start a Singularity instance named ``name``."""
+        cmd = (f'singularity instance start {self.flags} {self.volumes} '
+               f'{self.container} {name}')
+        return self.runner.run(cmd.split(), check=True)
+
+    def exec(self, name, args=''):
+        """Evaluate the run script in the instance named ``name``."""
+        cmd = ['singularity', 'run', f'instance://{name}', *shlex.split(args)]
+        return self.runner.run(cmd, check=True,
+                               invocation=self.invocation)
 
-        cmd = f'singularity run {flags} {self.volumes} {self.container} {args}'
+    def stop(self, name):
+        """Stop the Singularity instance named ``name``."""
+        cmd = f'singularity instance stop {name}'
         return self.runner.run(cmd.split(), check=True)
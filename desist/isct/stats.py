@@ -0,0 +1,205 @@
+"""Trial-wide runtime statistics of the patients' models.
+
+The runtime of the models is read for each patient from its timing records,
+see :mod:`~isct.timing`. For patients without timing records, e.g. evaluated
+by earlier versions, the invocations are reconstructed from the patient's log
+files, i.e. ``isct.log`` and its rotated backups ``isct.log.1`` up to
+``isct.log.5``, see :func:`log_timings`. The patients are parsed in parallel
+by a pool of worker processes.
+
+The statistics hold, for each model, the distribution of the runtime of its
+successful evaluations, the number of failures, and the core-hours spent,
+i.e. the runtime weighted by the model's cores, see
+:class:`~isct.events.Resources`. These are complemented by the totals of the
+trial and the patients with the longest total runtime.
+
+>>> desist trial stats /path/to/trial --format csv
+"""
+import collections
+import concurrent.futures
+import csv
+import io
+import itertools
+import pathlib
+import re
+
+from .patient import Patient, find_patient_config
+from .timing import distribution, read_timings, timing_path
+from .utilities import backup_count, log_file, parse_log_time
+
+invocation_pattern = re.compile(
+    r'(?:singularity|docker) (?:run|exec)\b.*\s(\d+) event\s*$')
+"""re.Pattern: Matches the container commands, capturing the model's index."""
+
+failure_pattern = re.compile(r'failed with exit code: `(-?\d+)`')
+"""re.Pattern: Matches the failures of commands, capturing the exit code."""
+
+
+def log_files(directory):
+    """Returns the log files in ``directory``, from the oldest backup on."""
+    directory = pathlib.Path(directory)
+    names = [f'{log_file}.{i}' for i in range(backup_count, 0, -1)]
+    paths = map(directory.joinpath, names + [log_file])
+    return [path for path in paths if path.is_file()]
+
+
+def log_timings(paths, patient):
+    """Yields the timing records reconstructed from the log files ``paths``.
+
+    The start of each invocation is the timestamp of its logged container
+    command, while its end is approximated by the timestamp of the last
+    logged line before the next invocation, or the end of the logs. The
+    invocation failed when a failure of a command is logged in between.
+    """
+    def record(idx, start, end, exit_code):
+        """Returns the timing record of an invocation, see `isct.timing`."""
+        events = patient.events
+        return {
+            'patient': patient.get('id'),
+            'event': (events.event(idx) or {}).get('event'),
+            'label': events.label(idx),
+            'model': idx,
+            'start': start.timestamp(),
+            'end': end.timestamp(),
+            'wall': (end - start).total_seconds(),
+            'exit_code': exit_code,
+        }
+
+    current, last, exit_code = None, None, 0
+    for path in paths:
+        with open(path, errors='replace') as infile:
+            for line in infile:
+                if (moment := parse_log_time(line)) is None:
+                    continue
+
+                if match := invocation_pattern.search(line):
+                    if current is not None:
+                        yield record(*current, last, exit_code)
+                    current, exit_code = (int(match[1]), moment), 0
+                elif match := failure_pattern.search(line):
+                    exit_code = int(match[1])
+                last = moment
+
+    if current is not None:
+        yield record(*current, last, exit_code)
+
+
+def patient_timings(directory):
+    """Returns the timing records of the patient in ``directory``.
+
+    The timing records are preferred over the log files, when present. The
+    records are annotated with the patient's directory and the number of
+    cores of each model. This is a module-level function, such that it can be
+    sent to worker processes.
+    """
+    directory = pathlib.Path(directory)
+    patient = Patient.read(find_patient_config(directory))
+
+    if timing_path(directory).exists():
+        records = list(read_timings(directory))
+    else:
+        records = list(log_timings(log_files(directory), patient))
+
+    length = patient['pipeline_length']
+    for record in records:
+        record['directory'] = directory.name
+        idx = record.get('model')
+        valid = isinstance(idx, int) and 0 <= idx < length
+        record['cores'] = patient.events.resources(idx).cores if valid else 1
+
+    return records
+
+
+def trial_timings(directories, jobs: int = 1):
+    """Yields the timing records of the patients in ``directories``.
+
+    With ``jobs``, the patients are parsed by as many worker processes.
+    """
+    if jobs <= 1:
+        yield from itertools.chain.from_iterable(
+            map(patient_timings, directories))
+        return
+
+    with concurrent.futures.ProcessPoolExecutor(jobs) as executor:
+        results = executor.map(patient_timings, directories, chunksize=16)
+        yield from itertools.chain.from_iterable(results)
+
+
+def trial_stats(records, top: int = 10):
+    """Returns the runtime statistics of the timing ``records``.
+
+    Returns a dictionary holding the statistics of each model, see
+    :func:`~isct.timing.distribution`, complemented by their number of
+    ``failures`` and ``core_hours``, the totals of the trial, and the ``top``
+    slowest patients by their total runtime.
+    """
+    models = {}
+    patients = collections.Counter()
+    for record in records:
+        wall = float(record.get('wall') or 0)
+        model = models.setdefault(record.get('label'), {
+            'runtimes': [], 'failures': 0, 'core_hours': 0.0})
+        # the core-hours of batched invocations are shared by the patients
+        cores = record.get('cores', 1) / record.get('batch', 1)
+        model['core_hours'] += wall * cores / 3600
+        patients[record.get('directory')] += wall
+
+        if record.get('exit_code') == 0:
+            model['runtimes'].append(wall)
+        else:
+            model['failures'] += 1
+
+    stats = {
+        str(label): {
+            **distribution(model['runtimes']),
+            'failures': model['failures'],
+            'core_hours': model['core_hours'],
+        }
+        for label, model in models.items()
+    }
+
+    return {
+        'models': stats,
+        'core_hours': sum(model['core_hours'] for model in stats.values()),
+        'failures': sum(model['failures'] for model in stats.values()),
+        'slowest': [{'patient': patient, 'wall': wall}
+                    for (patient, wall) in patients.most_common(top)],
+    }
+
+
+stats_columns = ['count', 'failures', 'mean', 'median', 'p95', 'max',
+                 'core_hours']
+"""list: The statistics reported for each model."""
+
+
+def format_csv(stats):
+    """Returns the statistics of the models as CSV table."""
+    output = io.StringIO()
+    writer = csv.writer(output, lineterminator='\n')
+    writer.writerow(['model'] + stats_columns)
+    for label, model in sorted(stats['models'].items()):
+        writer.writerow([label] + [model.get(c, '') for c in stats_columns])
+    return output.getvalue()
+
+
+def format_text(stats):
+    """Returns the statistics as human readable tables."""
+    def cell(value):
+        """Formats numbers with a single decimal."""
+        if isinstance(value, float):
+            return f'{value:>12.1f}'
+        return f'{value:>12}'
+
+    header = ''.join(f'{column.capitalize():>12}' for column in stats_columns)
+    lines = [f'{"Model":<32}{header}']
+    for label, model in sorted(stats['models'].items()):
+        values = ''.join(cell(model.get(c, '-')) for c in stats_columns)
+        lines.append(f'{label:<32}{values}')
+
+    lines += ['', f'Total core-hours: {stats["core_hours"]:.2f}',
+              f'Total failures: {stats["failures"]}', '',
+              f'{"Slowest patients":<32}{"Runtime (s)":>12}']
+    for patient in stats['slowest']:
+        lines.append(f'{str(patient["patient"]):<32}{patient["wall"]:>12.1f}')
+
+    return '\n'.join(lines)
@@ -0,0 +1,276 @@
+"""Timing records of the container invocations of the patients.
+
+Each container invocation evaluating a model appends a record to
+``timings.jsonl`` in the directory of the evaluated patient, see
+:class:`Invocation`. The records are stored as JSON lines, where each line
+holds:
+
+- ``patient``: the patient's ``id``;
+- ``event``, ``label``, ``model``: the event, label, and simulation index of
+  the evaluated model;
+- ``queued``, ``start``, ``end``: the time (in seconds since the epoch) at
+  which the invocation was requested, at which the container was started, and
+  at which it terminated;
+- ``wall``: the runtime of the container in seconds;
+- ``exit_code``: the exit code of the container;
+- ``batch``: the number of patients evaluated by the invocation, which share
+  the same runtime and resource usage;
+- ``host``, ``pid``: the host and process invoking the container;
+- ``slot``: the job slot of the scheduler evaluating the ``desist patient
+  run`` command, if any, i.e. ``PARALLEL_JOBSLOT`` for ``GNU Parallel`` or
+  ``QCG_PM_CPU_SET`` for ``QCG``, see :func:`scheduler_slot`;
+- ``cpu_user``, ``cpu_system``, ``max_rss``: the CPU time in seconds and the
+  peak resident memory in megabytes of the container, if known;
+- ``read_bytes``, ``write_bytes``: the bytes read from and written to
+  storage by the container, if known (Linux only).
+
+The resource usage is only known for containers that run as child processes
+of the runner, i.e. Singularity. For Docker, the usage is not recorded, as the
+container is a child of the Docker daemon rather than of the ``docker``
+client evaluated by the runner, see :attr:`Invocation.record_usage`. The usage
+is not recorded by :class:`~isct.runner.AsyncRunner` either, as its processes
+are reaped by ``asyncio``.
+
+The records are written by the runners that evaluate the commands, such as
+:class:`~isct.runner.LocalRunner`, where the time spent waiting for a slot,
+e.g. in :class:`~isct.runner.AsyncRunner`, is not part of the runtime. Runners
+that only emit commands, e.g. for ``GNU Parallel`` or ``QCG``, do not record
+the invocations: the ``desist patient run`` commands they emit record these.
+
+>>> desist time /path/to/trial/patient_00000
+"""
+import datetime
+import json
+import logging
+import os
+import pathlib
+import socket
+import time
+
+timing_file = 'timings.jsonl'
+"""str: Filename of the timing records inside the patient directory."""
+
+
+slot_variables = ('PARALLEL_JOBSLOT', 'QCG_PM_CPU_SET')
+"""tuple: The environment variables holding the scheduler's job slot."""
+
+
+def scheduler_slot():
+    """Returns the job slot of the scheduler evaluating this process, if any.
+
+    ``GNU Parallel`` and ``QCG`` evaluate each ``desist patient run`` command
+    in a process of its own, where the job slot, or the cores assigned to the
+    job, identify the scheduler's worker evaluating the command.
+    """
+    return next((os.environ[name] for name in slot_variables
+                 if os.environ.get(name)), None)
+
+
+class Invocation:
+    """The timing of a container invocation evaluating a model.
+
+    The invocation is attached to the container evaluating the ``idx``th model
+    of the ``patients``, see :attr:`~isct.container.Container.invocation`,
+    which is forwarded to the runner. The runner marks the start and end of
+    the container's evaluation, after which a record is appended for each of
+    the patients, e.g. when the patients are evaluated in a batch. The
+    container's runtime and exit code are available as :attr:`wall` and
+    :attr:`exit_code` afterwards, which are ``None`` when the container was
+    not evaluated, e.g. when its output was restored from a cache, see
+    :class:`~isct.cache.ResultCache`.
+    """
+    def __init__(self, patients, idx: int):
+        """Initialise the invocation of the ``idx``th model of ``patients``."""
+        self.patients = list(patients)
+        self.idx = idx
+        self.queued = time.time()
+        self.start = None
+        self.clock = None
+        self.wall = None
+        self.exit_code = None
+        self.record_usage = True
+
+    @property
+    def prefix(self):
+        """Identifies the patients in the output of the invocation's command.
+
+        Concurrently evaluated commands interleave their output in the logs,
+        which is prefixed by the patient's directory, e.g. ``[patient_000]``,
+        or the first patient's directory and the batch size.
+        """
+        name = self.patients[0].dir.name if self.patients else ''
+        if len(self.patients) > 1:
+            name = f'{name} +{len(self.patients) - 1}'
+        return f'[{name}] '
+
+    def started(self):
+        """Marks the start of the container's evaluation."""
+        self.start = time.time()
+        self.clock = time.monotonic()
+
+    def finished(self, exit_code: int, usage=None):
+        """Marks the end of the evaluation and appends the records.
+
+        The resource ``usage`` of the container, if known, is included in
+        the records, see :func:`~isct.runner.wait_usage`, unless the usage
+        measured by the runner is not the container's, i.e. when
+        :attr:`record_usage` is false. For invocations evaluating multiple
+        patients, each record holds the usage of the whole invocation and
+        the ``batch`` size.
+        """
+        if self.start is None:
+            self.started()
+
+        end, wall = time.time(), time.monotonic() - self.clock
+        self.wall, self.exit_code = wall, exit_code
+        slot = scheduler_slot()
+        for patient in self.patients:
+            events = patient.events
+            record = {
+                'patient': patient.get('id'),
+                'event': (events.event(self.idx) or {}).get('event'),
+                'label': events.label(self.idx),
+                'model': self.idx,
+                'queued': round(self.queued, 6),
+                'start': round(self.start, 6),
+                'end': round(end, 6),
+                'wall': round(wall, 6),
+                'exit_code': exit_code,
+                'batch': len(self.patients),
+                'host': socket.gethostname(),
+                'pid': os.getpid(),
+                **({'slot': slot} if slot is not None else {}),
+                **(usage if usage and self.record_usage else {}),
+            }
+            append(patient.dir.joinpath(timing_file), record)
+
+
+def append(path, record):
+    """Append ``record`` to the JSON lines at ``path`` in a single write."""
+    try:
+        with open(path, 'a') as outfile:
+            outfile.write(json.dumps(record, default=str) + '\n')
+    except OSError as err:
+        logging.warning(f'Failed to write timing record `{path}`: {err}')
+
+
+def timing_path(path):
+    """Returns the timing records of the patient directory ``path``.
+
+    Paths that are not a directory are assumed to be the records themselves.
+    """
+    path = pathlib.Path(path)
+    return path.joinpath(timing_file) if path.is_dir() else path
+
+
+def read_timings(path):
+    """Yields the timing records at ``path``, see :func:`timing_path`.
+
+    Lines that cannot be parsed, e.g. due to an interrupted write, are
+    skipped.
+    """
+    with open(timing_path(path)) as infile:
+        for line in infile:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue
+            if isinstance(record, dict) and 'wall' in record:
+                yield record
+
+
+def format_timings(records):
+    """Returns a newline-separated string of the timing records.
+
+    Each line holds the patient, event, label, start time, runtime, and exit
+    code of an invocation, in order of their start.
+    """
+    def timestamp(seconds):
+        """Formats seconds since the epoch as local time."""
+        moment = datetime.datetime.fromtimestamp(seconds)
+        return moment.isoformat(sep=' ', timespec='seconds')
+
+    lines = ['Patient\tEvent\tModel\tStart\tElapsed (HH:MM:SS)\tExit code']
+    for record in sorted(records, key=lambda r: r.get('start') or 0):
+        elapsed = datetime.timedelta(seconds=round(record['wall']))
+        lines.append('\t'.join(map(str, [
+            record.get('patient'),
+            record.get('event'),
+            record.get('label'),
+            timestamp(record.get('start') or 0),
+            elapsed,
+            record.get('exit_code'),
+        ])))
+
+    return '\n'.join(lines)
+
+
+resource_metrics = {
+    'wall': ('wall (s)', 1),
+    'cpu': ('cpu (s)', 1),
+    'max_rss': ('max_rss (MB)', 1),
+    'read_bytes': ('read (MB)', 2**20),
+    'write_bytes': ('write (MB)', 2**20),
+}
+"""dict: The reported resources, mapped to their name and unit in bytes."""
+
+
+def percentile(values, q: float):
+    """Returns the ``q``th percentile of the sorted ``values``.
+
+    The percentile is determined through the nearest-rank method, i.e. the
+    smallest value such that at least ``q`` percent of the values is less or
+    equal to it.
+    """
+    rank = max(1, -(-len(values) * q // 100))
+    return values[int(rank) - 1]
+
+
+def distribution(values):
+    """Returns the count, mean, median, 95th percentile, and maximum."""
+    values = sorted(values)
+    if not values:
+        return {'count': 0}
+
+    return {
+        'count': len(values),
+        'mean': sum(values) / len(values),
+        'median': percentile(values, 50),
+        'p95': percentile(values, 95),
+        'max': values[-1],
+    }
+
+
+def resource_distributions(records):
+    """Returns the distribution of the resources used by each model.
+
+    The successful invocations are grouped by the models' labels, where the
+    distribution of each of the :data:`resource_metrics` is determined over
+    the invocations recording the metric. The CPU time combines the user and
+    system time. Invocations evaluating a batch of patients are counted
+    once, rather than once for each of the patients' records.
+    """
+    usage, batches = {}, set()
+    for record in records:
+        if record.get('exit_code') != 0:
+            continue
+
+        if record.get('batch', 1) > 1:
+            key = tuple(record.get(k) for k in
+                        ('host', 'pid', 'model', 'label', 'start'))
+            if key in batches:
+                continue
+            batches.add(key)
+
+        if 'cpu_user' in record:
+            record = {**record,
+                      'cpu': record['cpu_user'] + record.get('cpu_system', 0)}
+
+        metrics = usage.setdefault(record.get('label'), {})
+        for metric, (_, unit) in resource_metrics.items():
+            if (value := record.get(metric)) is not None:
+                metrics.setdefault(metric, []).append(value / unit)
+
+    return {label: {metric: distribution(values)
+                    for metric, values in metrics.items()}
+            for label, metrics in usage.items()}
@@ -0,0 +1,163 @@
+"""Timeline of a trial's model invocations in the trace event format.
+
+The timing records of the patients, see :mod:`~isct.timing`, are converted
+into the trace event format, which is shown as a timeline by Perfetto
+(https://ui.perfetto.dev) or ``chrome://tracing``. This shows whether the
+workers of a parallel run are idle, or are waiting for a few slow patients.
+
+Each host is shown as a process, holding a track for each of the processes
+invoking the containers on that host, i.e. the workers. Workers evaluating
+multiple containers concurrently, e.g. :class:`~isct.runner.AsyncRunner`, are
+split into a track for each of their slots. Each invocation is shown as a
+slice on its worker's track, where invocations evaluating a batch of
+patients are shown as a single slice. The number of running and queued
+invocations throughout the trial are shown as counter tracks.
+
+As the records are written by the processes invoking the containers, this
+includes the local, pool, and asynchronous runners, as well as the ``desist
+patient run`` commands emitted for ``GNU Parallel`` and ``QCG``. These
+commands each run in a process of their own, where the tracks follow the
+scheduler's job slot recorded with the invocations instead, see
+:func:`~isct.timing.scheduler_slot`. Without it, e.g. for older records, the
+tracks are inferred from the processes' timings.
+
+>>> desist trial trace /path/to/trial -o trace.json
+"""
+import heapq
+import json
+
+trial_pid = 0
+"""int: The trace's process holding the counter tracks of the trial."""
+
+
+def invocations(records):
+    """Returns the invocations of the timing ``records``, sorted by start.
+
+    The records of invocations evaluating a batch of patients are merged into
+    a single invocation, holding the ``patients`` evaluated.
+    """
+    merged = {}
+    for record in records:
+        if record.get('start') is None:
+            continue
+        key = tuple(record.get(k) for k in
+                    ('host', 'pid', 'model', 'label', 'start', 'end'))
+        invocation = merged.setdefault(key, {**record, 'patients': []})
+        invocation['patients'].append(record.get('patient'))
+
+    return sorted(merged.values(), key=lambda r: (r['start'], r['end']))
+
+
+def worker(invocation):
+    """Returns the worker of the invocation, i.e. its host and process.
+
+    For invocations recording the scheduler's job ``slot``, the worker is the
+    slot on the host instead, as each invocation runs in a new process.
+    """
+    if (slot := invocation.get('slot')) is not None:
+        return invocation.get('host'), None, str(slot)
+    return invocation.get('host'), invocation.get('pid'), None
+
+
+def assign_slots(invocations):
+    """Returns the slot of each invocation within its worker.
+
+    The invocations of each worker, see :func:`worker`, are assigned to the
+    first free slot, such that invocations in the same slot do not overlap.
+    The ``invocations`` are expected in order of their start.
+    """
+    workers, slots = {}, []
+    for invocation in invocations:
+        free, count = workers.setdefault(worker(invocation), ([], [0]))
+        if free and free[0][0] <= invocation['start']:
+            slot = heapq.heappop(free)[1]
+        else:
+            slot, count[0] = count[0], count[0] + 1
+        heapq.heappush(free, (invocation['end'], slot))
+        slots.append(slot)
+
+    return slots
+
+
+def counter_events(name, intervals, origin):
+    """Returns the counter events of the number of concurrent ``intervals``."""
+    changes = [(start, 1) for start, _ in intervals]
+    changes = sorted(changes + [(end, -1) for _, end in intervals])
+
+    events, value = [], 0
+    for idx, (moment, change) in enumerate(changes):
+        value += change
+        if idx + 1 < len(changes) and changes[idx + 1][0] == moment:
+            continue
+        events.append({'name': name, 'ph': 'C', 'pid': trial_pid,
+                       'ts': (moment - origin) * 1e6,
+                       'args': {name: value}})
+    return events
+
+
+def trace_events(records):
+    """Returns the trace events of the timing ``records``.
+
+    The timestamps are in microseconds since the first invocation was queued
+    or started.
+    """
+    calls = invocations(records)
+    if not calls:
+        return []
+
+    origin = min(min(c.get('queued') or c['start'], c['start']) for c in calls)
+
+    def metadata(name, pid, tid, value):
+        """Returns the metadata event naming a process or thread."""
+        return {'name': name, 'ph': 'M', 'pid': pid, 'tid': tid,
+                'args': {'name': value}}
+
+    events = [metadata('process_name', trial_pid, 0, 'trial')]
+    hosts, tracks = {}, {}
+    for call, slot in zip(calls, assign_slots(calls)):
+        host, pid, job = worker(call)
+        if host not in hosts:
+            hosts[host] = len(hosts) + 1
+            events.append(metadata('process_name', hosts[host], 0,
+                                   str(host or 'unknown')))
+
+        if (track := (host, pid, job, slot)) not in tracks:
+            tracks[track] = len(tracks) + 1
+            name = f'worker {pid}' if pid is not None else 'worker'
+            if job is not None:
+                name = f'job slot {job}'
+            events.append(metadata('thread_name', hosts[host], tracks[track],
+                                   f'{name} slot {slot}' if slot else name))
+
+        queued = call.get('queued') or call['start']
+        events.append({
+            'name': str(call.get('label')),
+            'cat': 'model',
+            'ph': 'X',
+            'pid': hosts[host],
+            'tid': tracks[track],
+            'ts': (call['start'] - origin) * 1e6,
+            'dur': (call['end'] - call['start']) * 1e6,
+            'args': {
+                'patients': call['patients'],
+                'event': call.get('event'),
+                'model': call.get('model'),
+                'exit_code': call.get('exit_code'),
+                'queued (s)': call['start'] - queued,
+                **{k: call[k] for k in ('cpu_user', 'cpu_system', 'max_rss')
+                   if k in call},
+            },
+        })
+
+    events += counter_events(
+        'running', [(c['start'], c['end']) for c in calls], origin)
+    events += counter_events(
+        'queued', [(c.get('queued') or c['start'], c['start'])
+                   for c in calls], origin)
+    return events
+
+
+def write_trace(outfile, records):
+    """Writes the trace of the timing ``records`` to the file ``outfile``."""
+    json.dump({'traceEvents': trace_events(records),
+               'displayTimeUnit': 'ms'}, outfile)
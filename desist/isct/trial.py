@@ -1,33 +1,57 @@
 """Trial configuration class.
 
-This module contains two classes to represent an *in silico* trial of virtual
-patients: :class:`Trial` and :class:`ParallelTrial`. Fundamentally, these
-classes are a ``dict`` containing the configuration data for a *in silico*
-trial. The trials are layed out as a single trial directory with subdirectories
-for each virtual patient (see :class:`~isct.patient.Patient`). The trial's
-configuration is stored at :attr:`isct.trial.trial_config` in YAML format.
+This module contains classes to represent an *in silico* trial of virtual
+patients: :class:`Trial`, :class:`PoolTrial`, and :class:`ParallelTrial`.
+Fundamentally, these classes are a ``dict`` containing the configuration data
+for a *in silico* trial. The trials are layed out as a single trial directory
+with subdirectories for each virtual patient (see
+:class:`~isct.patient.Patient`). The trial's configuration is stored at
+:attr:`isct.trial.trial_config` in YAML format. The patient configurations are
+stored in YAML format by default, or in the format set by the ``config-format``
+key of the trial.
 
 :class:`Trial` provides routines to create :meth:`Trial.create` and run
 :meth:`Trial.run` trials. For parallel evaluation of the patient simulation
 pipelines :class:`ParallelTrial` provides functionality pipe the required
-commands over ``stdout`` for evalation using `GNU Parallel`_.
+commands over ``stdout`` for evalation using `GNU Parallel`_, while
+:class:`PoolTrial` evaluates the patients in a pool of worker processes without
+any external dependencies. :class:`ModelTrial` interleaves the models of
+different patients.
 
 .. _GNU Parallel:
     https://www.gnu.org/software/parallel/
 """
 
+import functools
+import itertools
+import logging
 import pathlib
 import os
+import shlex
 
-from .patient import Patient, LowStoragePatient, patient_config
+from .cache import ResultCache
+from .patient import Patient, LowStoragePatient, patient_configs
 from .container import create_container
 from .config import Config
-from .runner import LocalRunner, Logger
-from .utilities import CleanFiles, is_bind_path
+from .events import Events, Resources
+from .history import RuntimeHistory
+from .index import TrialIndex, index_dir
+from .runner import LocalRunner, Logger, QCGRunner
+from .scheduler import ModelScheduler
+from .timing import Invocation
+from .utilities import CleanFiles, is_bind_path, log_file, prefetch
+from .utilities import status_file
+from .utilities import config_formats, find_config
 
 trial_config = 'trial.yml'
 """str: Trial configuration filename and suffix."""
 
+trial_configs = [f'trial{sfx}' for (sfx, _, _) in config_formats.values()]
+"""list: Candidate trial configuration filenames, in order of precedence."""
+
+orders = ('sorted', 'longest-first')
+"""tuple: The orders in which the patients can be evaluated."""
+
 trial_path = pathlib.Path('/trial')
 """pathlib.Path: Trial directory inside the containerised environment.
 
@@ -41,6 +65,166 @@ virtual_patient_model = 'virtual-patient-generation'
 trial_outcome_model = 'in-silico-trial-outcome'
 
 
+def find_trial_config(directory):
+    """Returns the path of the trial configuration file in ``directory``.
+
+    The candidates in :data:`trial_configs` are considered in order, which
+    defaults to ``trial.yml`` when no configuration file is present.
+    """
+    return find_config(directory, trial_configs)
+
+
+def run_patient(patient, resume=False):
+    """Run the simulation pipeline of a single patient.
+
+    Returns a tuple of the patient's directory and a boolean indicating if all
+    simulations succeeded. This is a module-level function, such that it can
+    be sent to worker processes, see :class:`~isct.trial.PoolTrial`. With
+    ``resume``, the pipeline resumes at the patient's first incomplete model.
+    """
+    try:
+        patient.run(resume=resume)
+    except Exception as err:
+        # any error, e.g. a missing container runtime or an invalid patient
+        # configuration, only fails this patient rather than the whole trial
+        logging.critical(f'Patient `{patient.dir}` failed: {err}')
+        return patient.dir, False
+
+    return patient.dir, True
+
+
+def patient_cores(patient):
+    """Returns the peak number of cores required by ``patient``."""
+    return patient.events.peak_resources().cores
+
+
+def batch_cores(patients):
+    """Returns the peak number of cores required by any of ``patients``."""
+    return max(map(patient_cores, patients), default=1)
+
+
+def batched(iterable, size: int):
+    """Yields lists of at most ``size`` consecutive items of ``iterable``."""
+    iterable = iter(iterable)
+    while batch := list(itertools.islice(iterable, size)):
+        yield batch
+
+
+def run_model_batch(patients, idx: int):
+    """Evaluate the ``idx``th model for all ``patients`` at once.
+
+    A single container is invoked for the patients, where the trial directory
+    is bound to :data:`trial_path` and all patient configurations are passed
+    to the container's event handler, see
+    :func:`~eventhandler.eventhandler.event_handler`. The patients are assumed
+    to be part of the same trial. A single patient is evaluated through
+    :meth:`~isct.patient.Patient.run_model`, which raises on failure.
+
+    The event handler writes the exit code of each patient to its directory,
+    see :data:`~isct.utilities.status_file`, such that only the patients
+    that failed are marked failed. Without these, e.g. when the container
+    fails to start, the patients fail together with the container.
+
+    Returns the list of patients that failed the model.
+    """
+    first, *others = patients
+    if not others:
+        first.run_model(idx)
+        return []
+
+    # remove the exit codes of earlier evaluations
+    status = {p.dir: p.dir.joinpath(status_file) for p in patients}
+    for path in status.values():
+        if path.exists():
+            path.unlink()
+
+    container = create_container(f'{first.events.label(idx)}',
+                                 container_path=first.get('container-path'),
+                                 runner=first.runner)
+    container.bind(first.dir.parent, trial_path)
+    container.invocation = Invocation(patients, idx)
+
+    paths = [trial_path.joinpath(p.dir.name, p.path.name) for p in patients]
+    args = [f'--patient {path}' for path in paths[1:]]
+    success = container.run(args=' '.join(args + [f'{paths[0]} {idx} event']))
+
+    # the runtime of the container is shared evenly by the patients
+    duration = container.invocation.wall
+    if duration is not None:
+        duration /= len(patients)
+    failed = []
+    for patient in patients:
+        # see `Patient.run_model`: only `False` indicates failures
+        completed = success is not False
+        exit_code = container.invocation.exit_code
+        if (path := status[patient.dir]).exists():
+            exit_code = int(path.read_text())
+            completed = exit_code == 0
+            path.unlink()
+        if not completed:
+            failed.append(patient)
+        patient.record_model(idx, completed, duration=duration,
+                             exit_code=exit_code)
+
+    return failed
+
+
+def run_batch(patients, resume=False):
+    """Run the simulation pipelines of a batch of patients.
+
+    The models are evaluated in order of the pipeline for all patients, where
+    models with a ``batch`` size (see :meth:`~isct.events.Events.batch`) are
+    evaluated for that many patients per container invocation. Patients
+    failing a model are not evaluated any further, the remaining patients are
+    finalised after the pipeline's last model. This is a module-level
+    function, such that it can be sent to worker processes. With ``resume``,
+    each patient resumes at its first incomplete model.
+
+    Returns a list of tuples of the patients' directories and their success.
+    """
+    patients = list(patients)
+    success = {patient.dir: True for patient in patients}
+    start = {p.dir: p.first_incomplete_model() if resume else 0
+             for p in patients}
+    length = max((p['pipeline_length'] for p in patients), default=0)
+
+    for idx in range(length):
+        # only batch patients evaluating the same model at this index
+        models = {}
+        for patient in patients:
+            if not success[patient.dir] or idx < start[patient.dir]:
+                continue
+            if idx < patient['pipeline_length']:
+                label = patient.events.label(idx)
+                models.setdefault(label, []).append(patient)
+
+        for group in models.values():
+            size = min(patient.events.batch(idx) for patient in group)
+            for batch in batched(group, size):
+                try:
+                    failed = run_model_batch(batch, idx)
+                except Exception as err:
+                    failed, message = batch, err
+                else:
+                    message = f'model {idx} failed'
+                if failed:
+                    names = ', '.join(str(p.dir) for p in failed)
+                    logging.critical(f'Patients `{names}` failed: {message}')
+                    success.update((patient.dir, False) for patient in failed)
+
+    for patient in patients:
+        try:
+            if success[patient.dir]:
+                patient.finalise()
+        except Exception as err:
+            logging.critical(f'Patient `{patient.dir}` failed: {err}')
+            success[patient.dir] = False
+        finally:
+            patient.clean()
+
+    return list(success.items())
+
+
 class Trial(Config):
     """Representation of an *in silico* trial."""
     def __init__(
@@ -83,17 +267,25 @@ class Trial(Config):
         # store the behaviour to keep/clean files after patient simulations
         self.clean_files = clean_files
 
+        # the patient index is read lazily on first access of `self.index`
+        self._index = None
+
     def __iter__(self):
         """Iterable over the patients in the trial.
 
         The iterator of `Trial` yields a patient instance for each patient
         present in the trial. The patients are yielded in sorted order, where
         the sort is based on their directory.
+
+        When :attr:`~isct.trial.Trial.prefetch` is set, the patient
+        configurations are read ahead of the consumer in a small thread pool.
         """
-        for path in sorted(list(self.patients)):
-            config_path = path.joinpath(patient_config)
-            patient = Patient.read(config_path, runner=self.runner)
+        def read(path):
+            """Read the patient configuration file at ``path``."""
+            return Patient.read(path, runner=self.runner)
 
+        configs = sorted(self.patient_configs)
+        for patient in prefetch(read, configs, self.prefetch):
             # Insert the `container-path` directory from the trial config file
             # into the patient configuration to propagate the container
             # directory into the patient instance.
@@ -107,10 +299,10 @@ class Trial(Config):
     def __len__(self):
         """Returns the number of virtual patients considered in the trial.
 
-        Counts the number of patients by exhausting the
-        :meth:`~isct.trial.Trial.patients` generator.
+        Counts the number of patients present in the refreshed
+        :attr:`~isct.trial.Trial.index`.
         """
-        return len(list(self.patients))
+        return len(self.index)
 
     @classmethod
     def read(cls, path, runner=Logger(), clean_files=CleanFiles.NONE):
@@ -119,13 +311,18 @@ class Trial(Config):
         First the basic :class:`~isct.config.Config` is initialised, afterwhich
         a :class:`Trial` instance is created from the discovered parameters.
         """
+        path = pathlib.Path(path)
         config = super().read(path)
-        return cls(path.parent,
-                   sample_size=config.get('sample_size', 0),
-                   random_seed=config.get('random_seed', 0),
-                   config=dict(config),
-                   runner=runner,
-                   clean_files=clean_files)
+        trial = cls(path.parent,
+                    sample_size=config.get('sample_size', 0),
+                    random_seed=config.get('random_seed', 0),
+                    config=dict(config),
+                    runner=runner,
+                    clean_files=clean_files)
+
+        # preserve the filename, e.g. when reading from `trial.json`
+        trial.path = path
+        return trial
 
     @property
     def container_path(self):
@@ -151,32 +348,143 @@ class Trial(Config):
     def container_path(self, path):
         self['container-path'] = str(path)
 
+    @property
+    def prefetch(self):
+        """The number of patient configurations read ahead while iterating.
+
+        Reading patient configurations one at a time on network file systems
+        is dominated by latency. The ``prefetch`` key in the trial's
+        configuration sets the number of patient configurations that are read
+        concurrently ahead of the consumer. By default, no patients are read
+        ahead.
+        """
+        return int(self.get('prefetch', 0) or 0)
+
+    @prefetch.setter
+    def prefetch(self, depth: int):
+        self['prefetch'] = int(depth)
+
+    @property
+    def order(self):
+        """The order in which the patients are evaluated.
+
+        By default, the patients are evaluated in ``sorted`` order of their
+        directories. With ``longest-first``, the patients are evaluated in
+        descending order of their expected runtime, see
+        :class:`~isct.history.RuntimeHistory`, such that the slowest patients
+        do not delay the completion of the trial when started last. The order
+        is set by the ``order`` key in the trial's configuration.
+        """
+        return self.get('order') or orders[0]
+
+    @order.setter
+    def order(self, order: str):
+        if order not in orders:
+            raise ValueError(f'Invalid order `{order}`, expected: {orders}.')
+        self['order'] = order
+
+    @property
+    def runtime_keys(self):
+        """The patient parameters the expected runtime is regressed on.
+
+        Set by the ``runtime_keys`` key in the trial's configuration. By
+        default, the expected runtime is the mean runtime of each model.
+        """
+        return list(self.get('runtime_keys') or [])
+
+    @runtime_keys.setter
+    def runtime_keys(self, keys):
+        self['runtime_keys'] = list(keys)
+
+    def pending(self, skip_completed=False):
+        """Returns the patients to evaluate, in order of evaluation.
+
+        The patients are yielded lazily in ``sorted`` order, or are ordered by
+        their expected runtime, see :attr:`~isct.trial.Trial.order`.
+
+        Args:
+            skip_completed (bool): Skip already completed patients, where the
+                expected runtime of incomplete patients only considers their
+                incomplete models.
+        """
+        patients = (p for p in self if not (skip_completed and p.completed))
+        if self.order == 'sorted':
+            return patients
+
+        history = RuntimeHistory.read(self.dir, keys=self.runtime_keys)
+        costs = {}
+        patients = list(patients)
+        for patient in patients:
+            start = patient.first_incomplete_model() if skip_completed else 0
+            costs[patient.dir] = history.cost(patient, start=start)
+
+        # a stable sort: the patients are in sorted order on equal runtimes
+        return sorted(patients, key=lambda p: costs[p.dir], reverse=True)
+
+    @property
+    def batch_size(self):
+        """The number of patients evaluated together.
+
+        When any of the trial's models sets a ``batch`` size, the patients are
+        evaluated in batches of the largest batch size, see
+        :func:`~isct.trial.run_batch`. Otherwise, the patients are evaluated
+        individually.
+        """
+        return Events(self.get('events') or []).batch_size
+
     def invalid_container_path(self):
         """Returns true when no or invalide container paths are encountered."""
         return self.container_path and not os.path.exists(self.container_path)
 
+    @property
+    def index(self):
+        """The refreshed :class:`~isct.index.TrialIndex` of the trial.
+
+        The index is refreshed on every access, such that patients added or
+        removed on the file system are picked up. A refresh only parses the
+        configuration files that changed since they were last recorded in the
+        index.
+        """
+        if self._index is None or self._index.dir != self.dir:
+            self._index = TrialIndex(self.dir)
+        return self._index.refresh(patient_configs)
+
     @property
     def patients(self):
         """Iterator yielding all valid patient paths of the trial.
 
-        The iterator only considers entries in ``self.dir`` that can
-        successfully be parsed as a ``Patient`` class to be part of the patient
-        list considered in this trial.
+        The iterator only considers entries in ``self.dir`` that contain a
+        patient configuration that can successfully be parsed. The patients
+        are discovered through the trial's :attr:`~isct.trial.Trial.index`.
         """
-        def valid_patient(path):
-            """Return ``true`` when reading a ``Patient`` successfully."""
-            path = path.joinpath(patient_config)
-            try:
-                Patient.read(path)
-                return True
-            except (FileNotFoundError):
-                return False
-
-        patient_paths = (self.dir.joinpath(p) for p in os.listdir(self.dir))
-        patient_paths = filter(os.path.isdir, patient_paths)
-        patient_paths = filter(valid_patient, patient_paths)
-        for patient_path in patient_paths:
-            yield patient_path
+        for name in self.index:
+            yield self.dir.joinpath(name)
+
+    @property
+    def patient_configs(self):
+        """Iterator yielding the configuration file paths of all patients."""
+        for name, entry in self.index.items():
+            yield self.dir.joinpath(name, entry['config'])
+
+    @property
+    def config_format(self):
+        """The file format of newly created patient configurations.
+
+        The ``config-format`` key of the trial's configuration selects one of
+        the formats in :data:`~isct.utilities.config_formats`, which defaults
+        to ``yaml``. The JSON or MessagePack formats are considerably faster
+        to read and write for large cohorts of generated configurations.
+        """
+        return self.get('config-format', 'yaml')
+
+    def new_patient(self, idx: int):
+        """Return a new patient at ``idx`` with the trial's configuration."""
+        suffix, _, _ = config_formats[self.config_format]
+        return Patient(self.dir,
+                       idx=idx,
+                       prefix=self.get('prefix'),
+                       config=self.patient_related_configuration(),
+                       config_name=f'patient{suffix}')
 
     def patient_related_configuration(self):
         """Returns a dictionary of patient relevant configuration settings.
@@ -200,16 +508,14 @@ class Trial(Config):
         ``virtual patient model`` by invoking
         :meth:`Trial.sample_virtual_patient`.
         """
-        # write configuration to disk
+        # write configuration to disk and start an empty patient index, such
+        # that the patients created below are recorded while being written
         self.write()
+        TrialIndex(self.dir).write()
 
         # create patients
         for i in range(self.get('sample_size', 0)):
-            patient = Patient(self.dir,
-                              idx=i,
-                              prefix=self.get('prefix'),
-                              config=self.patient_related_configuration())
-            patient.create()
+            self.new_patient(i).create()
 
         self.sample_virtual_patient(0, self.get('sample_size'))
         return self
@@ -222,11 +528,7 @@ class Trial(Config):
         Args:
             idx (int): integer value of the to be appended patient.
         """
-        patient = Patient(self.dir,
-                          idx=idx,
-                          prefix=self.get('prefix'),
-                          config=self.patient_related_configuration())
-        patient.create()
+        self.new_patient(idx).create()
 
         # increment the sample size when appending patients
         self['sample_size'] += 1
@@ -265,7 +567,7 @@ class Trial(Config):
         # The trial.yml config file is passes as the criteria file for the
         # virtual patient model.
         args = ' '.join(map(str, patients))
-        args = f"{args} --config {str(trial_path.joinpath(trial_config))}"
+        args = f"{args} --config {str(trial_path.joinpath(self.path.name))}"
 
         container.run(args=args)
 
@@ -302,22 +604,122 @@ class Trial(Config):
         """Runs the full trial simulation.
 
         Evaluates the simulation of all virtual patients present in the
-        current trial. The patients are evaluated in sorted order, where the
-        patients are sorted based on the patient directories.
+        current trial. By default, the patients are evaluated in sorted order,
+        where the patients are sorted based on the patient directories, see
+        :attr:`~isct.trial.Trial.order`.
+
+        When the trial's models are evaluated in batches, see
+        :attr:`~isct.trial.Trial.batch_size`, the patients are evaluated in
+        batches through :meth:`~isct.trial.Trial.run_patients`.
 
         Args:
-            skip_completed (bool): Skip already completed patients
+            skip_completed (bool): Skip already completed patients and resume
+                incomplete patients at their first incomplete model, see
+                :meth:`~isct.patient.Patient.first_incomplete_model`.
         """
+        patients = self.pending(skip_completed=skip_completed)
+        if self.batch_size > 1:
+            results = dict(self.run_patients(patients, resume=skip_completed))
+            assert all(results.values()), "Patient event simulation failed."
+            return
+
         # exhaust all patients present in the iterator
-        for patient in self:
-            if skip_completed and patient.completed:
-                continue
+        for patient in patients:
+            patient.run(resume=skip_completed)
+
+    def run_patients(self, patients, resume=False):
+        """Yields ``(directory, success)`` for each completed patient.
+
+        The patients are evaluated sequentially, in batches of
+        :attr:`~isct.trial.Trial.batch_size` patients. A failing patient does
+        not interrupt the evaluation of the other patients. With ``resume``,
+        the patients resume at their first incomplete model.
+        """
+        for batch in batched(patients, self.batch_size):
+            yield from run_batch(batch, resume=resume)
+
+
+class PoolTrial(Trial):
+    """Concurrent evaluation of patient simulations in worker processes.
+
+    The patients are distributed over the worker processes of the trial's
+    runner, see :class:`~isct.runner.PoolRunner`. The patients are read once
+    by the driver process and sent to the workers, i.e. the trial and patient
+    configurations are not read again by the workers. With the
+    :class:`~isct.runner.AsyncRunner` the patients are evaluated concurrently
+    in threads of the driver process instead.
+    """
+    def run_patients(self, patients, resume=False):
+        """Yields ``(directory, success)`` for each completed patient.
+
+        The patients are evaluated through :meth:`~isct.runner.Runner.map`,
+        the results are yielded in order of completion. A failing patient does
+        not interrupt the evaluation of the other patients. Each patient is
+        weighted by the peak number of cores of its models, see
+        :meth:`~isct.events.Events.peak_resources`. With batched models, each
+        worker evaluates a batch of patients, see
+        :attr:`~isct.trial.Trial.batch_size`.
+        """
+        if (size := self.batch_size) == 1:
+            return self.runner.map(functools.partial(run_patient,
+                                                     resume=resume),
+                                   patients,
+                                   weight=patient_cores)
+
+        batches = self.runner.map(functools.partial(run_batch, resume=resume),
+                                  batched(patients, size),
+                                  weight=batch_cores)
+        return itertools.chain.from_iterable(batches)
 
-            patient.run()
+    def run(self, skip_completed=False):
+        """Runs all patient simulations in the pool of worker processes.
+
+        Args:
+            skip_completed (bool): Skip already completed patients and resume
+                incomplete patients at their first incomplete model.
+
+        Returns:
+            A dictionary mapping the patient directories to their success.
+        """
+        patients = self.pending(skip_completed=skip_completed)
+        return dict(self.run_patients(patients, resume=skip_completed))
+
+
+class ModelTrial(PoolTrial):
+    """Concurrent evaluation of the patients' models across patients.
+
+    Rather than evaluating each patient's pipeline as a single unit of work,
+    the models of all patients are scheduled individually, while respecting
+    the order of the models within each patient, see
+    :class:`~isct.scheduler.ModelScheduler`. The models are packed such that
+    at most ``jobs`` cores are in use concurrently, according to the models'
+    :class:`~isct.events.Resources`.
+    """
+    def __init__(self, *args, jobs=1, **kwargs):
+        """Initialise a trial evaluating at most ``jobs`` models at once."""
+        super().__init__(*args, **kwargs)
+        self.jobs = jobs
+
+    def run_patients(self, patients, resume=False):
+        """Yields ``(directory, success)`` for each completed patient.
+
+        The runner is closed once the patients are evaluated, or the
+        evaluation is interrupted, see :meth:`~isct.runner.Runner.close`.
+        """
+        try:
+            yield from ModelScheduler(self.jobs).run(patients, resume=resume)
+        finally:
+            self.runner.close()
 
 
 class ParallelTrial(Trial):
     """Parallel evaluation of patient simulations using `GNU Parallel`_."""
+    def __init__(self, *args, **kwargs):
+        """Initialise a trial emitting the patient run commands."""
+        super().__init__(*args, **kwargs)
+        self.skip_completed = False
+        self.incremental = False
+
     def run(self, skip_completed=False):
         """Pipe the simulation commands over ``stdout``.
 
@@ -329,11 +731,22 @@ class ParallelTrial(Trial):
         simulations.
 
         Args:
-            skip_completed (bool): Skip already completed patients.
+            skip_completed (bool): Skip already completed patients. The
+                incomplete patients resume at their first incomplete model.
 
         Examples:
             >>> isct -v trial run --parallel | parallel -j 4
         """
+        self.skip_completed = skip_completed
+        for patient in self.pending(skip_completed=skip_completed):
+            # This only emits the directory of the patient path, this makes
+            # it easier to generate a task list of patient simulation to
+            # be performed from different directories.
+            patient_path = os.path.dirname(patient.path)
+            self.submit(patient, self.command(patient_path))
+
+    def command(self, patient_path):
+        """Returns the command evaluating the patient at ``patient_path``."""
         # By default files are to be cleaned: running in parallel can quickly
         # accumulate large amounts of data.
         file_flags = ['--clean-files', self.clean_files.value]
@@ -346,32 +759,66 @@ class ParallelTrial(Trial):
         if self.container_path:
             container_flag = ['--container-path', f'{self.container_path}']
 
-        for patient in self:
-            if skip_completed and patient.completed:
-                continue
-
-            # This only emits the directory of the patient path, this makes
-            # it easier to generate a task list of patient simulation to
-            # be performed from different directories.
-            patient_path = os.path.dirname(patient.path)
-
-            # build the command: the root command with a logger, followed
-            # by the patient subcommand with additional flags.
-            cmd = ['desist']
-            cmd += ['--log', f'{patient_path}/isct.log']
-            cmd += ['patient', 'run']
-            cmd += file_flags + container_flag
-            # The patient path is added last, such that it becomes easier to
-            # slice out the patient directory of the list of parallel
-            # simulations, i.e. the directories of interest are simply the
-            # last item in the command.
-            cmd += [f'{patient_path}']
-
-            self.runner.run(cmd)
+        # build the command: the root command with a logger, followed
+        # by the patient subcommand with additional flags.
+        cmd = ['desist']
+        cmd += ['--log', f'{patient_path}/{log_file}']
+        cmd += ['patient', 'run']
+        cmd += file_flags + container_flag
+        if self.skip_completed:
+            cmd += ['--skip-completed']
+        if self.incremental:
+            cmd += ['--incremental']
+
+        # forward the runner's result cache, if any
+        cache = getattr(self.runner, 'cache', None)
+        if isinstance(cache, ResultCache):
+            cmd += ['--cache', f'{cache.root}']
+            if cache.max_size is not None:
+                cmd += ['--cache-size', f'{cache.max_size}MB']
+            if cache.link:
+                cmd += ['--cache-link']
+        # The patient path is added last, such that it becomes easier to
+        # slice out the patient directory of the list of parallel
+        # simulations, i.e. the directories of interest are simply the
+        # last item in the command.
+        cmd += [f'{patient_path}']
+        return cmd
+
+    def submit(self, patient, cmd):
+        """Submit the command ``cmd`` evaluating ``patient`` to the runner.
+
+        Note: the patient's resources are not considered here, as
+        `GNU Parallel`_ evaluates all jobs with equal weight.
+        """
+        self.runner.run(cmd)
 
 
 class QCGTrial(ParallelTrial):
-    """Parallel evaluation of patient simulation using ``QCG-PilotJob``."""
+    """Parallel evaluation of patient simulation using ``QCG-PilotJob``.
+
+    By default, the patients are submitted in chunks of ``chunk_size``
+    patients, where each chunk is a single iterative ``QCG`` job evaluating
+    one patient per iteration. The patient directories of each chunk are
+    written to a task list in the trial's ``.desist`` directory. The chunks
+    are submitted while the patients are still being enumerated, such that
+    ``QCG`` starts evaluating the first chunks right away. This avoids that
+    ``QCG`` has to ingest a job description per patient before starting.
+    The chunk size is set by ``desist trial run --qcg --chunk-size``.
+
+    When ``per_model`` is set, each model of a patient is submitted as
+    individual job, which depends on the job of the patient's preceding
+    model. This allows ``QCG`` to pack the models of different patients with
+    their own resources.
+    """
+    def __init__(self, *args, per_model=False, chunk_size=1000, **kwargs):
+        """Initialise a trial, optionally submitting a job per model."""
+        super().__init__(*args, **kwargs)
+        self.per_model = per_model
+        self.chunk_size = chunk_size
+        self.chunk = []
+        self.chunks = 0
+
     def run(self, skip_completed=False):
         """Run all patient simulations using ``QCG-PilotJob``.
 
@@ -385,5 +832,103 @@ class QCGTrial(ParallelTrial):
         This routine waits until all jobs are evaluated on the available
         resources and ``QCG`` terminates.
         """
+        self.chunks = 0
         super().run(skip_completed=skip_completed)
+        self.submit_chunk()
         self.runner.wait()
+
+    def submit(self, patient, cmd):
+        """Submit ``cmd`` with the peak resources of the patient's models.
+
+        The patient's models are evaluated in a single job, which thus
+        requires the peak resources of the models and their total walltime,
+        see :meth:`~isct.events.Events.peak_resources`. Runners without a
+        notion of resources, e.g. the :class:`~isct.runner.Logger` used on
+        dry runs, only receive the command.
+        """
+        if self.per_model:
+            return self.submit_models(patient, cmd)
+
+        if not isinstance(self.runner, QCGRunner):
+            return self.runner.run(cmd)
+
+        if self.chunk_size <= 1:
+            return self.runner.run(cmd,
+                                   resources=patient.events.peak_resources())
+
+        self.chunk.append((cmd[-1], patient.events.peak_resources()))
+        if len(self.chunk) >= self.chunk_size:
+            self.submit_chunk()
+
+    def shell_command(self, variable):
+        """Returns the patient command as shell script.
+
+        The patient directory is read from the shell variable ``variable``,
+        while all other arguments are quoted, such that these are passed
+        unchanged, e.g. paths holding whitespace.
+        """
+        placeholder = '\0'
+
+        def quote(arg):
+            """Quote ``arg``, except for the placeholder of the patient."""
+            parts = (shlex.quote(part) if part else ''
+                     for part in arg.split(placeholder))
+            return f'"${variable}"'.join(parts)
+
+        return ' '.join(map(quote, self.command(placeholder)))
+
+    def submit_chunk(self):
+        """Submit the current chunk of patients as a single iterative job.
+
+        The patient directories are written to a task list, from which each
+        iteration reads its patient directory. Each iteration requests the
+        maximum resources required by the patients in the chunk.
+        """
+        if not self.chunk:
+            return
+
+        paths, resources = zip(*self.chunk)
+        tasks = self.dir.joinpath(index_dir, f'qcg-tasks-{self.chunks:05}')
+        os.makedirs(tasks.parent, exist_ok=True)
+        with open(tasks, 'w') as outfile:
+            outfile.writelines(f'{path}\n' for path in paths)
+
+        # QCG substitutes the iteration index for `${it}`, which selects the
+        # corresponding line (one-based) of the task list.
+        cmd = self.shell_command('patient')
+        script = (f'patient="$(sed -n "$((${{it}} + 1))p" '
+                  f'{shlex.quote(str(tasks))})" && {cmd}')
+
+        self.runner.run_iterations(script,
+                                   len(paths),
+                                   resources=Resources.maximum(resources),
+                                   name=f'{self.dir.name}-{self.chunks:05}')
+        self.chunk = []
+        self.chunks += 1
+
+    def submit_models(self, patient, cmd):
+        """Submit a job for each model of the patient evaluated by ``cmd``.
+
+        Each job evaluates a single model through ``desist patient run
+        --model IDX`` with the model's resources. The jobs are named after the
+        patient's directory and model index, and each job is evaluated only
+        after the job of the preceding model succeeded.
+        """
+        events = patient.events
+        previous = None
+
+        # the completed models are not submitted again
+        start = patient.first_incomplete_model() if self.skip_completed else 0
+        for idx in range(start, patient['pipeline_length']):
+            # the patient path remains the last item of the command
+            model_cmd = cmd[:-1] + ['--model', str(idx), cmd[-1]]
+            if not isinstance(self.runner, QCGRunner):
+                self.runner.run(model_cmd)
+                continue
+
+            name = f'{patient.dir.name}-{idx}'
+            self.runner.run(model_cmd,
+                            resources=events.resources(idx),
+                            name=name,
+                            after=[previous] if previous else None)
+            previous = name
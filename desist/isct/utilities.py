@@ -1,18 +1,44 @@
 """General utility routines for ``isct``."""
 
 import click
+import collections
+import concurrent.futures
 from datetime import datetime
 import enum
+import gzip
+import json
 import logging
 import os
 import pathlib
 import sys
 import yaml
 
+from .timing import timing_file
+
+# Prefer the libyaml-based loader and dumper when PyYAML is compiled against
+# libyaml. These are considerably faster than their pure Python equivalents,
+# while parsing and emitting the same documents.
+try:
+    from yaml import CSafeLoader as YAMLLoader, CSafeDumper as YAMLDumper
+except ImportError:
+    from yaml import SafeLoader as YAMLLoader, SafeDumper as YAMLDumper
+
 
 # one megabyte
 MAX_FILE_SIZE = 2**20
 
+log_file = 'isct.log'
+"""str: Filename of the patient's log, see ``desist --log``."""
+
+backup_count = 5
+"""int: The number of rotated backups of the log files."""
+
+status_file = 'eventhandler.status'
+"""str: Filename holding the exit code of a patient evaluated in a batch."""
+
+simulation_commands = ('singularity run', 'docker run', 'docker exec')
+"""tuple: The commands evaluating a model's container."""
+
 
 @enum.unique
 class OS(enum.Enum):
@@ -72,10 +98,20 @@ class FileCleaner(object):
     different suffices or filenames to skip as well as the desired maximum file
     size threshold.
     """
-    def __init__(self, mode: CleanFiles, skip_files=['config.xml'],
+    def __init__(self, mode: CleanFiles, skip_files=None,
                  skip_suffix=['.yml', '.yaml'], max_size=MAX_FILE_SIZE):
+        """Initialise a cleaner in the given ``mode``.
+
+        By default, the patient configurations in any of the
+        :data:`config_formats` and the patient's timing records are skipped.
+        """
         assert isinstance(mode, CleanFiles), \
             f"FileCleaner: `mode` argument should be of type: {CleanFiles}."
+        if skip_files is None:
+            configs = [f'patient{sfx}' for (sfx, _, _) in
+                       config_formats.values()]
+            skip_files = ['config.xml', *configs, timing_file]
+
         self.mode = mode
         self.skip_files = skip_files
         self.skip_suffix = skip_suffix
@@ -124,51 +160,198 @@ class FileCleaner(object):
         return removed_file_count, saved_bytes
 
 
-def read_yaml(path):
-    """Reads the contents from the YAML file at the specified path.
-
-    The routine uses the ``yaml.safe_load`` function, and therefore will only
-    read standard YAML tags and cannot handle loading arbitrary Python objects.
+def read_file(path, load, binary=False, name='YAML'):
+    """Reads and parses the contents of the file at the specified path.
 
     Raises ``IsDirectoryError`` and ``FileNotFoundError`` in case the path or
     file are not encountered on the file system. For any other error the
-    function panics, as typically reading the YAML files represent and
-    important step in a pipeline that _has_ to work.
+    function panics, as typically reading the configuration files represent
+    and important step in a pipeline that _has_ to work.
+
+    Args:
+        path: The path of the file to read.
+        load: Function parsing the contents from an opened file.
+        binary: If the file should be opened in binary mode.
+        name: The name of the file format used in error messages.
     """
     path = pathlib.Path(path)
     try:
-        with open(path, 'r') as yaml_file:
-            contents = yaml.safe_load(yaml_file)
+        with open(path, 'rb' if binary else 'r') as infile:
+            contents = load(infile)
     except IsADirectoryError:
-        raise IsADirectoryError(f'The YAML path `{path}` should be a file.')
+        raise IsADirectoryError(f'The {name} path `{path}` should be a file.')
     except FileNotFoundError:
-        raise FileNotFoundError(f'The YAML path `{path}` is not present.')
+        raise FileNotFoundError(f'The {name} path `{path}` is not present.')
     except Exception as err:
-        sys.exit(f'Loading YAML from `{path}` raised: `{err}`')
+        sys.exit(f'Loading {name} from `{path}` raised: `{err}`')
 
     return contents
 
 
-def write_yaml(path, dictionary):
-    """Writes a dictionary to the given path in the YAML format.
+def write_file(path, dictionary, dump, binary=False):
+    """Writes a dictionary to the given path using the ``dump`` function.
 
     This routine creates the full directory tree corresponding to the
     provided path ``path``. In case the writing to disk fails, no attempt is
     made to remove any created directories. This avoids having to keep track
     which part of the tree is newly added as well as accidentally dropping
     large directory trees.
-
-    The ``yaml.safe_dump`` function is used, which allows dumping of standard
-    YAML tags only. So, no arbitrary Python objects can be written using this
-    function.
     """
     # Make sure the full tree of the file path exist on the file system,
     # otherwise attempting to write the file will fail.
     basepath, _ = os.path.split(path)
     os.makedirs(basepath, exist_ok=True)
 
-    with open(path, 'w') as config_file:
-        yaml.safe_dump(dictionary, config_file)
+    with open(path, 'wb' if binary else 'w') as outfile:
+        dump(dictionary, outfile)
+
+
+def read_yaml(path):
+    """Reads the contents from the YAML file at the specified path.
+
+    The routine uses a safe YAML loader, and therefore will only read standard
+    YAML tags and cannot handle loading arbitrary Python objects. The loader is
+    backed by ``libyaml`` when available, see :data:`YAMLLoader`.
+
+    Raises ``IsDirectoryError`` and ``FileNotFoundError`` in case the path or
+    file are not encountered on the file system. For any other error the
+    function panics, see :func:`read_file`.
+    """
+    return read_file(path, lambda f: yaml.load(f, Loader=YAMLLoader))
+
+
+def write_yaml(path, dictionary):
+    """Writes a dictionary to the given path in the YAML format.
+
+    A safe YAML dumper is used, which allows dumping of standard YAML tags
+    only. So, no arbitrary Python objects can be written using this function.
+    Similar to :func:`read_yaml` the dumper is backed by ``libyaml`` when
+    available, see :data:`YAMLDumper`.
+    """
+    write_file(path, dictionary,
+               lambda d, f: yaml.dump(d, f, Dumper=YAMLDumper))
+
+
+def read_json(path):
+    """Reads the contents from the JSON file at the specified path."""
+    return read_file(path, json.load, name='JSON')
+
+
+def write_json(path, dictionary):
+    """Writes a dictionary to the given path in the JSON format.
+
+    Similar to :func:`write_yaml` the keys are sorted to obtain reproducible
+    files.
+    """
+    write_file(path, dictionary,
+               lambda d, f: json.dump(d, f, sort_keys=True))
+
+
+def read_msgpack(path):
+    """Reads the contents from the MessagePack file at the specified path.
+
+    This requires the optional ``msgpack`` package to be installed.
+    """
+    import msgpack
+    return read_file(path, msgpack.load, binary=True, name='MessagePack')
+
+
+def write_msgpack(path, dictionary):
+    """Writes a dictionary to the given path in the MessagePack format.
+
+    This requires the optional ``msgpack`` package to be installed.
+    """
+    import msgpack
+    write_file(path, dictionary, msgpack.dump, binary=True)
+
+
+config_formats = {
+    'yaml': ('.yml', read_yaml, write_yaml),
+    'json': ('.json', read_json, write_json),
+    'msgpack': ('.msgpack', read_msgpack, write_msgpack),
+}
+"""dict: Supported configuration formats with their suffix and read/write."""
+
+
+def config_format(path):
+    """Returns the configuration format matching the suffix of ``path``.
+
+    Any suffix other than the ones in :data:`config_formats`, e.g. ``.yaml``
+    or no suffix at all, is considered YAML. As YAML is a superset of JSON,
+    this will also parse JSON files with unknown suffices.
+    """
+    suffix = pathlib.Path(path).suffix.lower()
+    for fmt, (fmt_suffix, _, _) in config_formats.items():
+        if suffix == fmt_suffix:
+            return fmt
+    return 'yaml'
+
+
+def read_config(path):
+    """Reads a configuration file, its format is detected from the suffix."""
+    _, read, _ = config_formats[config_format(path)]
+    return read(path)
+
+
+def write_config(path, dictionary):
+    """Writes a configuration file, its format follows from the suffix."""
+    _, _, write = config_formats[config_format(path)]
+    write(path, dictionary)
+
+
+def find_config(directory, names):
+    """Returns the path of the first configuration file present in directory.
+
+    The candidate ``names`` are tried in order. When none of the files is
+    present, the path of the first candidate is returned.
+
+    Args:
+        directory: The directory to search for configuration files.
+        names: The candidate configuration filenames.
+    """
+    directory = pathlib.Path(directory)
+    for name in names:
+        path = directory.joinpath(name)
+        if path.is_file():
+            return path
+    return directory.joinpath(names[0])
+
+
+def prefetch(func, iterable, depth: int = 0):
+    """Yields ``func(item)`` for each item, evaluating ahead in threads.
+
+    Up to ``depth`` items are evaluated ahead of the consumer in a bounded
+    thread pool, while the results are still yielded in the order of
+    ``iterable``. This hides latency of I/O bound functions, e.g. reading
+    files from network file systems. For ``depth <= 0`` the function is
+    evaluated sequentially, equivalent to ``map(func, iterable)``.
+
+    Any exception raised by ``func`` is raised when its result is yielded.
+
+    Args:
+        func: The function to evaluate for each item.
+        iterable: The items to evaluate.
+        depth: The number of items to evaluate ahead of the consumer.
+    """
+    if depth <= 0:
+        yield from map(func, iterable)
+        return
+
+    pending = collections.deque()
+    executor = concurrent.futures.ThreadPoolExecutor(max_workers=depth)
+    try:
+        for item in iterable:
+            pending.append(executor.submit(func, item))
+            if len(pending) > depth:
+                yield pending.popleft().result()
+
+        while pending:
+            yield pending.popleft().result()
+    finally:
+        # Do not evaluate the remaining items when the consumer stops early.
+        for future in pending:
+            future.cancel()
+        executor.shutdown()
 
 
 def is_bind_path(path) -> bool:
@@ -189,31 +372,83 @@ def is_bind_path(path) -> bool:
     return sum(1 for _ in filter(lambda x: x == ':', str(path))) == 1
 
 
+def parse_log_time(line):
+    """Returns the timestamp at the start of a log line, or ``None``.
+
+    The timestamps are formatted as ``YYYY-MM-DD HH:MM:SS,mmm`` by the log
+    files of the command-line interface, where the milliseconds are optional.
+    The fields are read from their fixed offsets, which is considerably faster
+    than ``datetime.strptime``.
+    """
+    try:
+        if line[4] != '-' or line[10] != ' ':
+            return None
+        millis = int(line[20:23]) if line[19:20] in (',', '.') else 0
+        return datetime(int(line[0:4]), int(line[5:7]), int(line[8:10]),
+                        int(line[11:13]), int(line[14:16]), int(line[17:19]),
+                        millis * 1000)
+    except (IndexError, ValueError):
+        return None
+
+
+def open_log(logfile):
+    """Opens the log file for reading text, including compressed logs.
+
+    Logs ending in ``.gz`` are decompressed through :mod:`gzip`, while logs
+    ending in ``.zst`` require the optional ``zstandard`` package. A dash
+    (``-``) reads from ``stdin``. Undecodable bytes are replaced, such that
+    corrupted lines do not abort reading the log.
+    """
+    name = str(logfile)
+    if name.endswith('.gz'):
+        return gzip.open(logfile, 'rt', errors='replace')
+
+    if name.endswith('.zst'):
+        try:
+            import zstandard
+        except ImportError as err:
+            msg = f'Reading `{name}` requires the `zstandard` package.'
+            raise ImportError(msg) from err
+        return zstandard.open(logfile, 'rt', errors='replace')
+
+    # Note: requires `click.open_file` to account for passing a dash (`-`) as
+    # the filename specifier to read from `stdin`.
+    return click.open_file(logfile, 'r', errors='replace')
+
+
 def extract_simulation_times(logfile):
-    """Returns a newline-separated string of (start, elapsed) times.
+    """Yields the (start, elapsed) times of the simulations in the logfile.
 
     The starting timestamps are extracted from the logfile based on the
     starting time stamp at which the Singularity/Docker container was invoked.
     The elapsed times follow then from the difference between consecutive
-    starting time.
+    starting time. The first line is a header holding the first starting
+    time. The log is streamed, such that the times are yielded while reading
+    the log, and nothing is yielded for logs without any invocations.
     """
     def is_simulation_start(string: str):
-        """Return True if the line started a Singularity/Docker run-command."""
+        """Return True if the line started a Singularity/Docker evaluation.
+
+        Warm Docker containers are evaluated through ``docker exec``, while
+        their detached start, ``docker run -d``, does not evaluate a model.
+        """
         string = string.lower()
-        return ('singularity run' in string) or ('docker run') in string
+        if 'docker run -d ' in string:
+            return False
+        return any(cmd in string for cmd in simulation_commands)
 
     def to_timestamp(string):
-        """Convert a log-line to its starting time as a datetime entry."""
-        time_stamp_format = '%Y-%m-%d %H:%M:%S'
-        return datetime.strptime(string[0:string.find(',')], time_stamp_format)
-
-    # Note: requires `click.open_file` to account for passing a dash (`-`) as
-    # the filename specifier to read from `stdin`.
-    with click.open_file(logfile, 'r') as log:
-        starts = list(map(to_timestamp, filter(is_simulation_start, log)))
-
-    timings = [f'{starts[0]}\tElapsed (HH:MM:SS)']
-    for start, stop in zip(starts[:-1], starts[1:]):
-        timings.append(f'{start}\t{stop - start}')
-
-    return "\n".join(timings)
+        """Convert a log-line to its starting time, truncated to seconds."""
+        if (moment := parse_log_time(string)) is not None:
+            return moment.replace(microsecond=0)
+
+    with open_log(logfile) as log:
+        starts = filter(None, map(to_timestamp,
+                                  filter(is_simulation_start, log)))
+        if (previous := next(starts, None)) is None:
+            return
+
+        yield f'{previous}\tElapsed (HH:MM:SS)'
+        for start in starts:
+            yield f'{previous}\t{start - previous}'
+            previous = start
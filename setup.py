@@ -16,8 +16,9 @@ _dev = _test + [
 
 _vvuq = ['easyvvuq']
 _qcg = ['qcg-pilotjob']
+_msgpack = ['msgpack']
 
-_all = _dev + _test + _vvuq + _qcg
+_all = _dev + _test + _vvuq + _qcg + _msgpack
 
 setup(
     name="desist",
@@ -41,6 +42,7 @@ setup(
         'dev': _dev,
         'test': _test,
         'vvuq': _vvuq,
-        'qcg': _qcg
+        'qcg': _qcg,
+        'msgpack': _msgpack
     },
 )
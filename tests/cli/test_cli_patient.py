@@ -5,6 +5,7 @@ import pytest
 
 from desist.cli.patient import run, reset
 from desist.cli.trial import create
+from desist.isct.patient import Patient
 from desist.isct.utilities import OS, MAX_FILE_SIZE
 from desist.isct.trial import Trial, trial_config
 
@@ -47,6 +48,108 @@ def test_patient_run(mocker, tmpdir, platform, num_patients):
         assert all([m in result.output for m in tags])
 
 
+def test_patient_run_model(mocker, tmpdir):
+    mocker.patch('desist.isct.utilities.OS.from_platform',
+                 return_value=OS.MACOS)
+
+    runner = CliRunner()
+    path = pathlib.Path('test')
+    with runner.isolated_filesystem():
+        result = runner.invoke(create, [str(path), '-x', '-n', '1', '-c',
+                                        default_criteria_file(tmpdir)])
+        assert result.exit_code == 0
+
+        patient = str(list(Trial.read(path.joinpath(trial_config)))[0].dir)
+        labels = [label.replace('_', '-') for label in default_events.labels]
+
+        # only the selected models are evaluated, in the given order
+        result = runner.invoke(run, [patient, '-x', '-m', 1, '-m', 0])
+        assert result.exit_code == 0
+        lines = result.output.strip().splitlines()
+        assert len(lines) == 2
+        assert labels[1] in lines[0] and labels[0] in lines[1]
+
+        result = runner.invoke(run, [patient, '-x', '--model', len(labels)])
+        assert result.exit_code == 2
+        assert 'has only' in result.output
+
+
+def test_patient_run_skip_completed(mocker, tmpdir):
+    mocker.patch('desist.isct.utilities.OS.from_platform',
+                 return_value=OS.MACOS)
+    dummy = DummyRunner(write_config=True)
+    mocker.patch('desist.isct.runner.new_runner', return_value=dummy)
+
+    runner = CliRunner()
+    path = pathlib.Path('test')
+    with runner.isolated_filesystem():
+        result = runner.invoke(create, [str(path), '-x', '-n', '1', '-c',
+                                        default_criteria_file(tmpdir)])
+        assert result.exit_code == 0
+
+        patient = list(Trial.read(path.joinpath(trial_config)))[0]
+        models = patient['pipeline_length']
+        patient.runner = dummy
+        patient.record_model(0, True)
+
+        # the pipeline resumes after the completed model
+        result = runner.invoke(run, [str(patient.dir), '--skip-completed'])
+        assert result.exit_code == 0
+        assert len(dummy.output) == models - 1
+        assert 'patient_00000 0 event' not in ' '.join(dummy.output[0])
+
+        # completed patients are skipped
+        dummy.clear()
+        result = runner.invoke(run, [str(patient.dir), '--skip-completed'])
+        assert result.exit_code == 0
+        assert len(dummy.output) == 0
+
+
+def test_patient_run_incremental(mocker, tmpdir):
+    mocker.patch('desist.isct.utilities.OS.from_platform',
+                 return_value=OS.MACOS)
+    mocker.patch('desist.isct.docker.Docker.digest', return_value='digest')
+    dummy = DummyRunner(write_config=True)
+    mocker.patch('desist.isct.runner.new_runner', return_value=dummy)
+
+    runner = CliRunner()
+    path = pathlib.Path('test')
+    with runner.isolated_filesystem():
+        result = runner.invoke(create, [str(path), '-x', '-n', '1', '-c',
+                                        default_criteria_file(tmpdir)])
+        assert result.exit_code == 0
+
+        patient = list(Trial.read(path.joinpath(trial_config)))[0]
+        models = patient['pipeline_length']
+
+        # without recorded inputs, all models are evaluated
+        result = runner.invoke(run, [str(patient.dir), '--incremental'])
+        assert result.exit_code == 0
+        assert len(dummy.output) == models
+
+        # up to date patients are skipped
+        dummy.clear()
+        result = runner.invoke(run, [str(patient.dir), '--incremental'])
+        assert result.exit_code == 0
+        assert len(dummy.output) == 0
+
+        # only the changed model and its subsequent models are evaluated
+        patient = Patient.read(patient.path)
+        patient['events'][-1]['models'][-1]['value'] = 1
+        patient.write()
+        result = runner.invoke(run, [str(patient.dir), '--incremental'])
+        assert result.exit_code == 0
+        assert len(dummy.output) == 1
+        assert f'{models - 1} event' in ' '.join(dummy.output[0])
+
+        # selected models are evaluated regardless
+        dummy.clear()
+        result = runner.invoke(run, [str(patient.dir), '--incremental',
+                                     '--model', '0'])
+        assert result.exit_code == 0
+        assert len(dummy.output) == 1
+
+
 @pytest.mark.parametrize('platform', [OS.MACOS, OS.LINUX])
 def test_patient_keep_files(mocker, tmpdir, platform):
     mocker.patch('desist.isct.utilities.OS.from_platform',
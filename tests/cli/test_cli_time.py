@@ -2,7 +2,9 @@ import pathlib
 from click.testing import CliRunner
 
 from desist.cli.time import time
-from tests.isct.test_utilities import timing_test_log
+from desist.isct.patient import Patient
+from desist.isct.timing import Invocation
+from tests.isct.test_utilities import default_config, timing_test_log
 
 
 def test_cli_time(tmpdir):
@@ -15,3 +17,25 @@ def test_cli_time(tmpdir):
         result = runner.invoke(time, str(logfile))
         assert result.exit_code == 0
         assert len(result.output.splitlines()) == expected_line_count
+
+    # logs without any container invocations
+    logfile.write_text('2021-11-03 07:18:51,274 | root | INFO | chown\n')
+    result = runner.invoke(time, str(logfile))
+    assert result.exit_code == 0
+    assert result.output == ''
+
+
+def test_cli_time_records(tmpdir):
+    patient = Patient(pathlib.Path(tmpdir), config=default_config)
+    patient.write()
+    runner = CliRunner()
+    result = runner.invoke(time, str(patient.dir))
+    assert result.exit_code == 1
+    assert 'No timing records' in result.output
+
+    for idx in range(2):
+        Invocation([patient], idx).finished(0)
+
+    result = runner.invoke(time, str(patient.dir))
+    assert result.exit_code == 0
+    assert len(result.output.splitlines()) == 3
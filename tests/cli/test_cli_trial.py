@@ -1,16 +1,20 @@
 from click.testing import CliRunner
 
+import json
 import pathlib
 import pytest
 import os
 
 from desist.cli.trial import create, append, run, list_key, outcome, archive
-from desist.cli.trial import reset, clean
+from desist.cli.trial import reset, clean, resources, stats, trace
 from desist.isct.config import Config
-from desist.isct.trial import Trial, trial_config
+from desist.isct.index import index_dir
+from desist.isct.timing import Invocation
+from desist.isct.trial import Trial, QCGTrial, trial_config
 from desist.isct.utilities import OS, MAX_FILE_SIZE, CleanFiles
 
 from tests.isct.test_utilities import create_dummy_file, default_criteria_file
+from tests.isct.test_utilities import default_events
 
 
 # FIXME: `dry` run does still create all directories though...
@@ -23,7 +27,9 @@ def test_trial_create(n):
     with runner.isolated_filesystem():
         result = runner.invoke(create, [str(path), '-n', n, '-x'])
         assert result.exit_code == 0
-        assert len(list(filter(lambda p: p.is_dir(), path.iterdir()))) == n
+        patients = filter(lambda p: p.is_dir() and p.name != index_dir,
+                          path.iterdir())
+        assert len(list(patients)) == n
 
         trial = Trial.read(path.joinpath(trial_config))
         assert trial.get('sample_size') == n
@@ -35,6 +41,21 @@ def test_trial_create(n):
             assert f'trial/{patient.name}' in result.output
 
 
+def test_trial_create_config_format():
+    runner = CliRunner()
+    path = pathlib.Path('test')
+    with runner.isolated_filesystem():
+        cmd = [str(path), '-n', 3, '-x', '-f', 'json']
+        result = runner.invoke(create, cmd)
+        assert result.exit_code == 0
+
+        trial = Trial.read(path.joinpath(trial_config))
+        assert trial.get('config-format') == 'json'
+        patients = list(trial)
+        assert len(patients) == 3
+        assert all(p.path.name == 'patient.json' for p in patients)
+
+
 @pytest.mark.parametrize('n', [1, 5])
 def test_trial_from_criteria_file(tmpdir, n):
     runner = CliRunner()
@@ -51,7 +72,9 @@ def test_trial_from_criteria_file(tmpdir, n):
             create,
             [str(path), '-c', str(criteria.path), '-x'])
         assert result.exit_code == 0
-        assert len(list(filter(lambda p: p.is_dir(), path.iterdir()))) == n
+        patients = filter(lambda p: p.is_dir() and p.name != index_dir,
+                          path.iterdir())
+        assert len(list(patients)) == n
 
         # ensure the config is passed to the virtual patient model
         assert '--config' in result.output
@@ -144,7 +167,9 @@ def test_trial_append(tmpdir, n):
         assert result_c.exit_code == 0
         result_a = runner.invoke(append, [str(path), '-n', n, '-x'])
         assert result_a.exit_code == 0
-        assert len(list(filter(lambda p: p.is_dir(), path.iterdir()))) == 2 * n
+        patients = filter(lambda p: p.is_dir() and p.name != index_dir,
+                          path.iterdir())
+        assert len(list(patients)) == 2 * n
 
         trial = Trial.read(path.joinpath(trial_config))
         assert trial.get('sample_size') == 2 * n
@@ -208,6 +233,165 @@ def test_trial_run(mocker, tmpdir, keep_files, platform, num, parallel):
             assert all(cmd in result.output for cmd in keep_cmd)
 
 
+def test_trial_run_jobs(tmpdir):
+    runner = CliRunner()
+    path = pathlib.Path(tmpdir).joinpath('test')
+    with runner.isolated_filesystem():
+        criteria = default_criteria_file(tmpdir)
+        result = runner.invoke(create, [str(path), '-n', 5, '-x', '-c',
+                                        criteria])
+        assert result.exit_code == 0
+
+        for flags in [['--jobs', 2], ['--jobs', 2, '--asyncio'],
+                      ['--jobs', 2, '--per-model']]:
+            result = runner.invoke(run, [str(path), '-x'] + flags)
+            assert result.exit_code == 0
+            for i in range(5):
+                assert f'patient_{i:05}' in result.output
+
+        for flags in [['--jobs', 2], ['--asyncio']]:
+            for flag in ['--parallel', '--qcg']:
+                result = runner.invoke(run, [str(path), flag] + flags)
+                assert result.exit_code == 2
+                assert 'Ambiguous' in result.output
+
+        result = runner.invoke(run, [str(path), '--parallel', '--per-model'])
+        assert result.exit_code == 2
+        assert 'Ambiguous' in result.output
+
+
+def test_trial_run_warm(mocker, tmpdir):
+    inspect = mocker.patch('desist.isct.docker.subprocess.run')
+    inspect.return_value.stdout = '["python3", "api.py"]'
+    runner = CliRunner()
+    path = pathlib.Path(tmpdir).joinpath('test')
+    with runner.isolated_filesystem():
+        criteria = default_criteria_file(tmpdir)
+        result = runner.invoke(create, [str(path), '-n', 3, '-x', '-c',
+                                        criteria])
+        assert result.exit_code == 0
+
+        # one instance per container, stopped after completing the trial
+        result = runner.invoke(run, [str(path), '-x', '--warm', 100])
+        assert result.exit_code == 0
+        labels = len(set(default_events.labels))
+        assert result.output.count('docker run -d') == labels
+        assert result.output.count('docker rm -f') == labels
+        for i in range(3):
+            assert f'{path}/patient_{i:05}/patient.yml' in result.output
+
+        result = runner.invoke(run, [str(path), '-x', '--cache', 'cache',
+                                     '--cache-size', 'large'])
+        assert result.exit_code == 2
+        assert 'Invalid memory' in result.output
+
+        for flag in ['--parallel', '--qcg']:
+            result = runner.invoke(run, [str(path), flag, '--warm', 10])
+            assert result.exit_code == 2
+            assert 'Ambiguous' in result.output
+
+
+def test_trial_run_qcg_per_model(tmpdir):
+    runner = CliRunner()
+    path = pathlib.Path(tmpdir).joinpath('test')
+    with runner.isolated_filesystem():
+        criteria = default_criteria_file(tmpdir)
+        result = runner.invoke(create, [str(path), '-n', 2, '-x', '-c',
+                                        criteria])
+        assert result.exit_code == 0
+
+        result = runner.invoke(run, [str(path), '-x', '--qcg', '--per-model'])
+        assert result.exit_code == 0
+
+        # a command is emitted for each model of each patient
+        models = len(list(default_events.models))
+        lines = result.output.strip().splitlines()
+        assert len(lines) == 2 * models
+        for idx in range(models):
+            assert sum(f'--model {idx} ' in line for line in lines) == 2
+
+
+@pytest.mark.parametrize('flags', [[], ['--parallel'], ['--qcg'],
+                                   ['--qcg', '--per-model']])
+def test_trial_run_incremental(mocker, tmpdir, flags):
+    invalidate = mocker.patch('desist.isct.patient.Patient.invalidate')
+    runner = CliRunner()
+    path = pathlib.Path(tmpdir).joinpath('test')
+    with runner.isolated_filesystem():
+        criteria = default_criteria_file(tmpdir)
+        result = runner.invoke(create, [str(path), '-n', 2, '-x', '-c',
+                                        criteria])
+        assert result.exit_code == 0
+
+        cmd = [str(path), '-x', '--incremental'] + flags
+        result = runner.invoke(run, cmd)
+        assert result.exit_code == 0
+
+        # parallel workers invalidate their own patient, except per model
+        per_patient = flags in (['--parallel'], ['--qcg'])
+        assert invalidate.call_count == (0 if per_patient else 2)
+        if flags:
+            assert '--incremental' in result.output
+            assert ('--skip-completed' in result.output) != per_patient
+
+
+def test_trial_run_qcg_chunk_size(mocker, tmpdir):
+    runner = CliRunner()
+    path = pathlib.Path(tmpdir).joinpath('test')
+    with runner.isolated_filesystem():
+        criteria = default_criteria_file(tmpdir)
+        result = runner.invoke(create, [str(path), '-n', 2, '-x', '-c',
+                                        criteria])
+        assert result.exit_code == 0
+
+        trial_run = mocker.patch.object(QCGTrial, 'run', autospec=True)
+        result = runner.invoke(run, [str(path), '-x', '--qcg',
+                                     '--chunk-size', 10])
+        assert result.exit_code == 0
+        assert trial_run.call_args[0][0].chunk_size == 10
+
+        result = runner.invoke(run, [str(path), '-x', '--qcg',
+                                     '--chunk-size', 0])
+        assert result.exit_code == 2
+
+
+def test_trial_run_prefetch(tmpdir):
+    runner = CliRunner()
+    path = pathlib.Path(tmpdir).joinpath('test')
+    with runner.isolated_filesystem():
+        criteria = default_criteria_file(tmpdir)
+        result = runner.invoke(create, [str(path), '-n', 5, '-x', '-c',
+                                        criteria])
+        assert result.exit_code == 0
+
+        result = runner.invoke(run, [str(path), '-x', '--prefetch', 4])
+        assert result.exit_code == 0
+        for i in range(5):
+            assert f'patient_{i:05}' in result.output
+
+        result = runner.invoke(run, [str(path), '-x', '--prefetch', -1])
+        assert result.exit_code == 2
+
+
+def test_trial_run_order(tmpdir):
+    runner = CliRunner()
+    path = pathlib.Path(tmpdir).joinpath('test')
+    with runner.isolated_filesystem():
+        criteria = default_criteria_file(tmpdir)
+        result = runner.invoke(create, [str(path), '-n', 3, '-x', '-c',
+                                        criteria])
+        assert result.exit_code == 0
+
+        result = runner.invoke(run, [str(path), '-x', '--order',
+                                     'longest-first', '--runtime-key', 'age'])
+        assert result.exit_code == 0
+        for i in range(3):
+            assert f'patient_{i:05}' in result.output
+
+        result = runner.invoke(run, [str(path), '-x', '--order', 'random'])
+        assert result.exit_code == 2
+
+
 @pytest.mark.parametrize('parallel', ['--parallel', '--qcg'])
 @pytest.mark.parametrize('platform', [OS.MACOS, OS.LINUX])
 def test_trial_run_parallel_singularity(mocker, tmpdir, platform, parallel):
@@ -539,3 +723,85 @@ def test_trial_parallel_qcg(tmpdir):
         result = runner.invoke(run, [str(path), '--parallel', '--qcg'])
         assert result.exit_code == 2
         assert 'Ambiguous' in result.output
+
+
+def test_trial_resources(tmpdir):
+    runner = CliRunner()
+    path = pathlib.Path(tmpdir).joinpath('test')
+    criteria = default_criteria_file(tmpdir)
+    result = runner.invoke(create, [str(path), '-n', 3, '-x', '-c', criteria])
+    assert result.exit_code == 0
+
+    result = runner.invoke(resources, [str(path)])
+    assert result.exit_code == 1
+    assert 'No timing records' in result.output
+
+    trial = Trial.read(path.joinpath(trial_config))
+    for i, patient in enumerate(trial):
+        usage = {'cpu_user': i, 'cpu_system': 1, 'max_rss': 100 * i}
+        Invocation([patient], 0).finished(0, usage=usage)
+
+    result = runner.invoke(resources, [str(path)])
+    assert result.exit_code == 0
+    header, *lines = result.output.splitlines()
+    assert 'P95' in header
+    assert [line.split()[1] for line in lines] == ['wall', 'cpu', 'max_rss']
+    cpu = lines[1].split()
+    assert cpu[0] == default_events.label(0)
+    assert cpu[3:] == ['3', '2.0', '2.0', '3.0', '3.0']
+
+
+def test_trial_stats(tmpdir):
+    runner = CliRunner()
+    path = pathlib.Path(tmpdir).joinpath('test')
+    criteria = default_criteria_file(tmpdir)
+    result = runner.invoke(create, [str(path), '-n', 3, '-x', '-c', criteria])
+    assert result.exit_code == 0
+
+    result = runner.invoke(stats, [str(path)])
+    assert result.exit_code == 1
+    assert 'No timing records' in result.output
+
+    trial = Trial.read(path.joinpath(trial_config))
+    for i, patient in enumerate(trial):
+        Invocation([patient], 0).finished(i % 2)
+
+    for jobs in ['1', '2']:
+        result = runner.invoke(stats, [str(path), '-f', 'json', '-j', jobs])
+        assert result.exit_code == 0
+        report = json.loads(result.output)
+        model = report['models'][default_events.label(0)]
+        assert model['count'] == 2
+        assert model['failures'] == 1
+        assert len(report['slowest']) == 3
+
+    result = runner.invoke(stats, [str(path), '-f', 'csv', '-j', '1'])
+    assert result.exit_code == 0
+    assert result.output.splitlines()[1].startswith(default_events.label(0))
+
+
+def test_trial_trace(tmpdir):
+    runner = CliRunner()
+    path = pathlib.Path(tmpdir).joinpath('test')
+    output = pathlib.Path(tmpdir).joinpath('trace.json')
+    criteria = default_criteria_file(tmpdir)
+    result = runner.invoke(create, [str(path), '-n', 3, '-x', '-c', criteria])
+    assert result.exit_code == 0
+
+    result = runner.invoke(trace, [str(path), '-o', str(output), '-j', 1])
+    assert result.exit_code == 1
+    assert 'No timing records' in result.output
+
+    trial = Trial.read(path.joinpath(trial_config))
+    for patient in trial:
+        invocation = Invocation([patient], 0)
+        invocation.started()
+        invocation.finished(0)
+
+    result = runner.invoke(trace, [str(path), '-o', str(output), '-j', 1])
+    assert result.exit_code == 0
+    events = json.loads(output.read_text())['traceEvents']
+    slices = [event for event in events if event['ph'] == 'X']
+    assert len(slices) == 3
+    assert {event['name'] for event in slices} == {default_events.label(0)}
+    assert any(event['ph'] == 'C' for event in events)
@@ -1,8 +1,9 @@
+import click
 import pytest
 from click.testing import CliRunner
 
 from desist.eventhandler.api import API
-from desist.eventhandler.eventhandler import event_handler
+from desist.eventhandler.eventhandler import event_handler, status_file
 from desist.isct.patient import Patient
 from ..isct.test_utilities import baseline_event, stroke_event, treatment_event
 from ..isct.test_utilities import default_config
@@ -53,6 +54,60 @@ def test_eventhandler(tmpdir, cmd):
         assert cmd in result.output
 
 
+class FailingAPI(TAPI):
+    """Test class failing the event for `patient_00001` only."""
+    def event(self):
+        assert self.patient.dir.name != 'patient_00001', 'event failed'
+        super().event()
+
+
+def test_eventhandler_custom_command(tmpdir):
+    patient = Patient(tmpdir, idx=0, config=default_config)
+    patient.write()
+
+    # commands attached downstream use the API instance of the patient
+    @click.command()
+    @click.pass_context
+    def custom(ctx):
+        print(ctx.obj.patient.dir.name)
+
+    cli = event_handler(TAPI)
+    cli.add_command(custom)
+    result = CliRunner().invoke(cli, [str(patient.path), 0, 'custom'])
+    assert result.exit_code == 0
+    assert 'patient_00000' in result.output
+
+
+def test_eventhandler_patients(tmpdir):
+    runner = CliRunner()
+    patients = [
+        Patient(tmpdir, idx=i, config=default_config) for i in range(3)
+    ]
+    for patient in patients:
+        patient.write()
+
+    first, *others = [str(patient.path) for patient in patients]
+    args = [arg for path in others for arg in ('-p', path)] + [first, 0]
+
+    def exit_codes():
+        return [int(patient.dir.joinpath(status_file).read_text())
+                for patient in patients]
+
+    result = runner.invoke(event_handler(TAPI), args + ['event'])
+    assert result.exit_code == 0
+    assert result.output.count('event') == 3
+    assert exit_codes() == [0, 0, 0]
+
+    # a failing patient does not prevent evaluation of the other patients
+    result = runner.invoke(event_handler(FailingAPI), args + ['event'])
+    assert result.exit_code == 1
+    assert result.output.count('event\n') == 2
+    assert 'patient_00001' in result.output
+
+    # the exit code of each patient is written to its directory
+    assert exit_codes() == [0, 1, 0]
+
+
 @pytest.mark.parametrize('model_id', [0, 1])
 def test_api_class(tmpdir, model_id):
     patient = Patient(tmpdir, idx=0, prefix='test', config=default_config)
@@ -0,0 +1,179 @@
+import os
+import pathlib
+import pytest
+
+from desist.isct import cache as cache_module
+from desist.isct.cache import Fingerprinter, ResultCache, fingerprint
+from desist.isct.cache import snapshot
+from desist.isct.patient import Patient
+
+from .test_runner import DummyRunner
+from .test_utilities import default_config
+
+
+class FileContainer:
+    """A container writing `output.txt` from `input.txt` when evaluated."""
+    image = 'image'
+
+    def __init__(self, digest='digest'):
+        self.calls = 0
+        self._digest = digest
+
+    def digest(self):
+        return self._digest
+
+    def run(self, args=''):
+        self.calls += 1
+        directory = pathlib.Path(args)
+        text = directory.joinpath('input.txt').read_text()
+        directory.joinpath('event').mkdir(exist_ok=True)
+        directory.joinpath('event', 'output.txt').write_text(text.upper())
+        return True
+
+
+def create_patient(path, idx=0, value=1, text='input'):
+    """Writes a patient with `input.txt` holding `text` in `path/trial`."""
+    config = {**default_config, 'value': value}
+    patient = Patient(pathlib.Path(path, 'trial'),
+                      idx=idx,
+                      config=config,
+                      runner=DummyRunner(write_config=True))
+    patient.write()
+    patient.dir.joinpath('input.txt').write_text(text)
+    return patient
+
+
+def run(cache, patient, idx, container, args):
+    """Evaluates the cache, recording the model's outputs on `patient`."""
+    success, outputs, key = cache.run(patient, idx, container, args=args)
+    patient.record_model(idx, success, outputs=outputs, fingerprint=key)
+    return success
+
+
+def output(patient):
+    return patient.dir.joinpath('event', 'output.txt')
+
+
+def test_fingerprint(tmpdir):
+    first = create_patient(tmpdir)
+    for name in ['isct.log', 'isct.log.1', 'isct.log.5', 'timings.jsonl']:
+        first.dir.joinpath(name).write_text('log')
+    files = snapshot(first.dir)
+    assert list(files) == ['input.txt']
+    key = fingerprint(first, 0, 'digest', files)
+
+    # the patient's identifier is not an input of the models
+    second = create_patient(tmpdir, idx=1)
+    assert fingerprint(second, 0, 'digest', files) == key
+
+    # the model, its image, the parameters, and its input files are
+    assert fingerprint(first, 1, 'digest', files) != key
+    assert fingerprint(first, 0, 'other', files) != key
+    third = create_patient(tmpdir, idx=2, value=2)
+    assert fingerprint(third, 0, 'digest', files) != key
+    other = snapshot(create_patient(tmpdir, idx=3, text='other').dir)
+    assert fingerprint(first, 0, 'digest', other) != key
+
+
+def test_fingerprinter_reuses_snapshot(tmpdir, mocker):
+    fingerprints = Fingerprinter()
+    container = FileContainer()
+    first = create_patient(tmpdir)
+    digest = mocker.spy(cache_module, 'file_digest')
+
+    assert run(fingerprints, first, 0, container, args=str(first.dir))
+    assert digest.call_count == 2
+
+    # the next model only hashes the files that changed
+    first.dir.joinpath('input.txt').write_text('changed')
+    fingerprints.inputs(first, 1, container)
+    assert digest.call_count == 3
+
+
+@pytest.mark.parametrize('link', [False, True])
+def test_cache_restores_output(tmpdir, link):
+    cache = ResultCache(pathlib.Path(tmpdir, 'cache'), link=link)
+    container = FileContainer()
+
+    first = create_patient(tmpdir)
+    assert run(cache, first, 0, container, args=str(first.dir))
+    assert container.calls == 1
+    assert output(first).read_text() == 'INPUT'
+
+    # the same inputs restore the output without evaluating the container
+    second = create_patient(tmpdir, idx=1)
+    assert run(cache, second, 0, container, args=str(second.dir))
+    assert container.calls == 1
+    assert output(second).read_text() == 'INPUT'
+
+    (_, _, entry), = cache.entries()
+    cached = entry.joinpath('files', 'event', 'output.txt')
+    assert os.path.samefile(cached, output(second)) == link
+
+    # earlier output of the model itself is not an input of the model
+    assert run(cache, second, 0, container, args=str(second.dir))
+    assert container.calls == 1
+
+    # changed inputs evaluate the container
+    third = create_patient(tmpdir, idx=2, text='other')
+    assert run(cache, third, 0, container, args=str(third.dir))
+    assert container.calls == 2
+    assert output(third).read_text() == 'OTHER'
+
+
+def test_cache_restore_evicted(tmpdir, monkeypatch):
+    cache = ResultCache(pathlib.Path(tmpdir, 'cache'))
+    container = FileContainer()
+    first = create_patient(tmpdir)
+    assert run(cache, first, 0, container, args=str(first.dir))
+
+    # the entry is evicted after its files are restored
+    utime = os.utime
+
+    def evicted(path, *args, **kwargs):
+        if pathlib.Path(path).name == 'manifest.json':
+            raise FileNotFoundError(path)
+        return utime(path, *args, **kwargs)
+
+    monkeypatch.setattr(os, 'utime', evicted)
+    second = create_patient(tmpdir, idx=1)
+    assert run(cache, second, 0, container, args=str(second.dir))
+    assert container.calls == 1
+    assert output(second).read_text() == 'INPUT'
+
+
+def test_cache_without_digest(tmpdir):
+    cache = ResultCache(pathlib.Path(tmpdir, 'cache'))
+    container = FileContainer(digest=None)
+
+    for idx in range(2):
+        first = create_patient(tmpdir, idx=idx)
+        assert run(cache, first, 0, container, args=str(first.dir))
+    assert container.calls == 2
+    assert not cache.entries()
+
+
+def test_cache_eviction(tmpdir):
+    # a cache holding at most two entries of six bytes
+    cache = ResultCache(pathlib.Path(tmpdir, 'cache'), max_size=12 / 2**20)
+    container = FileContainer()
+
+    patients = [create_patient(tmpdir, idx=i, text=f'input{i}')
+                for i in range(3)]
+    for i, p in enumerate(patients[:2]):
+        known = {path for (_, _, path) in cache.entries()}
+        run(cache, p, 0, container, args=str(p.dir))
+        entry, = {path for (_, _, path) in cache.entries()} - known
+        os.utime(entry.joinpath('manifest.json'), (i, i))
+
+    # the first entry is used recently, the second entry is evicted
+    run(cache, patients[0], 0, container, args=str(patients[0].dir))
+    run(cache, patients[2], 0, container, args=str(patients[2].dir))
+    assert container.calls == 3
+    assert len(cache.entries()) == 2
+
+    run(cache, patients[0], 0, container, args=str(patients[0].dir))
+    assert container.calls == 3
+    run(cache, patients[1], 0, container, args=str(patients[1].dir))
+    assert container.calls == 4
+    assert cache.size == 12 and len(cache.entries()) == 2
@@ -1,3 +1,4 @@
+import json
 import os
 import pathlib
 import pytest
@@ -53,3 +54,31 @@ def test_read_wrong_config(tmpdir, contents):
     # `FileNotFoundError`, which both have explicit except statements
     with pytest.raises(SystemExit, match=f'Loading YAML from `{path}` '):
         Config.read(path)
+
+
+@pytest.mark.parametrize('suffix', ['.yml', '.yaml', '.json', '.msgpack', ''])
+@pytest.mark.parametrize('testdict', [{}, {'path': '.', 'list': [1, 2.5]}])
+def test_read_write_config_formats(tmpdir, suffix, testdict):
+    if suffix == '.msgpack':
+        pytest.importorskip('msgpack')
+
+    path = pathlib.Path(tmpdir).joinpath(f'config{suffix}')
+    Config(path, testdict).write()
+    assert Config.read(path) == testdict
+
+
+def test_config_format_from_suffix(tmpdir):
+    path = pathlib.Path(tmpdir).joinpath('config.json')
+    Config(path, {'key': 'value'}).write()
+    assert json.loads(path.read_text()) == {'key': 'value'}
+
+    # YAML parses JSON, e.g. for files without a known suffix
+    unknown = path.rename(path.with_suffix('.txt'))
+    assert Config.read(unknown) == {'key': 'value'}
+
+
+def test_read_wrong_json_config(tmpdir):
+    path = pathlib.Path(tmpdir).joinpath('broken.json')
+    path.write_text('{"key":')
+    with pytest.raises(SystemExit, match=f'Loading JSON from `{path}` '):
+        Config.read(path)
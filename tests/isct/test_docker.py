@@ -1,3 +1,4 @@
+import click
 import os
 import pathlib
 import pytest
@@ -66,7 +67,7 @@ def test_docker_fix_permissions(mocker, tmpdir):
 
     # without docker group access, with root
     runner = DummyRunner()
-    container = Docker(path, docker_group=False, runner=runner)
+    container = Docker(path, docker_group=False, runner=runner, user=False)
     container.bind(host_path, '/patient')
     result = ' '.join(container.run(args='args'))
     for key in ['sudo', 'docker', 'run', 'chown -R']:
@@ -74,7 +75,7 @@ def test_docker_fix_permissions(mocker, tmpdir):
 
     # with docker group access, without root
     runner.clear()
-    container = Docker(path, docker_group=True, runner=runner)
+    container = Docker(path, docker_group=True, runner=runner, user=False)
     container.bind(host_path, '/patient')
     result = ' '.join(container.run(args='args'))
     stat = os.stat(host_path)
@@ -85,3 +86,60 @@ def test_docker_fix_permissions(mocker, tmpdir):
 
     for key in ['docker', 'run', '--entrypoint /bin/sh', '-c', 'chown -R']:
         assert key in result
+
+
+@pytest.mark.parametrize("platform", [OS.MACOS, OS.LINUX])
+@pytest.mark.parametrize("docker_group", [True, False])
+def test_docker_run_user(mocker, monkeypatch, tmpdir, platform,
+                         docker_group):
+    mocker.patch('desist.isct.utilities.OS.from_platform',
+                 return_value=platform)
+    path = pathlib.Path(tmpdir)
+
+    # on Linux, the container runs as the current user: a single command
+    runner = DummyRunner()
+    container = Docker(path, docker_group=docker_group, runner=runner)
+    container.bind(path, '/patient')
+    container.run(args='args')
+    assert len(runner.output) == 1
+    assert 'chown' not in runner
+
+    user = f'--user {os.getuid()}:{os.getgid()}'
+    assert (user in runner) == (platform == OS.LINUX)
+
+    # the permissions are updated afterwards with `DOCKER_USER=0`
+    monkeypatch.setenv('DOCKER_USER', '0')
+    runner.clear()
+    container = Docker(path, docker_group=docker_group, runner=runner)
+    container.bind(path, '/patient')
+    container.run(args='args')
+    assert user not in runner
+    assert ('chown -R' in runner) == (platform == OS.LINUX)
+
+
+@pytest.mark.parametrize('value, expected', [('', True), ('1', True),
+                                             ('1000', True), ('yes', True),
+                                             ('0', False), ('false', False),
+                                             ('No', False), ('root', False)])
+def test_docker_user_environment(monkeypatch, tmpdir, value, expected):
+    monkeypatch.setenv('DOCKER_USER', value)
+    assert Docker(tmpdir, runner=DummyRunner()).run_as_user == expected
+
+
+def test_docker_user_invalid(monkeypatch, tmpdir):
+    monkeypatch.setenv('DOCKER_USER', 'nobody')
+    with pytest.raises(click.UsageError):
+        Docker(tmpdir, runner=DummyRunner())
+
+
+def test_docker_user_failure(mocker, caplog, tmpdir):
+    mocker.patch('desist.isct.utilities.OS.from_platform',
+                 return_value=OS.LINUX)
+    runner = DummyRunner()
+    runner.run = lambda *args, **kwargs: False
+    container = Docker(tmpdir, docker_group=True, runner=runner)
+    container.bind(tmpdir, '/patient')
+
+    # failures running as the current user point to `DOCKER_USER=0`
+    assert container.run(args='args') is False
+    assert 'failed running as' in caplog.text
@@ -1,4 +1,8 @@
-from desist.isct.events import Events, Event
+import pytest
+import yaml
+
+from desist.isct.events import Events, Event, Resources
+from desist.isct.events import parse_memory, parse_walltime
 
 baseline = {
     'event': 'baseline',
@@ -65,3 +69,105 @@ def test_event_from_id():
     # event id of a given event
     assert events.event_id(Event(baseline)) == 0
     assert events.event_id(Event(stroke)) == 1
+
+
+def test_events_out_of_range():
+    events = Events([baseline, stroke])
+    for idx in [-1, 4, 100]:
+        assert events.model(idx) is None
+        assert events.label(idx) is None
+        assert events.event(idx) is None
+
+    event = Event(baseline)
+    assert event.model(2) is None and event.label(-1) is None
+
+
+def test_events_large_pipeline():
+    num_events, num_models = 40, 25
+    pipeline = [{
+        'event': f'event-{i}',
+        'models': [{'label': f'model-{i}-{j}'} for j in range(num_models)]
+    } for i in range(num_events)]
+    events = Events(pipeline)
+
+    assert len(list(events.models)) == num_events * num_models
+    for idx in range(num_events * num_models):
+        i, j = divmod(idx, num_models)
+        assert events.event(idx) == pipeline[i]
+        assert events.model(idx) == pipeline[i]['models'][j]
+        assert events.label(idx) == f'model-{i}-{j}'
+        assert events.event(idx).label(j) == events.label(idx)
+
+
+@pytest.mark.parametrize('memory, megabytes', [
+    (None, None),
+    (512, 512),
+    ('512MB', 512),
+    ('30GB', 30 * 1024),
+    ('1.5 GiB', 1536),
+    ('2t', 2 * 1024**2),
+])
+def test_parse_memory(memory, megabytes):
+    assert parse_memory(memory) == megabytes
+
+
+@pytest.mark.parametrize('walltime, seconds', [
+    (None, None),
+    (90, 90),
+    ('01:30', 90),
+    ('02:00:00', 7200),
+    (yaml.safe_load('walltime: 02:00:00')['walltime'], 7200),
+])
+def test_parse_walltime(walltime, seconds):
+    assert parse_walltime(walltime) == seconds
+
+
+@pytest.mark.parametrize('parse, value', [
+    (parse_memory, '30 apples'),
+    (parse_walltime, '2h'),
+    (Resources.from_dict, {'cores': 0}),
+])
+def test_invalid_resources(parse, value):
+    with pytest.raises(ValueError):
+        parse(value)
+
+
+def test_events_resources():
+    meshing = {
+        'label': 'meshing',
+        'resources': {'cores': 8, 'memory': '30GB', 'walltime': '01:00:00'},
+    }
+    clot = {'label': 'clot', 'resources': {'cores': 1, 'walltime': 600}}
+    events = Events([{'event': 'baseline', 'models': [meshing, clot]}])
+
+    assert events.resources(0) == Resources(8, 30 * 1024, 3600)
+    assert events.resources(1) == Resources(1, None, 600)
+    assert events[0] == Event(events[0])
+    assert Event(events[0]).resources(1) == events.resources(1)
+
+    # models without resources, or out of range, require a single core
+    assert events.resources(2) == Resources()
+    assert Events([baseline]).resources(0) == Resources(1, None, None)
+
+    # the pipeline requires the peak cores and memory and total walltime
+    assert events.peak_resources() == Resources(8, 30 * 1024, 4200)
+    assert Events([baseline]).peak_resources() == Resources()
+    assert Events([]).peak_resources() == Resources()
+
+    # sufficient resources for each of the resources
+    assert Resources.maximum([events.resources(0), events.resources(1)]) == (
+        Resources(8, 30 * 1024, 3600))
+    assert Resources.maximum([Resources(2), Resources(walltime=5)]) == (
+        Resources(2, None, None))
+
+
+def test_events_batch():
+    short = {'label': 'short', 'batch': 8}
+    events = Events([{'event': 'baseline', 'models': [short, {'label': 'a'}]}])
+
+    assert events.batch(0) == 8
+    assert events.batch(1) == 1
+    assert events.batch(2) == 1
+    assert events.batch_size == 8
+    assert Events([]).batch_size == 1
+    assert Events([baseline]).batch_size == 1
@@ -0,0 +1,115 @@
+import os
+import pathlib
+import pytest
+
+from desist.isct import history as runtime_history
+from desist.isct.history import RuntimeHistory, history_path, least_squares
+from desist.isct.history import compact, file_identity
+from desist.isct.index import index_dir
+from desist.isct.patient import Patient
+
+from .test_runner import DummyRunner
+from .test_utilities import default_config
+
+
+def record(model, duration, **config):
+    return {'label': model['label'], 'model': model, 'duration': duration,
+            'config': config}
+
+
+def create_patient(path, idx=0, **config):
+    return Patient(pathlib.Path(path),
+                   idx=idx,
+                   config={**default_config, **config},
+                   runner=DummyRunner(write_config=True))
+
+
+def test_least_squares():
+    rows = [[1.0, x] for x in range(4)]
+    assert least_squares(rows, [1 + 2 * x for x in range(4)]) == \
+        pytest.approx([1, 2])
+
+    # constant parameters are singular
+    assert least_squares([[1.0, 1.0]] * 4, [1, 2, 3, 4]) is None
+
+
+def test_history_predict(tmpdir):
+    first = create_patient(tmpdir)
+    model = first.events.model(1)
+    records = [record(model, 2), record(model, 4)]
+
+    history = RuntimeHistory(records)
+    assert len(history) == 1
+    assert history.predict(first, 1) == 3
+
+    # other models with the same label use the label's mean
+    other = [i for i, m in enumerate(first.events.models)
+             if m['label'] == model['label'] and m != model][0]
+    assert history.predict(first, other) == 3
+
+    # all other models use the mean over all labels
+    assert history.cost(first) == 3 * first['pipeline_length']
+
+
+def test_history_regression(tmpdir):
+    model = create_patient(tmpdir).events.model(0)
+    records = [record(model, 1 + 2 * x, size=x) for x in range(4)]
+    large = create_patient(tmpdir, size=10)
+
+    assert RuntimeHistory(records).predict(large, 0) == 4
+    history = RuntimeHistory(records, keys=['size'])
+    assert history.predict(large, 0) == pytest.approx(21)
+
+    # patients without the parameter use the mean runtime
+    assert history.predict(create_patient(tmpdir), 0) == 4
+
+
+def test_history_record(tmpdir):
+    first = create_patient(tmpdir, size=2, name='patient')
+
+    # the history is only recorded for trials with metadata
+    RuntimeHistory.record(first, 0, 1.5)
+    assert not history_path(tmpdir).exists()
+
+    pathlib.Path(tmpdir, index_dir).mkdir()
+    RuntimeHistory.record(first, 0, 1.5)
+    with open(history_path(tmpdir), 'a') as outfile:
+        outfile.write('{"label": \n')
+    RuntimeHistory.record(first, 1, 2.5)
+
+    history = RuntimeHistory.read(tmpdir, keys=['size'])
+    assert len(history) == 2
+    assert history.predict(first, 0) == 1.5
+    assert history.predict(first, 1) == 2.5
+    assert history.estimates[next(iter(history.estimates))].keys == ['size']
+
+    # only numeric parameters are recorded
+    line = history_path(tmpdir).read_text().splitlines()[0]
+    assert '"size": 2' in line
+    assert 'name' not in line
+
+
+def test_history_compaction(tmpdir, monkeypatch):
+    monkeypatch.setattr(runtime_history, 'history_size', 2)
+    first = create_patient(tmpdir)
+    pathlib.Path(tmpdir, index_dir).mkdir()
+    for duration in range(30):
+        RuntimeHistory.record(first, 0, duration)
+    RuntimeHistory.record(first, 1, 1)
+
+    # the history is compacted once it outgrows the retained records
+    history = RuntimeHistory.read(tmpdir)
+    assert len(history_path(tmpdir).read_text().splitlines()) == 3
+    assert history.predict(first, 0) == 28.5
+    assert RuntimeHistory.read(tmpdir).predict(first, 0) == 28.5
+    assert RuntimeHistory.read(tmpdir).predict(first, 1) == 1
+
+    # records appended while reading the history are not compacted away
+    for duration in range(30):
+        RuntimeHistory.record(first, 0, duration)
+    path = history_path(tmpdir)
+    identity = file_identity(os.stat(path))
+    RuntimeHistory.record(first, 1, 3)
+    compact(path, [], identity)
+    assert len(path.read_text().splitlines()) == 34
+    assert not list(path.parent.glob('*.tmp'))
@@ -0,0 +1,92 @@
+import os
+import pathlib
+import shutil
+
+from desist.isct.config import Config
+from desist.isct.index import TrialIndex, index_path
+from desist.isct.patient import Patient, patient_config
+from desist.isct.runner import Logger
+from desist.isct.trial import Trial
+
+
+def test_index_created_with_trial(tmpdir):
+    trial = Trial(tmpdir, sample_size=3, runner=Logger()).create()
+    assert index_path(trial.dir).exists()
+
+    index = TrialIndex.read(trial.dir)
+    assert sorted(index) == [f'patient_{i:05}' for i in range(3)]
+    for i, (name, entry) in enumerate(sorted(index.items())):
+        assert entry['id'] == i
+        assert entry['prefix'] == 'patient'
+        assert entry['config'] == patient_config
+
+
+def test_index_only_parses_modified_patients(mocker, tmpdir):
+    trial = Trial(tmpdir, sample_size=5, runner=Logger()).create()
+    assert len(trial) == 5
+
+    parse = mocker.spy(Config, 'read')
+    assert len(trial) == 5
+    assert len(list(trial.patients)) == 5
+    assert parse.call_count == 0, "fresh index should not parse patients"
+
+    # writing through `Patient.write` keeps the index up to date
+    patient = Patient.read(trial.dir.joinpath('patient_00000', patient_config))
+    patient['key'] = 'value'
+    patient.write()
+
+    parse.reset_mock()
+    assert len(trial) == 5
+    assert parse.call_count == 0, "updated patient should not be parsed"
+
+
+def test_index_detects_external_changes(tmpdir):
+    trial = Trial(tmpdir, sample_size=3, runner=Logger()).create()
+    assert len(trial) == 3
+
+    # patients removed or added outside of `desist` are picked up
+    shutil.rmtree(trial.dir.joinpath('patient_00001'))
+    assert len(trial) == 2
+
+    Patient(trial.dir, idx=10).write()
+    assert len(trial) == 3
+
+    # a patient written without index update is parsed again
+    path = trial.dir.joinpath('patient_00000', patient_config)
+    os.utime(path, ns=(0, 0))
+    assert len(trial) == 3
+    assert TrialIndex.read(trial.dir)['patient_00000']['mtime'] == 0
+
+    # a directory without patient configuration is not considered
+    os.makedirs(trial.dir.joinpath('empty'))
+    assert len(trial) == 3
+
+
+def test_index_recovers_from_corrupt_lines(tmpdir):
+    trial = Trial(tmpdir, sample_size=3, runner=Logger()).create()
+    path = index_path(trial.dir)
+    with open(path, 'a') as outfile:
+        outfile.write('{"name": "patient_00001", "id"')
+
+    index = TrialIndex.read(trial.dir)
+    assert len(index) == 3
+    assert len(Trial.read(trial.path)) == 3
+
+
+def test_index_compacts_journal(tmpdir):
+    trial = Trial(tmpdir, sample_size=2, runner=Logger()).create()
+    patient = Patient.read(trial.dir.joinpath('patient_00000', patient_config))
+    for _ in range(32):
+        patient.write()
+
+    path = pathlib.Path(index_path(trial.dir))
+    assert len(path.read_text().splitlines()) > 32
+
+    assert len(Trial.read(trial.path)) == 2
+    assert len(path.read_text().splitlines()) == 2
+
+
+def test_index_not_created_outside_trial(tmpdir):
+    patient = Patient(tmpdir)
+    patient.write()
+    assert not index_path(tmpdir).exists()
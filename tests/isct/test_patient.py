@@ -1,7 +1,12 @@
+import copy
 import os
+import pickle
 import pathlib
 import pytest
 
+from desist.isct.cache import Fingerprinter, ResultCache
+from desist.isct.history import history_path
+from desist.isct.index import index_dir
 from desist.isct.utilities import OS, CleanFiles
 from desist.isct.patient import Patient, patient_config, LowStoragePatient
 from .test_runner import DummyRunner
@@ -73,6 +78,23 @@ def test_patient_config(tmpdir, idx, prefix, config):
         assert patient.get(k) == config.get(k)
 
 
+def test_patient_events_cached(tmpdir):
+    patient = Patient(tmpdir, config=copy.deepcopy(default_config))
+    events = patient.events
+    assert patient.events is events
+
+    # replacing the events invalidates the cached events
+    patient['events'] = patient['events'][:1]
+    assert patient.events is not events
+    assert len(patient.events) == 1
+    patient.update(events=[])
+    assert len(patient.events) == 0
+
+    # the cached events survive pickling, e.g. when sent to workers
+    copied = pickle.loads(pickle.dumps(patient))
+    assert copied.events == patient.events
+
+
 def test_patient_create(tmpdir):
     patient = Patient(tmpdir)
     patient.create()
@@ -122,6 +144,248 @@ def test_patient_failed_event(mocker, tmpdir, platform):
         patient.run()
 
 
+def test_patient_run_models(mocker, tmpdir):
+    path = pathlib.Path(tmpdir)
+    runner = DummyRunner(write_config=True)
+    patient = Patient(path, runner=runner, config=default_config)
+    models = patient['pipeline_length']
+    assert models > 2
+
+    # the patient is only completed after running the last model
+    patient.run(models=[0, 1])
+    assert len([c for c in runner.output if 'run' in c]) == 2
+    assert not patient.completed
+    assert not patient.completes_pipeline([0, 1])
+
+    patient.run(models=range(2, models))
+    assert patient.completed
+    assert patient.completes_pipeline(range(2, models))
+    assert patient.completes_pipeline()
+
+
+def test_lowstorage_patient_run_models(mocker, tmpdir):
+    path = pathlib.Path(tmpdir)
+    patient = LowStoragePatient(path,
+                                runner=DummyRunner(write_config=True),
+                                config=default_config)
+    clean = mocker.patch.object(patient, 'clean')
+    models = patient['pipeline_length']
+
+    # intermediate output is kept for the subsequent models
+    patient.run(models=[0])
+    clean.assert_not_called()
+
+    patient.run(models=[models - 1])
+    clean.assert_called_once()
+
+    # the files are cleaned when a model fails
+    clean.reset_mock()
+    mocker.patch.object(patient, 'run_model', side_effect=AssertionError)
+    with pytest.raises(AssertionError):
+        patient.run(models=[0])
+    clean.assert_called_once()
+
+
+def test_patient_resume(mocker, tmpdir):
+    path = pathlib.Path(tmpdir)
+    runner = DummyRunner(write_config=True)
+    patient = Patient(path, runner=runner, config=default_config)
+    models = patient['pipeline_length']
+    assert patient.first_incomplete_model() == 0
+
+    # the third model fails: the status of the evaluated models is persisted
+    run = mocker.patch('desist.isct.docker.Docker.run',
+                       side_effect=[True, True, False])
+    with pytest.raises(AssertionError):
+        patient.run()
+
+    patient = Patient.read(patient.path, runner=runner)
+    status = [model['status'] for model in patient.model_status]
+    assert status == ['completed', 'completed', 'failed']
+    assert patient.model_status[0]['label'] == patient.events.label(0)
+    assert all('time' in model for model in patient.model_status)
+    assert patient.first_incomplete_model() == 2
+    assert not patient.completed
+
+    # resuming starts at the failed model
+    run.reset_mock(side_effect=True)
+    run.return_value = True
+    patient.run(resume=True)
+    assert run.call_count == models - 2
+    assert patient.completed
+    assert patient.first_incomplete_model() == models
+
+    # a changed pipeline invalidates the status from the changed model
+    patient['model_status'][1]['label'] = 'other'
+    assert patient.first_incomplete_model() == 1
+
+    # resetting clears the status
+    patient.reset()
+    assert Patient.read(patient.path).first_incomplete_model() == 0
+
+
+def test_patient_invalidate(mocker, tmpdir):
+    path = pathlib.Path(tmpdir)
+    runner = DummyRunner(write_config=True)
+    runner.cache = Fingerprinter()
+    patient = Patient(path, runner=runner, config=default_config)
+    patient.write()
+    patient.dir.joinpath('input.txt').write_text('input')
+    models = patient['pipeline_length']
+
+    mocker.patch('desist.isct.docker.Docker.digest', return_value='digest')
+    run = mocker.patch('desist.isct.docker.Docker.run', return_value=True)
+    patient.run()
+    assert all('fingerprint' in model for model in patient.model_status)
+
+    # the patient is up to date
+    assert patient.invalidate(runner.cache) == models
+    assert patient.completed
+
+    # a changed model invalidates the model and its subsequent models
+    patient['events'][1]['models'][0]['value'] = 1
+    assert patient.invalidate(runner.cache) == 2
+    assert len(patient.model_status) == 2
+    assert not Patient.read(patient.path).completed
+
+    run.reset_mock()
+    patient.run(resume=True)
+    assert run.call_count == models - 2
+    assert patient.invalidate(runner.cache) == models
+
+    # changed input files invalidate all models
+    patient.dir.joinpath('input.txt').write_text('other')
+    assert patient.first_incomplete_model() == models
+    assert patient.first_outdated_model(runner.cache) == 0
+
+    # as do unknown container digests
+    patient.dir.joinpath('input.txt').write_text('input')
+    assert patient.first_outdated_model(Fingerprinter()) == models
+    mocker.patch('desist.isct.docker.Docker.digest', return_value=None)
+    assert patient.first_outdated_model(Fingerprinter()) == 0
+
+
+def test_patient_invalidate_partial_outputs(mocker, tmpdir):
+    runner = DummyRunner(write_config=True)
+    runner.cache = Fingerprinter()
+    patient = Patient(pathlib.Path(tmpdir), runner=runner,
+                      config=copy.deepcopy(default_config))
+    patient.write()
+    models = patient['pipeline_length']
+    failing = [models - 1]
+
+    def run(self, args=''):
+        """Writes a file for each model, failing the models in `failing`."""
+        idx = int(args.split()[1])
+        patient.dir.joinpath(f'model_{idx}.txt').write_text(f'{idx}')
+        return idx not in failing
+
+    mocker.patch('desist.isct.docker.Docker.digest', return_value='digest')
+    mocker.patch('desist.isct.docker.Docker.run', run)
+    with pytest.raises(AssertionError):
+        patient.run()
+
+    # the partial output of the failed model is not an input of the others
+    assert patient.model_status[-1]['outputs'] == [f'model_{models - 1}.txt']
+    assert patient.invalidate(runner.cache) == models - 1
+
+    failing.clear()
+    patient.run(resume=True)
+    assert patient.invalidate(runner.cache) == models
+
+    # the models evaluated again are up to date, despite the output of the
+    # outdated models present on disk
+    patient['events'][1]['models'][0]['value'] = 'changed'
+    assert patient.invalidate(runner.cache) == 2
+    assert patient.model_status[2]['status'] == 'outdated'
+    patient.run(resume=True)
+    assert patient.invalidate(runner.cache) == models
+
+
+def test_patient_runtime_history_cache(mocker, tmpdir):
+    path = pathlib.Path(tmpdir)
+    path.joinpath(index_dir).mkdir()
+    runner = DummyRunner(write_config=True)
+    runner.cache = ResultCache(path.joinpath('cache'))
+
+    def run(self, args=''):
+        """Times the invocations, similar to the runners."""
+        self.invocation.started()
+        self.invocation.finished(0)
+        return True
+
+    mocker.patch('desist.isct.docker.Docker.digest', return_value='digest')
+    mocker.patch('desist.isct.docker.Docker.run', run)
+    first, second = [Patient(path, idx=i, runner=runner, config=default_config)
+                     for i in range(2)]
+    for patient in (first, second):
+        patient.write()
+        patient.run()
+
+    # restored outputs are not recorded as runtimes of the models
+    models = first['pipeline_length']
+    assert all('duration' in model for model in first.model_status)
+    assert not any('duration' in model for model in second.model_status)
+    assert len(history_path(path).read_text().splitlines()) == models
+
+
+def test_patient_exit_code(mocker, tmpdir):
+    def run(self, args=''):
+        """Times the invocations, failing the second model."""
+        exit_code = 2 if ' 1 event' in args else 0
+        self.invocation.started()
+        self.invocation.finished(exit_code)
+        return exit_code == 0
+
+    mocker.patch('desist.isct.docker.Docker.run', run)
+    patient = Patient(tmpdir, runner=DummyRunner(write_config=True),
+                      config=default_config)
+    patient.write()
+    with pytest.raises(AssertionError):
+        patient.run()
+
+    # the exit codes of the containers are recorded with the models' status
+    first, second = patient.model_status
+    assert (first['status'], first['exit_code']) == ('completed', 0)
+    assert (second['status'], second['exit_code']) == ('failed', 2)
+
+
+def test_patient_record_model_keeps_changes(tmpdir):
+    patient = Patient(tmpdir, runner=DummyRunner(write_config=True),
+                      config=default_config)
+    patient.write()
+
+    # a container modifies the configuration during the pipeline
+    modified = Patient.read(patient.path)
+    modified['parameter'] = 1
+    modified.write()
+
+    patient.record_model(0, True)
+    patient.record_model(1, True)
+    config = Patient.read(patient.path)
+    assert config['parameter'] == 1
+    assert config.model_status == patient.model_status
+    assert len(config.model_status) == 2
+
+
+def test_lowstorage_patient_resume(mocker, tmpdir):
+    path = pathlib.Path(tmpdir)
+    patient = LowStoragePatient(path,
+                                runner=DummyRunner(write_config=True),
+                                config=default_config)
+    patient.record_model(0, True)
+    assert patient.first_incomplete_model() == 1
+
+    # the output of the completed models is kept: the status is kept
+    patient.clean()
+    assert patient.first_incomplete_model() == 1
+
+    # the output of the completed models is cleaned: the status is cleared
+    patient.file_cleaner.mode = CleanFiles.ALL
+    patient.clean()
+    assert patient.first_incomplete_model() == 0
+
+
 def test_lowstorage_patient(tmpdir):
     path = pathlib.Path(tmpdir)
     patient = Patient(path, runner=DummyRunner())
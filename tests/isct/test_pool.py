@@ -0,0 +1,232 @@
+import concurrent.futures
+import multiprocessing
+import pathlib
+import pickle
+import pytest
+import re
+import subprocess
+
+from desist.isct.docker import Docker
+from desist.isct.pool import ContainerPool
+from desist.isct.singularity import Singularity
+from desist.isct.utilities import OS
+
+from .test_runner import DummyRunner
+
+
+class FailingRunner(DummyRunner):
+    """Fails the commands evaluating the `fail` argument."""
+    def run(self, cmd, check=True, shell=False, invocation=None):
+        super().run(cmd, check=check, shell=shell)
+        return 'fail' not in self.format(cmd).split()
+
+
+class FileRunner(DummyRunner):
+    """Appends the commands to `path`, such that these outlive processes."""
+    def __init__(self, path):
+        super().__init__()
+        self.path = path
+
+    def run(self, cmd, check=True, shell=False, invocation=None):
+        with open(self.path, 'a') as outfile:
+            outfile.write(f'{self.format(cmd)}\n')
+        return True
+
+
+def commands(runner, key):
+    """Returns the commands of `runner` containing `key`."""
+    output = [c if isinstance(c, str) else " ".join(c) for c in runner.output]
+    return [cmd for cmd in output if key in cmd]
+
+
+def docker(root, runner, patient='patient_00000'):
+    container = Docker(root.joinpath('container'), runner=runner)
+    container.bind(root.joinpath(patient), '/patient')
+    return container
+
+
+@pytest.fixture
+def root(mocker, tmpdir):
+    mocker.patch('desist.isct.utilities.OS.from_platform',
+                 return_value=OS.MACOS)
+    inspect = mocker.patch('desist.isct.docker.subprocess.run')
+    inspect.return_value.stdout = '["python3", "api.py"]\n'
+    return pathlib.Path(tmpdir)
+
+
+def test_pool_reuses_instances(root):
+    runner = DummyRunner()
+    with ContainerPool(root, uses=2) as pool:
+        runner.pool = pool
+        for i in range(3):
+            container = docker(root, runner, f'patient_{i:05}')
+            assert container.run(args='/patient/patient.yml 0 event')
+
+        # the instance is recycled after two uses
+        assert len(commands(runner, 'docker run -d')) == 2
+        assert len(commands(runner, 'docker rm -f')) == 1
+        assert pool.started == 2
+
+    # the idle instance is stopped when closing the pool
+    assert len(commands(runner, 'docker rm -f')) == 2
+
+    # the instances bind the root at its own path, while the arguments are
+    # translated to the patients' directories on the host
+    start = commands(runner, 'docker run -d')[0]
+    assert f'-v {root}:{root}' in start
+    assert '--entrypoint tail' in start
+    execs = commands(runner, 'docker exec')
+    assert len(execs) == 3
+    for i, cmd in enumerate(execs):
+        assert f'{root}/patient_{i:05}/patient.yml' in cmd
+        assert '/patient ' not in cmd
+
+
+def test_pool_recycles_failures(root):
+    runner = FailingRunner()
+    pool = ContainerPool(root, uses=10)
+    runner.pool = pool
+
+    assert docker(root, runner).run(args='ok') is True
+    assert docker(root, runner).run(args='fail') is False
+    assert docker(root, runner).run(args='ok') is True
+
+    # the failing instance is replaced by a new instance
+    assert pool.started == 2
+    assert len(commands(runner, 'docker rm -f')) == 1
+    pool.close()
+    assert len(commands(runner, 'docker rm -f')) == 2
+
+
+def test_pool_uncovered_volumes(root, tmpdir_factory):
+    runner = DummyRunner()
+    runner.pool = ContainerPool(root)
+
+    # volumes outside of the pool's root start a fresh container
+    container = Docker(root, runner=runner)
+    container.bind(tmpdir_factory.mktemp('other'), '/patient')
+    assert not runner.pool.covers(container)
+    container.run(args='args')
+    assert commands(runner, 'docker run -v')
+    assert not commands(runner, 'docker exec')
+
+
+def test_pool_translate_whitespace(root):
+    runner = DummyRunner()
+    root = root.joinpath('in silico trial')
+    with ContainerPool(root) as pool:
+        runner.pool = pool
+        container = docker(root, runner)
+        container.run(args="/patient/patient.yml 0 'some event'")
+
+    # the host paths and quoted arguments are passed as single arguments
+    execs = [cmd for cmd in runner.output if 'exec' in cmd]
+    assert len(execs) == 1
+    assert execs[0][-3:] == [f'{root}/patient_00000/patient.yml', '0',
+                             'some event']
+
+
+@pytest.mark.parametrize('entrypoint', ['null', '["python3", "api.py"]'])
+def test_pool_without_entrypoint(mocker, caplog, root, entrypoint):
+    inspect = mocker.patch('desist.isct.docker.subprocess.run')
+    inspect.return_value.stdout = f'{entrypoint}\n'
+
+    runner = DummyRunner()
+    with ContainerPool(root) as pool:
+        runner.pool = pool
+        for i in range(2):
+            docker(root, runner).run(args='/patient/patient.yml 0 event')
+
+    # images without entrypoint are started afresh, instead of in instances
+    warm = entrypoint != 'null'
+    assert bool(commands(runner, 'docker exec')) == warm
+    assert len(commands(runner, 'docker run -v')) == (0 if warm else 2)
+    assert len(caplog.messages) == (0 if warm else 1)
+
+    # the entrypoint is read on inspecting the image and on starting the
+    # instance, the tools required by the instances are checked once
+    calls = [call[0][0] for call in inspect.call_args_list]
+    inspected = [cmd for cmd in calls if '{{json .Config.Entrypoint}}' in cmd]
+    assert len(inspected) == (2 if warm else 1)
+    assert len(calls) - len(inspected) == (1 if warm else 0)
+
+
+def test_pool_entrypoint_arguments(mocker, root):
+    inspect = mocker.patch('desist.isct.docker.subprocess.run')
+    inspect.return_value.stdout = '["python3", "my api.py", "--flag=\'x\'"]'
+
+    runner = DummyRunner()
+    with ContainerPool(root) as pool:
+        runner.pool = pool
+        docker(root, runner).run(args='/patient/patient.yml 0 event')
+
+    # the entrypoint is passed to `docker exec` without a shell
+    execs = [cmd for cmd in runner.output if 'exec' in cmd]
+    assert len(execs) == 1
+    assert execs[0][3:6] == ['python3', 'my api.py', "--flag='x'"]
+    assert '/bin/sh' not in execs[0]
+
+
+def test_pool_without_tools(mocker, caplog, root):
+    def inspect(cmd, **kwargs):
+        if '/bin/sh' in cmd:
+            raise subprocess.CalledProcessError(127, cmd)
+        return mocker.Mock(stdout='["python3", "api.py"]')
+
+    mocker.patch('desist.isct.docker.subprocess.run', inspect)
+    runner = DummyRunner()
+    with ContainerPool(root) as pool:
+        runner.pool = pool
+        docker(root, runner).run(args='/patient/patient.yml 0 event')
+
+    # images lacking `/bin/sh` or `tail` are started afresh
+    assert not commands(runner, 'docker exec')
+    assert commands(runner, 'docker run -v')
+    assert len(caplog.messages) == 1
+
+
+def test_pool_singularity(root):
+    runner = DummyRunner()
+    with ContainerPool(root) as pool:
+        runner.pool = pool
+        container = Singularity(root.joinpath('container'), root,
+                                runner=runner)
+        container.bind(root.joinpath('patient_00000'), '/patient')
+        container.run(args='/patient/patient.yml 0 event')
+
+    sif = root.joinpath('container.sif')
+    assert commands(runner, f'instance start --containall -B {root}:{root}')
+    assert commands(runner, f'{sif} desist-container-')
+    assert commands(runner, 'singularity run instance://desist-container-')
+    assert commands(runner, 'singularity instance stop desist-container-')
+
+
+def test_pool_pickle(root):
+    pool = ContainerPool(root, uses=3)
+    assert pickle.loads(pickle.dumps(pool)) is pool
+
+
+def run_pooled(runner, root, patient):
+    """Evaluates a container for `patient` through the pool of `runner`."""
+    return docker(root, runner, patient).run(args='/patient/patient.yml')
+
+
+def test_pool_worker_processes(root):
+    runner = FileRunner(root.joinpath('commands'))
+    with ContainerPool(root, uses=100) as pool:
+        runner.pool = pool
+
+        # forked workers inherit the pool of the parent process
+        context = multiprocessing.get_context('fork')
+        with concurrent.futures.ProcessPoolExecutor(
+                2, mp_context=context) as executor:
+            patients = [f'patient_{i:05}' for i in range(8)]
+            assert all(executor.map(run_pooled, [runner] * 8, [root] * 8,
+                                    patients))
+
+    # each worker stops the instances it started
+    output = runner.path.read_text()
+    started = re.findall(r'docker run -d --rm --name (\S+)', output)
+    stopped = re.findall(r'docker rm -f (\S+)', output)
+    assert len(started) > 1
+    assert sorted(started) == sorted(stopped)
@@ -1,8 +1,20 @@
+import asyncio
+import concurrent.futures
+import inspect
+import logging
+import os
+import pathlib
 import pytest
+import sys
+import threading
+import time
 
 from desist.isct.runner import Runner, LocalRunner, Logger, ParallelRunner
-from desist.isct.runner import QCGRunner
-from desist.isct.runner import new_runner
+from desist.isct.runner import QCGRunner, PoolRunner, AsyncRunner
+from desist.isct.runner import new_runner, stream_output, OutputTail
+from desist.isct.runner import imap_unordered
+from logging.handlers import RotatingFileHandler
+from desist.isct.events import Resources
 
 
 class DummyRunner(Runner):
@@ -35,7 +47,7 @@ class DummyRunner(Runner):
         """Clears the stored commands in `self.output`."""
         self.output = []
 
-    def run(self, cmd, check=True, shell=False):
+    def run(self, cmd, check=True, shell=False, invocation=None):
         """Mocks the command by appending the command to `self.output`."""
         self.output.append(cmd)
         return cmd
@@ -61,6 +73,56 @@ def test_new_runner_qcg(verbose, parallel, qcg, logger):
     assert isinstance(new_runner(verbose, parallel, qcg), logger)
 
 
+@pytest.mark.parametrize('jobs, logger', [(1, LocalRunner), (4, PoolRunner)])
+def test_new_runner_jobs(jobs, logger):
+    assert isinstance(new_runner(False, jobs=jobs), logger)
+    assert isinstance(new_runner(True, jobs=jobs), Logger)
+
+
+@pytest.mark.parametrize('jobs', [1, 4])
+def test_new_runner_asynchronous(jobs):
+    runner = new_runner(False, jobs=jobs, asynchronous=True)
+    assert isinstance(runner, AsyncRunner)
+    assert runner.jobs == jobs
+    assert isinstance(new_runner(True, asynchronous=True), Logger)
+
+
+def test_runner_map():
+    runner = DummyRunner()
+    assert list(runner.map(abs, range(-5, 5))) == list(map(abs, range(-5, 5)))
+
+
+@pytest.mark.parametrize('jobs', [1, 2, 4])
+def test_pool_runner_map(jobs):
+    runner = PoolRunner(jobs)
+    assert runner.write_config
+    result = runner.map(abs, range(-50, 50))
+    assert sorted(result) == sorted(map(abs, range(-50, 50)))
+
+
+def log_pid(i):
+    """Logs a message from the worker process, returning its pid."""
+    logging.warning(f'worker {i}')
+    return os.getpid()
+
+
+def test_pool_runner_logs(tmpdir):
+    log = pathlib.Path(tmpdir).joinpath('isct.log')
+    handler = RotatingFileHandler(log, maxBytes=100000, backupCount=5)
+    logging.getLogger().addHandler(handler)
+    try:
+        pids = set(PoolRunner(2).map(log_pid, range(8)))
+    finally:
+        logging.getLogger().removeHandler(handler)
+        handler.close()
+
+    # the workers write to log files of their own, not the driver's
+    assert not log.exists() or 'worker' not in log.read_text()
+    logs = [log.with_name(f'isct.log.{pid}') for pid in pids]
+    assert all(path.exists() for path in logs)
+    assert sum(path.read_text().count('worker') for path in logs) == 8
+
+
 def test_test_runner():
     runner = DummyRunner()
     cmd = ["cmd", "cmd"]
@@ -75,6 +137,24 @@ def test_local_runner():
     assert runner.run("false", check=False)
 
 
+def test_local_runner_streams_output(caplog):
+    runner = LocalRunner(tail=3)
+
+    with caplog.at_level(logging.INFO):
+        assert runner.run(['echo', 'hello'])
+        assert runner.run('echo $((1 + 1))', shell=True)
+    assert 'hello' in caplog.messages
+    assert '2' in caplog.messages
+
+    # on failure only the tail of the output is reported
+    cmd = [sys.executable, '-c', 'print(*range(100), sep="\\n"); exit(1)']
+    with caplog.at_level(logging.INFO):
+        caplog.clear()
+        assert not runner.run(cmd)
+    assert caplog.messages[1:101] == [str(i) for i in range(100)]
+    assert 'Captured output: 97\n98\n99' in caplog.messages
+
+
 def test_parallel_runner(capsys):
     cmd = 'desist trial this is a dummy command'
     runner = ParallelRunner()
@@ -84,6 +164,11 @@ def test_parallel_runner(capsys):
     out, _ = capsys.readouterr()
     assert cmd in out
 
+    # the arguments of `Runner.run` are accepted, but ignored
+    runner.run(cmd.split(), check=False, shell=True, invocation=None)
+    out, _ = capsys.readouterr()
+    assert out == f'{cmd}\n'
+
 
 def test_qcg_runner():
     pytest.importorskip("qcg.pilotjob.api.manager")
@@ -100,3 +185,142 @@ def test_qcg_runner():
     assert job['resources']['numCores']['exact'] == 1
 
     runner.wait()
+
+
+def test_qcg_runner_signature():
+    # the runner accepts the arguments of any runner
+    parameters = inspect.signature(QCGRunner.run).parameters
+    assert list(parameters)[:5] == ['self', 'cmd', 'check', 'shell',
+                                    'invocation']
+    for key in ['resources', 'name', 'after']:
+        assert parameters[key].kind == inspect.Parameter.KEYWORD_ONLY
+
+
+def test_qcg_runner_resources():
+    pytest.importorskip("qcg.pilotjob.api.manager")
+
+    runner = QCGRunner()
+    runner.run(['true'], resources=Resources(cores=8, walltime=3601))
+
+    runner.run(['true'], name='second', after=['first'])
+
+    job = runner.jobs.jobs()[0]
+    assert job['resources']['numCores']['exact'] == 8
+    assert job['resources']['wt'] == '61m'
+
+    job = runner.jobs.jobs()[1]
+    assert job['name'] == 'second'
+    assert job['dependencies']['after'] == ['first']
+
+
+def test_qcg_runner_iterations(tmpdir):
+    pytest.importorskip("qcg.pilotjob.api.manager")
+
+    runner = QCGRunner()
+    assert runner.active_manager is None
+
+    # the manager is started on submission of the first iterations
+    output = pathlib.Path(tmpdir).joinpath('output')
+    runner.run_iterations(f'echo ${{it}} >> {output}', 3, name='iterations')
+    assert runner.active_manager is not None
+
+    runner.wait()
+    assert runner.active_manager is None
+    assert sorted(output.read_text().split()) == ['0', '1', '2']
+
+
+@pytest.mark.parametrize('capacity', [1, 3, 8])
+def test_imap_unordered_weights(capacity):
+    lock = threading.Lock()
+    in_use, peak = [0], [0]
+
+    def func(weight):
+        with lock:
+            in_use[0] += min(weight, capacity)
+            peak[0] = max(peak[0], in_use[0])
+        time.sleep(0.001)
+        with lock:
+            in_use[0] -= min(weight, capacity)
+        return weight
+
+    weights = [1, 4, 2, 1, 1, 8, 3, 1, 2, 1] * 3
+    with concurrent.futures.ThreadPoolExecutor(8) as executor:
+        result = imap_unordered(executor, func, weights, capacity,
+                                weight=lambda x: x)
+        assert sorted(result) == sorted(weights)
+
+    assert peak[0] <= capacity
+
+
+@pytest.mark.parametrize('data, lines', [
+    (b'', []),
+    (b'a\nb\n', ['a', 'b']),
+    (b'a\r\nb', ['a', 'b']),
+    (b'x' * 10 + b'\ny', ['xxxx', 'xxxx', 'xx', 'y']),
+])
+def test_output_tail(caplog, data, lines):
+    with caplog.at_level(logging.INFO):
+        tail = OutputTail(maxlen=2, chunk_size=4)
+        for i in range(0, len(data), 4):
+            tail.feed(data[i:i + 4])
+        tail.flush()
+
+    assert caplog.messages == lines
+    assert list(tail.lines) == lines[-2:]
+    assert str(tail) == '\n'.join(lines[-2:])
+
+
+@pytest.mark.parametrize('data, lines', [
+    (b'', []),
+    (b'a\nb\n', ['a', 'b']),
+    (b'x' * 10 + b'\ny', ['xxxx', 'xxxx', 'xx', 'y']),
+])
+def test_stream_output(data, lines):
+    async def stream():
+        reader = asyncio.StreamReader()
+        reader.feed_data(data)
+        reader.feed_eof()
+        tail = OutputTail(maxlen=2, chunk_size=4)
+        await stream_output(reader, tail)
+        return tail
+
+    assert list(asyncio.run(stream()).lines) == lines[-2:]
+
+
+def test_async_runner(caplog):
+    runner = AsyncRunner(jobs=2, tail=3)
+    assert runner.write_config
+
+    with caplog.at_level(logging.INFO):
+        assert runner.run(['echo', 'hello'])
+        assert runner.run('echo $((1 + 1))', shell=True)
+    assert 'hello' in caplog.messages
+    assert '2' in caplog.messages
+
+    # on failure only the tail of the output is reported
+    cmd = [sys.executable, '-c', 'print(*range(100), sep="\\n"); exit(1)']
+    with caplog.at_level(logging.CRITICAL):
+        caplog.clear()
+        assert not runner.run(cmd)
+        assert runner.run(cmd, check=False)
+    assert 'Captured output: 97\n98\n99' in caplog.messages
+
+    runner.close()
+
+
+def test_async_runner_map():
+    runner = AsyncRunner(jobs=4)
+
+    def func(i):
+        return runner.run(['true'] if i % 2 else ['false'])
+
+    assert sorted(runner.map(func, range(10))) == [False] * 5 + [True] * 5
+
+    # the runner restarts its event loop after closing
+    assert runner._loop is None
+    loop = runner.loop
+    assert runner.run(['true'])
+    runner.close()
+
+    # the closed loop releases its resources
+    assert loop.is_closed()
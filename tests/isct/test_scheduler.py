@@ -0,0 +1,134 @@
+import pathlib
+import pytest
+import threading
+import time
+
+from desist.isct.events import Events
+from desist.isct.patient import Patient
+from desist.isct.scheduler import ModelScheduler
+
+from .test_runner import DummyRunner
+
+events = Events([{
+    'event': 'event',
+    'models': [{'label': 'a'}, {'label': 'b'}, {'label': 'c'}],
+}])
+
+
+class RecordingPatient(Patient):
+    """A patient recording the evaluated models instead of running them.
+
+    The patient's ``delays`` set the duration of each model, while the
+    model at ``fail`` (if any) fails.
+    """
+    lock = threading.Lock()
+    log = []
+    cores = [0, 0]
+
+    def run_model(self, idx):
+        cores = self.events.resources(idx).cores
+        with self.lock:
+            self.cores[0] += cores
+            self.cores[1] = max(self.cores)
+
+        time.sleep(self.get('delays', [0] * 3)[idx])
+        with self.lock:
+            self.cores[0] -= cores
+            self.log.append((self['id'], idx))
+        assert idx != self.get('fail'), "Patient event simulation failed."
+        if idx == self.get('error'):
+            raise FileNotFoundError('singularity')
+
+    def clean(self):
+        self['cleaned'] = True
+
+
+def create_patients(path, configs):
+    """Returns a recording patient for each config, resetting the records."""
+    RecordingPatient.log = []
+    RecordingPatient.cores = [0, 0]
+    return [
+        RecordingPatient(pathlib.Path(path),
+                         idx=i,
+                         config={'events': events.to_dict(), **config},
+                         runner=DummyRunner(write_config=True))
+        for i, config in enumerate(configs)
+    ]
+
+
+@pytest.mark.parametrize('jobs', [1, 2, 8])
+def test_scheduler_model_order(tmpdir, jobs):
+    cohort = create_patients(tmpdir, [{}] * 5)
+    results = dict(ModelScheduler(jobs).run(cohort))
+
+    assert results == {p.dir: True for p in cohort}
+    assert all(p.completed and p['cleaned'] for p in cohort)
+
+    # all models are evaluated once and in order within each patient
+    for patient in cohort:
+        idxs = [i for (p, i) in RecordingPatient.log if p == patient['id']]
+        assert idxs == [0, 1, 2]
+
+
+def test_scheduler_interleaves_patients(tmpdir):
+    # the first patient's first model is slow, the second patient's models
+    # are all evaluated while the first model of the first patient runs
+    configs = [{'delays': [0.5, 0, 0]}, {'delays': [0.01] * 3}]
+    cohort = create_patients(tmpdir, configs)
+    results = list(ModelScheduler(2).run(cohort))
+
+    assert [path for (path, _) in results] == [cohort[1].dir, cohort[0].dir]
+    assert RecordingPatient.log.index((1, 2)) < RecordingPatient.log.index(
+        (0, 0))
+
+
+def test_scheduler_failed_model(tmpdir):
+    cohort = create_patients(tmpdir, [{}, {'fail': 1}, {}])
+    results = dict(ModelScheduler(2).run(cohort))
+
+    assert results == {cohort[0].dir: True,
+                       cohort[1].dir: False,
+                       cohort[2].dir: True}
+
+    # the remaining models of the failed patient are not evaluated
+    assert (1, 2) not in RecordingPatient.log
+    assert not cohort[1].completed
+    assert all(p['cleaned'] for p in cohort)
+
+
+def test_scheduler_model_error(tmpdir):
+    # errors other than failed simulations only fail the patient as well
+    cohort = create_patients(tmpdir, [{}, {'error': 0}, {}])
+    results = dict(ModelScheduler(2).run(cohort))
+
+    assert results == {cohort[0].dir: True,
+                       cohort[1].dir: False,
+                       cohort[2].dir: True}
+    assert all(p['cleaned'] for p in cohort)
+
+
+def test_scheduler_empty_pipeline(tmpdir):
+    patient = Patient(tmpdir, runner=DummyRunner(write_config=True))
+    assert list(ModelScheduler(2).run([patient])) == [(patient.dir, True)]
+    assert patient.completed
+
+
+def test_scheduler_packs_cores(tmpdir):
+    # a pipeline with a large model, followed by two single core models
+    large = Events([{
+        'event': 'event',
+        'models': [{'label': 'a', 'resources': {'cores': 3}},
+                   {'label': 'b'}, {'label': 'c'}],
+    }]).to_dict()
+    configs = [{'events': large, 'delays': [0.02] * 3}] * 6
+    cohort = create_patients(tmpdir, configs)
+
+    results = dict(ModelScheduler(4).run(cohort))
+    assert all(results.values())
+    assert RecordingPatient.cores[1] == 4, "cores should be fully used"
+
+    # a model requiring more cores than available is evaluated on its own
+    RecordingPatient.cores = [0, 0]
+    results = dict(ModelScheduler(2).run(cohort))
+    assert all(results.values())
+    assert RecordingPatient.cores[1] == 3
@@ -0,0 +1,80 @@
+import pathlib
+
+from desist.isct.stats import format_csv, format_text, log_files, log_timings
+from desist.isct.stats import patient_timings, trial_stats
+from desist.isct.timing import Invocation
+
+from .test_utilities import default_patient
+
+
+def log_line(seconds, message):
+    return f'2021-11-03 07:32:{seconds:02},100 | root | INFO | {message}\n'
+
+
+def test_log_files(tmpdir):
+    assert log_files(tmpdir) == []
+    for name in ['isct.log', 'isct.log.2', 'isct.log.1', 'other.log']:
+        pathlib.Path(tmpdir, name).touch()
+
+    assert [path.name for path in log_files(tmpdir)] == \
+        ['isct.log.2', 'isct.log.1', 'isct.log']
+
+
+def test_log_timings(tmpdir):
+    patient = default_patient(tmpdir)
+    backup = patient.dir.joinpath('isct.log.1')
+    log = patient.dir.joinpath('isct.log')
+    backup.write_text(''.join([
+        log_line(0, 'singularity run c.sif /patient/p 0 event'),
+        log_line(5, 'model output'),
+    ]))
+    log.write_text(''.join([
+        'continued output without a timestamp\n',
+        log_line(9, 'docker run -v x:y tag /patient/p 1 event'),
+        log_line(10, 'Command: `x` failed with exit code: `2`.'),
+        log_line(12, 'chown -R user /patient'),
+    ]))
+
+    first, second = log_timings(log_files(patient.dir), patient)
+    assert first['model'] == 0
+    assert first['label'] == patient.events.label(0)
+    assert first['wall'] == 5
+    assert first['exit_code'] == 0
+    assert second['model'] == 1
+    assert second['wall'] == 3
+    assert second['exit_code'] == 2
+
+    # records are preferred over the logs
+    Invocation([patient], 2).finished(0)
+    record, = patient_timings(patient.dir)
+    assert record['model'] == 2
+    assert record['directory'] == patient.dir.name
+    assert record['cores'] == patient.events.resources(2).cores
+
+
+def test_trial_stats():
+    records = [
+        {'label': 'a', 'wall': 3600, 'exit_code': 0, 'cores': 2,
+         'directory': 'p0'},
+        {'label': 'a', 'wall': 1800, 'exit_code': 0, 'directory': 'p1'},
+        {'label': 'a', 'wall': 1800, 'exit_code': 1, 'directory': 'p1'},
+        {'label': 'b', 'wall': 10, 'exit_code': 0, 'directory': 'p2'},
+        {'label': 'c', 'wall': 3600, 'exit_code': 0, 'batch': 2,
+         'directory': 'p3'},
+        {'label': 'c', 'wall': 3600, 'exit_code': 0, 'batch': 2,
+         'directory': 'p4'},
+    ]
+    stats = trial_stats(records, top=2)
+    assert stats['models']['a']['count'] == 2
+    assert stats['models']['a']['max'] == 3600
+    assert stats['models']['a']['failures'] == 1
+    assert stats['models']['a']['core_hours'] == 3
+    assert stats['models']['c']['core_hours'] == 1
+    assert stats['failures'] == 1
+    assert stats['slowest'] == [{'patient': 'p0', 'wall': 3600},
+                                {'patient': 'p1', 'wall': 3600}]
+
+    header, *rows = format_csv(stats).splitlines()
+    assert header.startswith('model,count,failures')
+    assert [row.split(',')[0] for row in rows] == ['a', 'b', 'c']
+    assert 'Total core-hours: 4.00' in format_text(stats)
@@ -0,0 +1,192 @@
+import logging
+import pathlib
+import pytest
+
+from desist.isct.patient import Patient
+from desist.isct.runner import AsyncRunner, LocalRunner, Logger
+from desist.isct.timing import Invocation, format_timings, read_timings
+from desist.isct.timing import distribution, percentile
+from desist.isct.timing import resource_distributions
+from desist.isct.timing import timing_file
+from desist.isct.utilities import OS
+
+from .test_runner import DummyRunner
+from .test_utilities import default_config, default_patient
+
+
+class InvocationRunner(DummyRunner):
+    """Evaluates the invocations forwarded by the containers."""
+    def __init__(self, usage=None):
+        super().__init__()
+        self.usage = usage
+
+    def run(self, cmd, check=True, shell=False, invocation=None):
+        if invocation is not None:
+            invocation.started()
+            invocation.finished(0, usage=self.usage)
+        return super().run(cmd, check=check, shell=shell)
+
+
+@pytest.mark.parametrize('runner', [LocalRunner(), AsyncRunner(jobs=2)])
+def test_invocation_records(tmpdir, runner):
+    patient = default_patient(tmpdir)
+    invocations = [Invocation([patient], 0), Invocation([patient], 2)]
+    assert invocations[0].exit_code is None
+    assert runner.run(['true'], invocation=invocations[0])
+    assert not runner.run(['false'], invocation=invocations[1])
+    assert [i.exit_code for i in invocations] == [0, 1]
+
+    first, second = read_timings(patient.dir)
+    assert first['patient'] == 3
+    assert first['event'] == patient.events.event(0)['event']
+    assert first['label'] == patient.events.label(0)
+    assert (first['model'], second['model']) == (0, 2)
+    assert (first['exit_code'], second['exit_code']) == (0, 1)
+    assert first['queued'] <= first['start'] <= first['end']
+    assert first['wall'] >= 0
+
+    # the resource usage is only known for processes reaped by the runner
+    assert ('max_rss' in first) == (not isinstance(runner, AsyncRunner))
+
+
+@pytest.mark.parametrize('runner', [LocalRunner(), AsyncRunner(jobs=2)])
+def test_invocation_prefix(caplog, tmpdir, runner):
+    patient = default_patient(tmpdir)
+    with caplog.at_level(logging.INFO):
+        runner.run(['echo', 'hello'], invocation=Invocation([patient], 0))
+        runner.run(['echo', 'batch'],
+                   invocation=Invocation([patient, patient], 0))
+        runner.run(['echo', 'other'])
+
+    # the output of the models is prefixed by the patient's directory
+    name = patient.dir.name
+    assert f'[{name}] hello' in caplog.messages
+    assert f'[{name} +1] batch' in caplog.messages
+    assert 'other' in caplog.messages
+
+
+@pytest.mark.parametrize('variable', ['PARALLEL_JOBSLOT', 'QCG_PM_CPU_SET'])
+def test_invocation_scheduler_slot(monkeypatch, tmpdir, variable):
+    for name in ('PARALLEL_JOBSLOT', 'QCG_PM_CPU_SET'):
+        monkeypatch.delenv(name, raising=False)
+    patient = default_patient(tmpdir)
+    LocalRunner().run(['true'], invocation=Invocation([patient], 0))
+    monkeypatch.setenv(variable, '3')
+    LocalRunner().run(['true'], invocation=Invocation([patient], 1))
+
+    first, second = read_timings(patient.dir)
+    assert 'slot' not in first
+    assert second['slot'] == '3'
+
+
+def test_invocation_without_evaluation(tmpdir):
+    patient = default_patient(tmpdir)
+    # runners that do not evaluate the commands do not record them
+    Logger().run(['true'], invocation=Invocation([patient], 0))
+    assert not patient.dir.joinpath(timing_file).exists()
+
+
+def test_read_timings(tmpdir):
+    patient = default_patient(tmpdir)
+    invocation = Invocation([patient], 1)
+    invocation.finished(0)
+    with open(patient.dir.joinpath(timing_file), 'a') as outfile:
+        outfile.write('{"patient": \n[]\n')
+    invocation.finished(3)
+
+    records = list(read_timings(patient.dir.joinpath(timing_file)))
+    assert len(records) == 2
+
+    header, *lines = format_timings(records).splitlines()
+    assert 'Elapsed' in header
+    assert len(lines) == 2
+    assert lines[0].startswith(f'3\t{records[0]["event"]}\t')
+    assert lines[-1].endswith('\t3')
+
+
+def test_patient_invocations(mocker, tmpdir):
+    patient = default_patient(tmpdir)
+    mocker.patch('desist.isct.utilities.OS.from_platform',
+                 return_value=OS.MACOS)
+    patient.runner = InvocationRunner()
+    patient.run(models=[0, 1])
+
+    # each model's container invocation is recorded
+    models = [record['model'] for record in read_timings(patient.dir)]
+    assert models == [0, 1]
+
+
+def test_docker_invocations_usage(mocker, tmpdir):
+    patient = default_patient(tmpdir)
+    mocker.patch('desist.isct.utilities.OS.from_platform',
+                 return_value=OS.MACOS)
+    patient.runner = InvocationRunner(usage={'cpu_user': 1.0})
+    patient.run(models=[0])
+
+    # the usage of the `docker` client is not the usage of the container
+    record, = read_timings(patient.dir)
+    assert 'cpu_user' not in record
+
+    # while the usage of containers reaped by the runner is recorded
+    invocation = Invocation([patient], 1)
+    patient.runner.run(['true'], invocation=invocation)
+    assert list(read_timings(patient.dir))[-1]['cpu_user'] == 1.0
+
+
+def test_batch_invocation_usage(tmpdir):
+    patients = [Patient(pathlib.Path(tmpdir), idx=i, config=default_config)
+                for i in range(2)]
+    for patient in patients:
+        patient.write()
+    Invocation(patients, 0).finished(0, usage={'cpu_user': 2.0})
+
+    # each patient records the batch, which is counted once
+    records = [r for p in patients for r in read_timings(p.dir)]
+    assert [record['batch'] for record in records] == [2, 2]
+    report = resource_distributions(records)
+    assert report[patients[0].events.label(0)]['cpu']['count'] == 1
+
+
+def test_wait_usage(tmpdir):
+    patient = default_patient(tmpdir)
+    cmd = ['python3', '-c', 'x = bytearray(64 * 2**20)']
+    assert LocalRunner().run(cmd, invocation=Invocation([patient], 0))
+
+    record, = read_timings(patient.dir)
+    assert record['max_rss'] >= 64
+    assert record['cpu_user'] + record['cpu_system'] > 0
+
+
+def test_distribution():
+    assert percentile([1, 2, 3, 4], 50) == 2
+    assert percentile([1, 2, 3, 4], 95) == 4
+    assert percentile([1], 95) == 1
+    assert distribution([]) == {'count': 0}
+
+    stats = distribution(range(1, 101))
+    assert stats == {'count': 100, 'mean': 50.5, 'median': 50, 'p95': 95,
+                     'max': 100}
+
+
+def test_resource_distributions():
+    records = [
+        {'label': 'a', 'exit_code': 0, 'wall': 2, 'cpu_user': 1,
+         'cpu_system': 1, 'write_bytes': 2**20},
+        {'label': 'a', 'exit_code': 0, 'wall': 4},
+        {'label': 'a', 'exit_code': 1, 'wall': 100},
+        {'label': 'b', 'exit_code': 0, 'wall': 1},
+    ]
+
+    # the records of a batched invocation are counted once
+    batch = {'label': 'c', 'exit_code': 0, 'wall': 8, 'batch': 2, 'pid': 1,
+             'start': 0}
+    records += [{**batch, 'patient': 0}, {**batch, 'patient': 1}]
+
+    report = resource_distributions(records)
+    assert sorted(report) == ['a', 'b', 'c']
+    assert report['c']['wall']['count'] == 1
+    assert report['a']['wall']['mean'] == 3
+    assert report['a']['cpu']['count'] == 1
+    assert report['a']['cpu']['max'] == 2
+    assert report['a']['write_bytes']['max'] == 1
+    assert 'cpu' not in report['b']
@@ -0,0 +1,70 @@
+import io
+import json
+
+from desist.isct.trace import assign_slots, invocations, trace_events
+from desist.isct.trace import write_trace
+
+
+def record(patient, start, end, pid=1, queued=None, label='model',
+           slot=None):
+    return {'patient': patient, 'label': label, 'model': 0, 'host': 'node',
+            'pid': pid, 'queued': queued or start, 'start': start,
+            'end': end, 'wall': end - start, 'exit_code': 0,
+            **({'slot': slot} if slot is not None else {})}
+
+
+def test_invocations():
+    # batched invocations are merged, records without times are ignored
+    records = [record(0, 5, 6), record(1, 1, 3), record(2, 1, 3),
+               {'patient': 3, 'wall': 1}]
+    first, second = invocations(records)
+    assert first['patients'] == [1, 2]
+    assert second['patients'] == [0]
+
+
+def test_assign_slots():
+    calls = invocations([record(0, 0, 2), record(1, 1, 3), record(2, 2, 4),
+                         record(3, 0, 9, pid=2)])
+    assert assign_slots(calls) == [0, 0, 1, 0]
+
+
+def test_trace_events_job_slots():
+    # each command runs in a new process, the tracks follow the job slots
+    records = [record(0, 0, 2, pid=10, slot=1),
+               record(1, 0, 3, pid=11, slot=2),
+               record(2, 2, 4, pid=12, slot=1), record(3, 3, 5, pid=13)]
+    events = trace_events(records)
+
+    slices = [e for e in events if e['ph'] == 'X']
+    assert slices[0]['tid'] == slices[2]['tid'] != slices[1]['tid']
+    threads = [e['args']['name'] for e in events
+               if e['name'] == 'thread_name']
+    assert threads == ['job slot 1', 'job slot 2', 'worker 13']
+
+
+def test_trace_events():
+    records = [record(0, 10, 12, queued=9), record(1, 11, 13, queued=9),
+               record(2, 11, 12, pid=2, label='other')]
+    events = trace_events(records)
+    assert trace_events([]) == []
+
+    slices = [e for e in events if e['ph'] == 'X']
+    assert [e['name'] for e in slices] == ['model', 'other', 'model']
+    assert slices[0]['ts'] == 1e6 and slices[0]['dur'] == 2e6
+    assert slices[0]['args']['queued (s)'] == 1
+    assert len({e['tid'] for e in slices}) == 3
+    assert len({e['pid'] for e in slices}) == 1
+
+    threads = [e['args']['name'] for e in events
+               if e['name'] == 'thread_name']
+    assert threads == ['worker 1', 'worker 2', 'worker 1 slot 1']
+
+    running = [(e['ts'] / 1e6, e['args']['running']) for e in events
+               if e['name'] == 'running']
+    assert running == [(1, 1), (2, 3), (3, 1), (4, 0)]
+    queued = [e['args']['queued'] for e in events if e['name'] == 'queued']
+    assert queued == [2, 1, 0]
+
+    output = io.StringIO()
+    write_trace(output, records)
+    assert json.loads(output.getvalue())['traceEvents'] == events
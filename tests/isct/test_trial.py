@@ -1,11 +1,19 @@
 import os
+import subprocess
 import pathlib
 import pytest
 
 from desist.isct.trial import Trial, ParallelTrial, trial_config, QCGTrial
+from desist.isct.trial import PoolTrial, ModelTrial
+from desist.isct.history import RuntimeHistory
+from desist.isct.index import index_dir
+from desist.isct.cache import Fingerprinter, ResultCache
+from desist.isct.trial import find_trial_config
 from desist.isct.patient import Patient, LowStoragePatient
-from desist.isct.runner import Logger
-from desist.isct.utilities import OS, CleanFiles
+from desist.isct.patient import find_patient_config
+from desist.isct.runner import Logger, PoolRunner
+from desist.isct.utilities import OS, CleanFiles, status_file
+import desist.isct.utilities as utilities
 
 from .test_runner import DummyRunner
 from .test_utilities import default_events
@@ -232,3 +240,456 @@ def test_trial_extract_patient_configuration(tmpdir):
 
     for key in unrequired_keys:
         assert key not in trial.patient_related_configuration()
+
+
+@pytest.mark.parametrize('clean_files', [CleanFiles.NONE, CleanFiles.LARGE])
+def test_trial_iter_parses_patients_once(mocker, tmpdir, clean_files):
+    sample_size = 5
+    trial = Trial(tmpdir, sample_size, runner=Logger(),
+                  clean_files=clean_files).create()
+    trial.container_path = 'containers'
+
+    spy = mocker.spy(utilities, 'read_config')
+    patients = list(trial)
+    assert spy.call_count == sample_size, "expected one parse per patient"
+
+    # the trial's container path is propagated into all patient types
+    assert all(p['container-path'] == 'containers' for p in patients)
+
+
+@pytest.mark.parametrize('prefetch', [0, 1, 8])
+def test_trial_prefetch(tmpdir, prefetch):
+    sample_size = 10
+    config = {'prefetch': prefetch}
+    trial = Trial(tmpdir, sample_size, runner=Logger(), config=config)
+    trial.create()
+
+    trial = Trial.read(trial.path)
+    assert trial.prefetch == prefetch
+    patients = [p.dir.name for p in trial]
+    assert patients == [f'patient_{i:05}' for i in range(sample_size)]
+
+
+@pytest.mark.parametrize('config_format', ['yaml', 'json'])
+def test_trial_config_format(tmpdir, config_format):
+    sample_size = 3
+    config = {'config-format': config_format}
+    trial = Trial(tmpdir, sample_size, runner=Logger(), config=config)
+    trial.create()
+
+    suffix = '.yml' if config_format == 'yaml' else '.json'
+    trial.append_patient(sample_size)
+    patients = list(Trial.read(find_trial_config(tmpdir)))
+    assert len(patients) == sample_size + 1
+    for patient in patients:
+        assert patient.path.name == f'patient{suffix}'
+        assert find_patient_config(patient.dir) == patient.path
+
+
+def test_trial_read_json_config(tmpdir):
+    trial = Trial(tmpdir, 2, runner=Logger())
+    trial.path = trial.path.with_suffix('.json')
+    trial.create()
+
+    path = find_trial_config(tmpdir)
+    assert path.name == 'trial.json'
+    trial = Trial.read(path)
+    assert trial.path == path
+    assert len(trial) == 2
+
+
+class ResourceRunner(DummyRunner):
+    """Captures the jobs as submitted to the `QCGRunner`."""
+    def __init__(self):
+        super().__init__()
+        self.jobs = []
+
+    def run(self, cmd, resources=None, name=None, after=None):
+        self.jobs.append({'cmd': cmd, 'resources': resources, 'name': name,
+                          'after': after})
+        return super().run(cmd)
+
+    def run_iterations(self, script, iterations, resources=None, name=None):
+        self.jobs.append({'script': script, 'iterations': iterations,
+                          'resources': resources, 'name': name})
+
+
+def docker_run_fails_for_second_patient(self, args=''):
+    """Mocks `Docker.run` to fail for `patient_00001` only."""
+    return not any('patient_00001' in str(host)
+                   for (host, _) in self.bind_volumes)
+
+
+@pytest.mark.parametrize('clean_files', [CleanFiles.NONE, CleanFiles.LARGE])
+def test_pool_trial_run(mocker, tmpdir, clean_files):
+    mocker.patch('desist.isct.utilities.OS.from_platform',
+                 return_value=OS.MACOS)
+    mocker.patch('desist.isct.docker.Docker.run',
+                 docker_run_fails_for_second_patient)
+
+    sample_size = 4
+    config = {'events': default_events.to_dict()}
+    Trial(tmpdir, sample_size, runner=Logger(), config=config).create()
+
+    trial = PoolTrial.read(find_trial_config(tmpdir),
+                           runner=PoolRunner(2),
+                           clean_files=clean_files)
+    results = trial.run()
+    assert len(results) == sample_size
+    for path, success in results.items():
+        assert success == (path.name != 'patient_00001')
+
+    # the workers update the patient configurations of successful patients
+    completed = {p.dir.name: p.completed for p in trial}
+    assert completed == {p.name: success for p, success in results.items()}
+
+    # completed patients are skipped
+    results = trial.run(skip_completed=True)
+    assert [p.name for p in results] == ['patient_00001']
+
+
+@pytest.mark.parametrize('trial_cls', [Trial, PoolTrial, ModelTrial])
+def test_trial_run_resume(mocker, tmpdir, trial_cls):
+    mocker.patch('desist.isct.utilities.OS.from_platform',
+                 return_value=OS.MACOS)
+    run = mocker.patch('desist.isct.docker.Docker.run',
+                       docker_run_fails_for_second_patient)
+
+    sample_size = 3
+    config = {'events': default_events.to_dict()}
+    Trial(tmpdir, sample_size, runner=Logger(), config=config).create()
+
+    runner = DummyRunner(write_config=True)
+    trial = trial_cls.read(find_trial_config(tmpdir), runner=runner)
+    if trial_cls == Trial:
+        # the sequential trial stops at the failing patient
+        with pytest.raises(AssertionError):
+            trial.run()
+    else:
+        trial.run()
+
+    failed = [p for p in trial if not p.completed]
+    assert failed[0].dir.name == 'patient_00001'
+    assert failed[0].first_incomplete_model() == 0
+
+    # a model after the first model failed: resume at the failed model
+    failed[0].record_model(0, True)
+    run = mocker.patch('desist.isct.docker.Docker.run', return_value=True)
+    trial.run(skip_completed=True)
+    models = len(list(default_events.models))
+    assert run.call_count == models * len(failed) - 1
+    assert all(patient.completed for patient in trial)
+
+
+def test_parallel_trial_skip_completed(tmpdir):
+    runner = DummyRunner()
+    trial = ParallelTrial(tmpdir, 2, runner=runner)
+    trial.create()
+    trial.run()
+    assert '--skip-completed' not in runner
+
+    trial.run(skip_completed=True)
+    assert '--skip-completed' in runner
+
+
+def test_parallel_trial_cache(tmpdir):
+    runner = DummyRunner()
+    runner.cache = ResultCache(tmpdir, max_size=1024, link=True)
+    trial = ParallelTrial(tmpdir, 1, runner=runner)
+    trial.create()
+    trial.run()
+    assert f'--cache {runner.cache.root}' in runner
+    assert '--cache-size 1024MB --cache-link' in runner
+
+    # incremental evaluations are forwarded
+    runner.clear()
+    runner.cache = Fingerprinter()
+    trial.incremental = True
+    trial.run()
+    assert '--incremental' in runner
+    assert '--cache' not in runner
+
+
+def test_trial_order_longest_first(tmpdir):
+    runner = DummyRunner()
+    config = {'events': default_events.to_dict()}
+    trial = ParallelTrial(tmpdir, 3, runner=runner, config=config)
+    trial.create()
+
+    # the runtime of the models is proportional to the patients' size
+    for size, patient in zip([1, 3, 2], trial):
+        patient['size'] = size
+        patient.write()
+        for idx in range(patient['pipeline_length']):
+            RuntimeHistory.record(patient, idx, duration=size)
+
+    def order():
+        runner.clear()
+        trial.run()
+        return [cmd[-1][-5:] for cmd in runner.output]
+
+    assert order() == ['00000', '00001', '00002']
+
+    # without regression, the expected runtimes are equal
+    trial.order = 'longest-first'
+    assert order() == ['00000', '00001', '00002']
+
+    trial.runtime_keys = ['size']
+    assert order() == ['00001', '00002', '00000']
+
+    with pytest.raises(ValueError):
+        trial.order = 'shortest-first'
+
+
+def test_model_trial_run(mocker, tmpdir):
+    sample_size = 3
+    config = {'events': default_events.to_dict()}
+    Trial(tmpdir, sample_size, runner=Logger(), config=config).create()
+
+    runner = DummyRunner(write_config=True)
+    trial = ModelTrial.read(find_trial_config(tmpdir), runner=runner)
+    trial.jobs = 2
+    close = mocker.spy(runner, 'close')
+
+    results = trial.run()
+    close.assert_called_once()
+    assert sorted(results) == sorted(trial.patients)
+    assert all(results.values())
+    assert all(patient.completed for patient in trial)
+
+    # each model is evaluated once for each patient
+    models = len(list(default_events.models))
+    runs = [cmd for cmd in runner.output if 'run' in cmd]
+    assert len(runs) == sample_size * models
+
+
+@pytest.mark.parametrize('trial_cls', [Trial, PoolTrial])
+def test_trial_run_batch(mocker, tmpdir, trial_cls):
+    mocker.patch('desist.isct.utilities.OS.from_platform',
+                 return_value=OS.LINUX)
+
+    sample_size = 5
+    events = default_events.to_dict()
+    events[0]['models'][0]['batch'] = 2
+    Trial(tmpdir, sample_size, runner=Logger(), config={
+        'events': events
+    }).create()
+
+    runner = DummyRunner(write_config=True)
+    trial = trial_cls.read(find_trial_config(tmpdir), runner=runner)
+    assert trial.batch_size == 2
+    trial.run()
+    assert all(patient.completed for patient in trial)
+
+    # the batched model is invoked once per batch of (at most) two patients,
+    # the remaining models are invoked for each patient individually
+    models = len(list(default_events.models))
+    runs = [' '.join(cmd) for cmd in runner.output if 'run' in cmd]
+    batched = [cmd for cmd in runs if '--patient' in cmd]
+    assert len(batched) == 2
+    assert all(cmd.count('--patient') == 1 for cmd in batched)
+    assert all('/trial' in cmd for cmd in batched)
+    assert len(runs) == 3 + sample_size * (models - 1)
+
+
+def docker_run_fails_for_batch(self, args=''):
+    """Mocks `Docker.run` to fail for invocations including `patient_00001`."""
+    return 'patient_00001' not in args and \
+        docker_run_fails_for_second_patient(self, args)
+
+
+def test_pool_trial_run_batch_fails(mocker, tmpdir):
+    mocker.patch('desist.isct.utilities.OS.from_platform',
+                 return_value=OS.MACOS)
+    mocker.patch('desist.isct.docker.Docker.run', docker_run_fails_for_batch)
+
+    events = default_events.to_dict()
+    events[0]['models'][0]['batch'] = 2
+    Trial(tmpdir, 4, runner=Logger(), config={'events': events}).create()
+
+    trial = PoolTrial.read(find_trial_config(tmpdir), runner=PoolRunner(2))
+    results = trial.run()
+
+    # without the exit code of each patient, the batch including the failing
+    # patient fails as a whole
+    failed = {'patient_00000', 'patient_00001'}
+    assert {p.name: s for p, s in results.items()} == {
+        p.dir.name: p.dir.name not in failed for p in trial}
+    assert {p.dir.name for p in trial if not p.completed} == failed
+
+
+def docker_run_writes_status(self, args=''):
+    """Mocks `Docker.run` with the event handler failing `patient_00001`."""
+    if '--patient' not in args:
+        return True
+
+    trial = next(host for (host, local) in self.bind_volumes
+                 if str(local) == '/trial')
+    patients = [arg for arg in args.split() if arg.endswith('patient.yml')]
+    for path in patients:
+        directory = pathlib.Path(trial, *pathlib.Path(path).parts[2:-1])
+        exit_code = int(directory.name == 'patient_00001')
+        directory.joinpath(status_file).write_text(f'{exit_code}\n')
+    return not any('patient_00001' in path for path in patients)
+
+
+def test_pool_trial_run_batch_fails_per_patient(mocker, tmpdir):
+    mocker.patch('desist.isct.utilities.OS.from_platform',
+                 return_value=OS.MACOS)
+    mocker.patch('desist.isct.docker.Docker.run', docker_run_writes_status)
+
+    events = default_events.to_dict()
+    events[0]['models'][0]['batch'] = 2
+    Trial(tmpdir, 4, runner=Logger(), config={'events': events}).create()
+
+    trial = PoolTrial.read(find_trial_config(tmpdir), runner=PoolRunner(2))
+    results = trial.run()
+
+    # only the failing patient of the batch fails
+    assert {p.name: s for p, s in results.items()} == {
+        p.dir.name: p.dir.name != 'patient_00001' for p in trial}
+    assert {p.dir.name for p in trial if not p.completed} == {'patient_00001'}
+
+    # the exit codes are removed once recorded
+    assert not any(p.dir.joinpath(status_file).exists() for p in trial)
+    statuses = [p.model_status[0]['status'] for p in trial]
+    assert statuses == ['completed', 'failed', 'completed', 'completed']
+    assert [p.model_status[0]['exit_code'] for p in trial] == [0, 1, 0, 0]
+
+
+def docker_run_raises_for_second_patient(self, args=''):
+    """Mocks `Docker.run` to raise for `patient_00001`, e.g. no `docker`."""
+    if not docker_run_fails_for_batch(self, args):
+        raise FileNotFoundError('docker')
+    return True
+
+
+@pytest.mark.parametrize('batch', [1, 2])
+def test_pool_trial_run_errors(mocker, tmpdir, batch):
+    mocker.patch('desist.isct.utilities.OS.from_platform',
+                 return_value=OS.MACOS)
+    events = default_events.to_dict()
+    events[0]['models'][0]['batch'] = batch
+    Trial(tmpdir, 4, runner=Logger(), config={'events': events}).create()
+    mocker.patch('desist.isct.docker.Docker.run',
+                 docker_run_raises_for_second_patient)
+
+    # the error only fails the affected patient rather than the whole trial
+    trial = PoolTrial.read(find_trial_config(tmpdir), runner=PoolRunner(2))
+    results = trial.run()
+    failed = {'patient_00001'} if batch == 1 else {'patient_00000',
+                                                   'patient_00001'}
+    assert {p.name: s for p, s in results.items()} == {
+        p.dir.name: p.dir.name not in failed for p in trial}
+
+
+def test_qcg_trial_resources(mocker, tmpdir):
+    mocker.patch('desist.isct.trial.QCGRunner', ResourceRunner)
+
+    events = default_events.to_dict()
+    events[0]['models'][0]['resources'] = {'cores': 4, 'walltime': 60}
+    config = {'events': events}
+    Trial(tmpdir, 2, runner=Logger(), config=config).create()
+
+    runner = ResourceRunner()
+    trial = QCGTrial.read(find_trial_config(tmpdir), runner=runner)
+    trial.chunk_size = 1
+    trial.run()
+    assert len(runner.jobs) == 2
+    assert all(job['resources'].cores == 4 for job in runner.jobs)
+
+
+@pytest.mark.parametrize('chunk_size', [2, 3, 10])
+def test_qcg_trial_chunks(mocker, tmpdir, chunk_size):
+    mocker.patch('desist.isct.trial.QCGRunner', ResourceRunner)
+
+    sample_size = 7
+    events = default_events.to_dict()
+    events[0]['models'][0]['resources'] = {'cores': 4}
+    Trial(tmpdir, sample_size, runner=Logger(), config={
+        'events': events
+    }).create()
+
+    runner = ResourceRunner()
+    trial = QCGTrial.read(find_trial_config(tmpdir), runner=runner)
+    trial.chunk_size = chunk_size
+    trial.run()
+
+    # a single iterative job is submitted per chunk of patients
+    chunks = -(-sample_size // chunk_size)
+    assert len(runner.jobs) == chunks
+    assert [job['iterations'] for job in runner.jobs] == [
+        min(chunk_size, sample_size - i * chunk_size) for i in range(chunks)]
+    assert all(job['resources'].cores == 4 for job in runner.jobs)
+    assert len({job['name'] for job in runner.jobs}) == chunks
+
+    # the task lists hold the patient directories in order
+    patients = []
+    for i, job in enumerate(runner.jobs):
+        tasks = trial.dir.joinpath(index_dir, f'qcg-tasks-{i:05}')
+        assert str(tasks) in job['script']
+        assert '${it}' in job['script']
+        patients += tasks.read_text().splitlines()
+    assert patients == [str(p) for p in sorted(trial.patients)]
+
+
+def test_qcg_trial_chunks_quoted(mocker, tmpdir):
+    mocker.patch('desist.isct.trial.QCGRunner', ResourceRunner)
+
+    # the paths of the trial and its containers hold whitespace
+    path = pathlib.Path(tmpdir).joinpath('in silico trial')
+    containers = pathlib.Path(tmpdir).joinpath('some containers')
+    containers.mkdir()
+    Trial(path, 2, runner=Logger(), config={
+        'events': default_events.to_dict()
+    }).create()
+
+    runner = ResourceRunner()
+    trial = QCGTrial.read(find_trial_config(path), runner=runner)
+    trial.chunk_size = 2
+    trial.container_path = containers
+    trial.run()
+    assert len(runner.jobs) == 1
+
+    # evaluate each iteration with `desist` printing its arguments
+    script = runner.jobs[0]['script']
+    for it, patient in enumerate(sorted(trial.patients)):
+        stub = 'desist() { printf "%s\\n" "$@"; }'
+        result = subprocess.run(['bash', '-c', f'{stub}; {script}'],
+                                env={**os.environ, 'it': str(it)},
+                                capture_output=True, text=True, check=True)
+        args = result.stdout.splitlines()
+        assert args == trial.command(patient)[1:]
+        assert str(containers) in args
+
+
+def test_qcg_trial_per_model(mocker, tmpdir):
+    mocker.patch('desist.isct.trial.QCGRunner', ResourceRunner)
+
+    events = default_events.to_dict()
+    events[0]['models'][0]['resources'] = {'cores': 4}
+    config = {'events': events}
+    Trial(tmpdir, 2, runner=Logger(), config=config).create()
+
+    runner = ResourceRunner()
+    trial = QCGTrial.read(find_trial_config(tmpdir), runner=runner)
+    trial.per_model = True
+    trial.run()
+
+    models = len(list(default_events.models))
+    assert len(runner.jobs) == 2 * models
+
+    for patient in trial.patients:
+        jobs = [job for job in runner.jobs
+                if job['name'].startswith(patient.name)]
+        assert [job['name'] for job in jobs] == [
+            f'{patient.name}-{idx}' for idx in range(models)]
+
+        # each model depends on its predecessor and has its own resources
+        assert jobs[0]['after'] is None
+        assert all(job['after'] == [previous['name']]
+                   for previous, job in zip(jobs, jobs[1:]))
+        assert [job['resources'].cores for job in jobs] == [4] + [1] * (
+            models - 1)
+        assert all(job['cmd'][-3:] == ['--model', str(idx), str(patient)]
+                   for idx, job in enumerate(jobs))
@@ -1,13 +1,18 @@
+import datetime
+import gzip
 import os
 import pathlib
 import pytest
+import yaml
 
 from desist.isct.utilities import OS, MAX_FILE_SIZE
 from desist.isct.utilities import CleanFiles, FileCleaner
 from desist.isct.utilities import is_bind_path
-from desist.isct.utilities import extract_simulation_times
+from desist.isct.utilities import extract_simulation_times, parse_log_time
+from desist.isct.utilities import read_yaml, write_yaml, prefetch
 from desist.isct.events import Event, Events
 from desist.isct.config import Config
+from desist.isct.patient import Patient
 
 
 baseline_event = Event({
@@ -67,6 +72,13 @@ def default_criteria_file(path):
     return str(config.path)
 
 
+def default_patient(path, idx=3):
+    """Helper routine to write a patient with the default configuration."""
+    patient = Patient(pathlib.Path(path), idx=idx, config=default_config)
+    patient.write()
+    return patient
+
+
 def create_dummy_file(path, filesize):
     """Helper routine to create a dummy file with desired size."""
     with open(path, "wb") as outfile:
@@ -96,6 +108,9 @@ def test_file_cleaner_initialisation():
                                                 ('remains.yml', +10, True),
                                                 ('remains.yaml', +10, True),
                                                 ('config.xml', +10, True),
+                                                ('patient.json', +10, True),
+                                                ('patient.msgpack', +10, True),
+                                                ('timings.jsonl', +10, True),
                                                 ('anyother.xml', +10, False)])
 def test_file_cleaner_clean_files(tmpdir, mode, fn, delta, remains):
     path = pathlib.Path(tmpdir)
@@ -147,6 +162,80 @@ def test_is_bind_path(tmpdir, path, expected):
     assert not is_bind_path(path), "Should always fail if the file is exists"
 
 
+yaml_test_configs = [
+    default_config,
+    {
+        'container-path': None,
+        'prefix': 'patient',
+        'random_seed': 1,
+        'sample_size': 50000,
+        **default_config,
+    },
+    {
+        'id': 12,
+        'prefix': 'patient',
+        'completed': False,
+        'pipeline_length': 11,
+        'age': 63.25,
+        'sex': 'female',
+        'NIHSS': 14,
+        'occlusion': ['M1', 'ICA'],
+        'onset': '2021-11-03 07:18:51',
+        'note': 'A long description ' * 10,
+        'unicode': 'Ørsted – µm',
+        'empty': {},
+        'nested': {'a': [1, 2.5e-08, None, True], 'b': {'c': '010'}},
+        **default_config,
+    },
+]
+
+
+@pytest.mark.skipif(not yaml.__with_libyaml__, reason="requires libyaml")
+@pytest.mark.parametrize('config', yaml_test_configs)
+def test_yaml_libyaml_parity(tmpdir, config):
+    """Ensure the libyaml and Python YAML paths are interchangeable."""
+    python = yaml.dump(config, Dumper=yaml.SafeDumper)
+    libyaml = yaml.dump(config, Dumper=yaml.CSafeDumper)
+    assert python == libyaml
+
+    for dumped in (python, libyaml):
+        assert yaml.load(dumped, Loader=yaml.SafeLoader) == config
+        assert yaml.load(dumped, Loader=yaml.CSafeLoader) == config
+
+    # the files written by `write_yaml` match `yaml.safe_dump` exactly
+    path = pathlib.Path(tmpdir).joinpath('config.yml')
+    write_yaml(path, config)
+    assert path.read_text() == yaml.safe_dump(config)
+    assert read_yaml(path) == config
+
+
+@pytest.mark.parametrize('depth', [0, 1, 4, 16])
+def test_prefetch(depth):
+    items = list(range(10))
+    assert list(prefetch(lambda x: x * x, items, depth)) == [
+        x * x for x in items
+    ]
+
+    # stopping early does not evaluate all items
+    evaluated = []
+    generator = prefetch(evaluated.append, iter(items), depth)
+    next(generator)
+    generator.close()
+    assert len(evaluated) <= 1 + max(depth, 0) + 1
+
+
+def test_prefetch_raises():
+    def fail(x):
+        if x == 3:
+            raise ValueError(x)
+        return x
+
+    generator = prefetch(fail, range(5), 2)
+    assert [next(generator) for _ in range(3)] == [0, 1, 2]
+    with pytest.raises(ValueError):
+        next(generator)
+
+
 timing_test_log = """2021-11-03 07:18:51,274 singularity run
 2021-11-03 07:28:16,458 singularity run
 2021-11-03 07:28:16,776 singularity run
@@ -161,7 +250,38 @@ def test_extract_simulation_times(tmpdir):
     logfile = pathlib.Path(tmpdir).joinpath('test.log')
     logfile.write_text(timing_test_log)
 
-    timings = extract_simulation_times(logfile).splitlines()
+    timings = list(extract_simulation_times(logfile))
     assert len(timings) == len(timing_test_log.splitlines())
     assert "2021-11-03 07:18:51" in timings[0] and "Elapsed" in timings[0]
     assert "2021-11-03 07:36:15" in timings[-1] and "0:03:18" in timings[-1]
+
+    # compressed logs are decompressed while streaming
+    compressed = logfile.with_suffix('.log.gz')
+    with gzip.open(compressed, 'wt') as outfile:
+        outfile.write(timing_test_log)
+    assert list(extract_simulation_times(compressed)) == timings
+
+    # warm containers are evaluated through `docker exec` after their start
+    logfile.write_text(
+        '2021-11-03 07:18:51,274 docker run -d --rm --name warm image\n'
+        '2021-11-03 07:18:52,274 docker exec warm /bin/sh -c\n'
+        '2021-11-03 07:18:55,274 docker exec warm /bin/sh -c\n'
+        '2021-11-03 07:19:00,274 docker rm -f warm\n'
+        '2021-11-03 07:19:01,274 docker exec warm /bin/sh -c\n')
+    timings = list(extract_simulation_times(logfile))
+    assert len(timings) == 3
+    assert "2021-11-03 07:18:52" in timings[0]
+    assert "0:00:03" in timings[1] and "0:00:06" in timings[2]
+
+    # logs without any invocations yield no times
+    logfile.write_text('2021-11-03 07:18:51,274 no containers\n')
+    assert list(extract_simulation_times(logfile)) == []
+
+
+def test_parse_log_time():
+    moment = datetime.datetime(2021, 11, 3, 7, 32, 10, 684000)
+    assert parse_log_time('2021-11-03 07:32:10,684 | root | INFO') == moment
+    assert parse_log_time('2021-11-03 07:32:10 | root') == \
+        moment.replace(microsecond=0)
+    assert parse_log_time('output of the container') is None
+    assert parse_log_time('') is None